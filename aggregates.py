@@ -0,0 +1,226 @@
+from bisect import bisect_left, insort
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import threading
+import time
+
+from startup import optional_module
+
+# NumPy is optional (rebuild() falls back to pure Python) and only imported
+# by the first rebuild that uses it
+np = optional_module("numpy")
+
+class CourseStats:
+    """Running count/sum of one course's grades plus a sorted copy for min/max."""
+
+    __slots__ = ("count", "total", "grades")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.grades: List[float] = []
+
+    def add(self, grade: float) -> None:
+        self.count += 1
+        self.total += grade
+        insort(self.grades, grade)
+
+    def remove(self, grade: float) -> None:
+        self.count -= 1
+        self.total -= grade
+        del self.grades[bisect_left(self.grades, grade)]
+
+    def as_dict(self, course: str) -> Dict[str, Any]:
+        return {
+            "course": course,
+            "count": self.count,
+            "mean": self.total / self.count,
+            "min": self.grades[0],
+            "max": self.grades[-1],
+        }
+
+class GradeAggregates:
+    """Per-student average grade and per-course mean/min/max/count.
+
+    add/remove keep everything current on each academic write, so reading
+    the stats for one course or one student is O(1). Writes arrive on the
+    event loop while the stats endpoints read from the threadpool, so both
+    go through a lock and readers get a snapshot.
+    """
+
+    def __init__(self):
+        self.courses: Dict[str, CourseStats] = {}
+        # student_id -> (number of grades, sum of grades)
+        self.students: Dict[str, Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+        # Writes made since snapshot() while a rebuild runs, replayed onto its result
+        self._pending: Optional[List[Tuple[str, str, Any]]] = None
+
+    def add(self, student_id: str, record) -> None:
+        with self._lock:
+            self._add(self.students, self.courses, student_id, record)
+            if self._pending is not None:
+                self._pending.append(("add", student_id, record))
+
+    def remove(self, student_id: str, record) -> None:
+        with self._lock:
+            self._remove(self.students, self.courses, student_id, record)
+            if self._pending is not None:
+                self._pending.append(("remove", student_id, record))
+
+    @staticmethod
+    def _add(students: Dict[str, Tuple[int, float]], courses: Dict[str, CourseStats], student_id: str,
+             record) -> None:
+        grades = record.grades
+        students[student_id] = (len(grades), sum(grades.values()))
+        for course, grade in grades.items():
+            stats = courses.get(course)
+            if stats is None:
+                stats = courses[course] = CourseStats()
+            stats.add(grade)
+
+    @staticmethod
+    def _remove(students: Dict[str, Tuple[int, float]], courses: Dict[str, CourseStats], student_id: str,
+                record) -> None:
+        students.pop(student_id, None)
+        for course, grade in record.grades.items():
+            stats = courses[course]
+            stats.remove(grade)
+            if not stats.count:
+                del courses[course]
+
+    def course_stats(self, course: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            stats = self.courses.get(course)
+            return stats.as_dict(course) if stats is not None else None
+
+    def all_course_stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [stats.as_dict(course) for course, stats in sorted(self.courses.items())]
+
+    def student_stats(self, student_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self.students.get(student_id)
+        if entry is None:
+            return None
+        count, total = entry
+        return {"student_id": student_id, "grade_count": count, "average": total / count if count else None}
+
+    def snapshot(self, records: Iterable[Tuple[str, Any]]) -> List[Tuple[str, Any]]:
+        """Copy the records for a rebuild() on another thread.
+
+        Call it where the writes happen (the event loop): every write from
+        then on is replayed onto the rebuilt aggregates, so none is lost.
+        Only one rebuild may run at a time.
+        """
+        with self._lock:
+            self._pending = []
+        return list(records)
+
+    def rebuild(self, records: Iterable[Tuple[str, Any]]) -> Dict[str, Any]:
+        """Recompute every aggregate from scratch, e.g. after a large import.
+
+        Uses NumPy when it is installed and a plain Python loop otherwise.
+        The new aggregates are built without holding the lock and swapped
+        in at the end.
+        """
+        started = time.perf_counter()
+        records = list(records)
+        if np is not None:
+            students, courses = self._rebuild_numpy(records)
+            backend = "numpy"
+        else:
+            students, courses = self._rebuild_python(records)
+            backend = "python"
+        with self._lock:
+            for operation, student_id, record in self._pending or ():
+                if operation == "add":
+                    self._add(students, courses, student_id, record)
+                else:
+                    self._remove(students, courses, student_id, record)
+            self.students, self.courses = students, courses
+            self._pending = None
+        return {
+            "backend": backend,
+            "students": len(students),
+            "courses": len(courses),
+            "seconds": time.perf_counter() - started,
+        }
+
+    def _rebuild_python(self, records: List[Tuple[str, Any]]) -> Tuple[Dict[str, Tuple[int, float]],
+                                                                      Dict[str, CourseStats]]:
+        course_grades: Dict[str, List[float]] = {}
+        students = {}
+        for student_id, record in records:
+            grades = record.grades
+            students[student_id] = (len(grades), sum(grades.values()))
+            for course, grade in grades.items():
+                course_grades.setdefault(course, []).append(grade)
+        courses = {}
+        for course, grades in course_grades.items():
+            stats = CourseStats()
+            grades.sort()
+            stats.count = len(grades)
+            stats.total = sum(grades)
+            stats.grades = grades
+            courses[course] = stats
+        return students, courses
+
+    def _rebuild_numpy(self, records: List[Tuple[str, Any]]) -> Tuple[Dict[str, Tuple[int, float]],
+                                                                     Dict[str, CourseStats]]:
+        course_codes: Dict[str, int] = {}
+        codes: List[int] = []
+        values: List[float] = []
+        lengths: List[int] = []
+        for _, record in records:
+            grades = record.grades
+            lengths.append(len(grades))
+            for course, grade in grades.items():
+                codes.append(course_codes.setdefault(course, len(course_codes)))
+                values.append(grade)
+
+        code_array = np.asarray(codes, dtype=np.int64)
+        grade_array = np.asarray(values, dtype=np.float64)
+        length_array = np.asarray(lengths, dtype=np.int64)
+
+        # Per-student sums: cumulative sum sampled at each record's boundary
+        ends = np.cumsum(length_array)
+        cumulative = np.concatenate(([0.0], np.cumsum(grade_array)))
+        student_totals = cumulative[ends] - cumulative[ends - length_array]
+        students = {
+            student_id: (count, total)
+            for (student_id, _), count, total in zip(records, length_array.tolist(), student_totals.tolist())
+        }
+
+        # Per-course grades sorted by (course, grade), then split per course
+        order = np.lexsort((grade_array, code_array))
+        sorted_grades = grade_array[order]
+        counts = np.bincount(code_array, minlength=len(course_codes))
+        totals = np.bincount(code_array, weights=grade_array, minlength=len(course_codes))
+        bounds = np.concatenate(([0], np.cumsum(counts)))
+        courses = {}
+        for course, code in course_codes.items():
+            stats = CourseStats()
+            stats.count = int(counts[code])
+            stats.total = float(totals[code])
+            stats.grades = sorted_grades[bounds[code]:bounds[code + 1]].tolist()
+            courses[course] = stats
+        return students, courses
+
+def merge_course_stats(results: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Combine all_course_stats() answers from several partitions of the records."""
+    by_course: Dict[str, List[Dict[str, Any]]] = {}
+    for worker_stats in results:
+        for stats in worker_stats:
+            by_course.setdefault(stats["course"], []).append(stats)
+    return [merge_one_course(parts) for _, parts in sorted(by_course.items())]
+
+def merge_one_course(parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combine one course's stats from several partitions into the stats of the whole."""
+    count = sum(part["count"] for part in parts)
+    return {
+        "course": parts[0]["course"],
+        "count": count,
+        "mean": sum(part["mean"] * part["count"] for part in parts) / count,
+        "min": min(part["min"] for part in parts),
+        "max": max(part["max"] for part in parts),
+    }
@@ -0,0 +1,116 @@
+"""Compare response sizes and times for each body encoding the services offer.
+
+Run from the project root:
+
+    python -m benchmarks.encoding --records 2000 --requests 500 --rounds 3
+
+Both services are loaded in-process with --records students and academic
+records, as in benchmarks/serialization.py, and every request passes
+through the content negotiation middleware. Each endpoint is requested as
+plain JSON, gzip, brotli, MessagePack and MessagePack with the best
+compression available; the table reports the bytes sent and the time per
+request. Brotli needs the brotli package and MessagePack the msgpack
+package; encodings that are not installed are skipped.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks.serialization import load
+import negotiation
+import service1
+import service2
+
+def encodings():
+    """(name, request headers) for each encoding that can be produced here."""
+    json_headers = [(b"accept", b"application/json")]
+    msgpack_headers = [(b"accept", negotiation.MSGPACK_TYPE.encode())]
+    best = b"br" if negotiation.brotli is not None else b"gzip"
+    found = [("json", json_headers + [(b"accept-encoding", b"identity")]),
+             ("json+gzip", json_headers + [(b"accept-encoding", b"gzip")])]
+    if negotiation.brotli is not None:
+        found.append(("json+br", json_headers + [(b"accept-encoding", b"br")]))
+    if negotiation.msgpack is not None:
+        found.append(("msgpack", msgpack_headers + [(b"accept-encoding", b"identity")]))
+        found.append((f"msgpack+{best.decode()}", msgpack_headers + [(b"accept-encoding", best)]))
+    return found
+
+def http_scope(method: str, path: str, query: str, headers: list) -> dict:
+    return {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": query.encode(),
+        "headers": [(b"host", b"localhost"), (b"content-type", b"application/json")] + headers,
+        "client": ("127.0.0.1", 1), "server": ("127.0.0.1", 80),
+    }
+
+async def call(app, method: str, path: str, query: str, body: bytes, headers: list) -> int:
+    """Send one request to an ASGI app and return the size of the response body."""
+    size = 0
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        nonlocal size
+        if message["type"] == "http.response.body":
+            size += len(message.get("body", b""))
+
+    await app(http_scope(method, path, query, headers), receive, send)
+    return size
+
+def workloads(records: int, requests: int):
+    """(name, app, [(method, path, query, body)]) for each endpoint measured."""
+    ids = [f"student{number % records:06d}" for number in range(requests)]
+    batch = json.dumps({"student_ids": ids[:100]}).encode()
+    pages = max(1, requests // 20)
+    return [
+        ("service1 GET /students/{id}", service1.app, [("GET", f"/students/{i}", "", b"") for i in ids]),
+        ("service1 GET /students?limit=100", service1.app, [("GET", "/students", "limit=100", b"")] * pages),
+        ("service1 POST /students:batchGet x100", service1.app,
+         [("POST", "/students:batchGet", "", batch)] * pages),
+        ("service2 GET /students/{id}/complete", service2.app,
+         [("GET", f"/students/{i}/complete", "", b"") for i in ids]),
+        ("service2 GET /students/academic?limit=100", service2.app,
+         [("GET", "/students/academic", "limit=100", b"")] * pages),
+        ("service2 POST /students:batchComplete x100", service2.app,
+         [("POST", "/students:batchComplete", "", batch)] * pages),
+    ]
+
+async def measure(app, requests, headers: list, rounds: int):
+    """Mean response bytes and best per-request time in microseconds."""
+    sizes = [await call(app, *request, headers) for request in requests]
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for request in requests:
+            await call(app, *request, headers)
+        best = min(best, time.perf_counter() - started)
+    return sum(sizes) / len(sizes), best / len(requests) * 1e6
+
+async def run(records: int, requests: int, rounds: int) -> list:
+    load(records)
+    results = []
+    for name, app, batch in workloads(records, requests):
+        for encoding, headers in encodings():
+            size, micros = await measure(app, batch, headers, rounds)
+            results.append({"request": name, "encoding": encoding, "bytes": round(size), "us": round(micros, 1)})
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.records, args.requests, args.rounds))
+    plain = {result["request"]: result["bytes"] for result in results if result["encoding"] == "json"}
+    for result in results:
+        ratio = result["bytes"] / plain[result["request"]] if plain[result["request"]] else 1.0
+        print(f"{result['request']:44s} {result['encoding']:13s} {result['bytes']:9d} B ({ratio:5.1%})"
+              f" {result['us']:9.1f} us")
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
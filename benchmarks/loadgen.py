@@ -0,0 +1,260 @@
+"""Drive both services with configurable workloads and report throughput and tail latency.
+
+Run from the project root:
+
+    python -m benchmarks.loadgen --students 10000 --seconds 10 --concurrency 64 --output results.json
+    python -m benchmarks.loadgen --workloads personal_reads,complete_reads --compare results.json
+
+The services are started with main.py (so SERVICE*_WORKERS, SERVICE*_SHARDS
+and the other environment settings apply) unless --no-start is given, in
+which case --service1-url / --service2-url are used as they are. Students
+and academic records are bulk-loaded first, then each workload runs as a
+closed loop of --concurrency clients for --seconds after --warmup seconds.
+
+Workloads:
+  personal_reads   GET service1 /students/{id}
+  academic_writes  PUT service2 /students/{id}/academic (with its service1 existence check;
+                   with ACADEMIC_WRITE_BEHIND=1 the 202 acknowledgement is timed)
+  complete_reads   GET service2 /students/{id}/complete
+  list_scans       GET service1 /students?format=ndjson, reading every student
+
+Results are printed as a table and written as JSON with sorted keys, so two
+runs can be diffed; --compare prints the change against an earlier file.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+
+import aiohttp
+
+WORKLOADS = ("personal_reads", "academic_writes", "complete_reads", "list_scans")
+PERCENTILES = (("p50", 0.50), ("p95", 0.95), ("p99", 0.99), ("p999", 0.999))
+COURSES = ["Mathematics", "Physics", "Chemistry", "Biology", "History", "Literature", "Economics", "Art"]
+
+def student_id(number: int) -> str:
+    return f"load{number:07d}"
+
+def personal_record(number: int) -> dict:
+    return {
+        "student_id": student_id(number),
+        "first_name": f"First{number % 5000}",
+        "last_name": f"Last{number % 7000}",
+        "email": f"{student_id(number)}@example.edu",
+    }
+
+def academic_record(number: int, rng: random.Random) -> dict:
+    courses = rng.sample(COURSES, 4)
+    return {
+        "student_id": student_id(number),
+        "courses": courses,
+        "grades": {course: round(rng.uniform(50, 100), 1) for course in courses},
+        "enrollment_status": rng.choice(["active", "active", "active", "graduated", "suspended"]),
+    }
+
+def start_services() -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, "main.py"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                            start_new_session=True)
+
+def stop_services(process: subprocess.Popen) -> None:
+    os.killpg(process.pid, signal.SIGINT)
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+
+async def wait_ready(session: aiohttp.ClientSession, urls, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    for url in urls:
+        while True:
+            try:
+                async with session.get(url + "/") as response:
+                    if response.status == 200:
+                        break
+            except aiohttp.ClientError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{url} did not become ready")
+            await asyncio.sleep(0.2)
+
+async def bulk_import(session: aiohttp.ClientSession, url: str, records) -> None:
+    body = "".join(json.dumps(record) + "\n" for record in records)
+    async with session.post(url, params={"mode": "upsert"}, data=body) as response:
+        response.raise_for_status()
+        summary = json.loads((await response.text()).splitlines()[-1])["summary"]
+    if summary.get("error"):
+        raise RuntimeError(f"Loading {url} reported errors: {summary}")
+
+async def load_data(session: aiohttp.ClientSession, args) -> None:
+    rng = random.Random(args.seed)
+    numbers = range(args.students)
+    await bulk_import(session, f"{args.service1_url}/students:import", map(personal_record, numbers))
+    await bulk_import(session, f"{args.service2_url}/students/academic:import",
+                      (academic_record(number, rng) for number in numbers))
+
+def make_request(workload: str, args, rng: random.Random):
+    """Return a coroutine factory issuing one request of the workload on a session."""
+    if workload == "personal_reads":
+        async def request(session):
+            async with session.get(f"{args.service1_url}/students/{student_id(rng.randrange(args.students))}") as response:
+                await response.read()
+                return response.status == 200
+    elif workload == "academic_writes":
+        async def request(session):
+            number = rng.randrange(args.students)
+            async with session.put(f"{args.service2_url}/students/{student_id(number)}/academic",
+                                   json=academic_record(number, rng)) as response:
+                await response.read()
+                return response.status in (200, 202)
+    elif workload == "complete_reads":
+        async def request(session):
+            async with session.get(f"{args.service2_url}/students/{student_id(rng.randrange(args.students))}/complete") as response:
+                await response.read()
+                return response.status == 200
+    elif workload == "list_scans":
+        async def request(session):
+            async with session.get(f"{args.service1_url}/students", params={"format": "ndjson"}) as response:
+                lines = 0
+                async for _ in response.content:
+                    lines += 1
+                return response.status == 200 and lines >= args.students
+    else:
+        raise ValueError(f"Unknown workload {workload!r}, expected one of {WORKLOADS}")
+    return request
+
+def summarize(latencies, errors: int, seconds: float) -> dict:
+    latencies.sort()
+    result = {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "rps": round(len(latencies) / seconds, 1) if seconds else 0.0,
+        "latency_ms": {},
+    }
+    if latencies:
+        for name, fraction in PERCENTILES:
+            # Nearest-rank percentile
+            index = min(len(latencies) - 1, max(0, int(fraction * len(latencies) + 0.5) - 1))
+            result["latency_ms"][name] = round(latencies[index] * 1000, 3)
+        result["latency_ms"]["mean"] = round(sum(latencies) / len(latencies) * 1000, 3)
+        result["latency_ms"]["max"] = round(latencies[-1] * 1000, 3)
+    return result
+
+async def run_workload(session: aiohttp.ClientSession, workload: str, args) -> dict:
+    rng = random.Random(f"{args.seed}-{workload}")
+    request = make_request(workload, args, rng)
+    concurrency = args.scan_concurrency if workload == "list_scans" else args.concurrency
+    latencies = []
+    errors = 0
+    recording = False
+    started = time.monotonic()
+    warm_until = started + args.warmup
+    stop_at = warm_until + args.seconds
+
+    async def client():
+        nonlocal errors
+        while True:
+            begin = time.perf_counter()
+            if time.monotonic() >= stop_at:
+                return
+            try:
+                ok = await request(session)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                ok = False
+            elapsed = time.perf_counter() - begin
+            if recording:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors += 1
+
+    async def switch_on():
+        nonlocal recording
+        await asyncio.sleep(args.warmup)
+        recording = True
+
+    switch = asyncio.create_task(switch_on())
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    await switch
+    return {"workload": workload, "concurrency": concurrency, **summarize(latencies, errors, args.seconds)}
+
+async def run(args) -> dict:
+    connector = aiohttp.TCPConnector(limit=max(args.concurrency, args.scan_concurrency))
+    timeout = aiohttp.ClientTimeout(total=args.request_timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        await wait_ready(session, [args.service1_url, args.service2_url])
+        load_started = time.perf_counter()
+        await load_data(session, args)
+        load_seconds = time.perf_counter() - load_started
+        results = []
+        for workload in args.workloads.split(","):
+            result = await run_workload(session, workload, args)
+            results.append(result)
+            latency = result["latency_ms"]
+            print(f"{workload:16s} {result['rps']:>9,.0f} req/s  p50 {latency.get('p50', 0):8.2f} ms  "
+                  f"p95 {latency.get('p95', 0):8.2f}  p99 {latency.get('p99', 0):8.2f}  "
+                  f"p999 {latency.get('p999', 0):8.2f}  errors {result['errors']}", flush=True)
+    config = {name: getattr(args, name) for name in
+              ("students", "seconds", "warmup", "concurrency", "scan_concurrency", "seed")}
+    environment = {name: value for name, value in sorted(os.environ.items())
+                   if name.startswith(("SERVICE1_", "SERVICE2_", "STUDENT_STORE", "JOURNAL_", "PERSONAL_CACHE_"))}
+    return {"config": config, "environment": environment, "load_seconds": round(load_seconds, 3),
+            "workloads": results}
+
+def compare(baseline: dict, current: dict) -> None:
+    """Print the relative change of each metric against an earlier results file."""
+    before = {result["workload"]: result for result in baseline["workloads"]}
+    for result in current["workloads"]:
+        old = before.get(result["workload"])
+        if old is None:
+            continue
+        changes = [f"rps {_change(old['rps'], result['rps'])}"]
+        for name, _ in PERCENTILES:
+            if name in old["latency_ms"] and name in result["latency_ms"]:
+                changes.append(f"{name} {_change(old['latency_ms'][name], result['latency_ms'][name])}")
+        print(f"{result['workload']:16s} vs baseline: " + ", ".join(changes))
+
+def _change(old: float, new: float) -> str:
+    return f"{(new - old) / old:+.1%}" if old else "n/a"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workloads", default=",".join(WORKLOADS))
+    parser.add_argument("--students", type=int, default=10000)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--scan-concurrency", type=int, default=2)
+    parser.add_argument("--request-timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--service1-url", default="http://127.0.0.1:8080")
+    parser.add_argument("--service2-url", default="http://127.0.0.1:8081")
+    parser.add_argument("--no-start", action="store_true", help="use services that are already running")
+    parser.add_argument("--output", help="write the JSON results to this file")
+    parser.add_argument("--compare", help="earlier JSON results to compare against")
+    args = parser.parse_args()
+
+    process = None if args.no_start else start_services()
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        if process is not None:
+            stop_services(process)
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+
+if __name__ == "__main__":
+    main()
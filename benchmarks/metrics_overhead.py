@@ -0,0 +1,100 @@
+"""Measure the per-request cost of the /metrics instrumentation.
+
+Run from the project root:
+
+    python -m benchmarks.metrics_overhead --requests 5000 --rounds 5
+
+Whole requests are too noisy to compare two runs a few percent apart, so
+this measures the instrumentation on its own: MetricsMiddleware plus the
+endpoint timer around a no-op ASGI app, against the bare app. The added
+microseconds are then compared with the time of real service1/service2
+requests made through ASGI without instrumentation (no network in between,
+so over real connections the share is smaller still).
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+# Import the services without instrumentation to time the baseline requests
+os.environ["METRICS_ENABLED"] = "0"
+os.environ.setdefault("SERVICE1_CHANGE_FEED", "0")
+
+from metrics import HttpMetrics, MetricsMiddleware, MetricsRegistry, _timed
+
+def http_scope(path: str) -> dict:
+    return {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "headers": [(b"host", b"localhost")], "client": ("127.0.0.1", 1), "server": ("127.0.0.1", 80),
+    }
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+async def send(message):
+    pass
+
+async def best_time(app, paths, rounds: int) -> float:
+    """Best per-request time in microseconds over several rounds (filters out noise)."""
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for path in paths:
+            await app(http_scope(path), receive, send)
+        best = min(best, time.perf_counter() - started)
+    return best / len(paths) * 1e6
+
+def bare_app(endpoint):
+    async def app(scope, receive, send):
+        await endpoint()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+    return app
+
+async def instrumentation_cost(requests: int, rounds: int) -> float:
+    async def endpoint():
+        return None
+
+    metrics = HttpMetrics(MetricsRegistry())
+    bare = bare_app(endpoint)
+    instrumented = MetricsMiddleware(bare_app(_timed(endpoint, metrics.handler_duration, "/students/{id}")), metrics)
+    paths = ["/students/x"] * requests
+    await best_time(instrumented, paths[:200], 1)  # warm up
+    return await best_time(instrumented, paths, rounds) - await best_time(bare, paths, rounds)
+
+async def request_costs(requests: int, rounds: int) -> dict:
+    import service1
+    import service2
+    for number in range(1000):
+        student_id = f"student{number:04d}"
+        service1.student_personal_data[student_id] = service1.StudentPersonal(
+            student_id=student_id, first_name="First", last_name="Last", email=f"{student_id}@example.edu")
+        service2.write_academic_record(student_id, service2.StudentAcademic(
+            student_id=student_id, courses=["Physics"], grades={"Physics": 90.0}, enrollment_status="active"))
+    costs = {}
+    for name, app, path in (("service1 GET /students/{id}", service1.app, "/students/student{:04d}"),
+                            ("service2 GET /students/{id}/academic", service2.app, "/students/student{:04d}/academic")):
+        paths = [path.format(number % 1000) for number in range(requests)]
+        await best_time(app, paths[:200], 1)  # warm up
+        costs[name] = await best_time(app, paths, rounds)
+    return costs
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    added = asyncio.run(instrumentation_cost(args.requests, args.rounds))
+    costs = asyncio.run(request_costs(args.requests, args.rounds))
+    print(f"instrumentation adds {added:.1f} us per request")
+    results = {"instrumentation_us": round(added, 2), "requests": []}
+    for name, cost in costs.items():
+        results["requests"].append({"request": name, "us": round(cost, 1), "overhead": round(added / cost, 4)})
+        print(f"{name:38s} {cost:7.1f} us without metrics -> overhead {added / cost:.1%}")
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Benchmark the write-ahead log: write throughput per fsync policy and restart time.
+
+Run from the project root:
+
+    python -m benchmarks.persistence --writes 20000 --concurrency 64 --records 1000000
+
+Writes go through Journal.commit_async from concurrent coroutines, the way
+the services call it. Restart time is measured by recovering a journal with
+--records records, either from the log alone or from a snapshot plus a
+--tail of later log entries.
+"""
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+
+from persistence import FSYNC_POLICIES, Journal
+
+def student(number: int) -> dict:
+    return {
+        "student_id": f"student{number:07d}",
+        "first_name": f"First{number % 5000}",
+        "last_name": f"Last{number % 7000}",
+        "email": f"student{number:07d}@example.edu",
+        "phone": None,
+        "address": None,
+    }
+
+async def write_throughput(policy: str, writes: int, concurrency: int) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        journal = Journal(directory, policy)
+        journal.recover(lambda key, value: None)
+        journal.start()
+        counter = iter(range(writes))
+
+        async def writer():
+            for number in counter:
+                record = student(number)
+                await journal.commit_async(journal.append(record["student_id"], record))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(writer() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        journal.close()
+    return {"policy": policy, "writes": writes, "concurrency": concurrency,
+            "seconds": round(elapsed, 3), "writes_per_second": round(writes / elapsed)}
+
+def build_journal(directory: str, records: int, tail: int, snapshot: bool) -> None:
+    journal = Journal(directory, "none")
+    journal.recover(lambda key, value: None)
+    for number in range(records):
+        record = student(number)
+        journal.append(record["student_id"], record)
+    if snapshot:
+        journal.snapshot(lambda: ((f"student{n:07d}", student(n)) for n in range(records)))
+    for number in range(tail):
+        record = dict(student(number), last_name="Updated")
+        journal.append(record["student_id"], record)
+    journal.close()
+
+def restart_time(records: int, tail: int, snapshot: bool) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        build_journal(directory, records, tail, snapshot)
+        store = {}
+
+        def apply(key, value):
+            if value is None:
+                store.pop(key, None)
+            else:
+                store[key] = value
+
+        journal = Journal(directory, "none")
+        recovery = journal.recover(apply)
+        journal.close()
+    assert len(store) == records
+    return {"mode": "snapshot+tail" if snapshot else "log only", "records": records,
+            "tail": tail if snapshot else records + tail, "seconds": round(recovery["seconds"], 3)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writes", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--records", type=int, default=1000000)
+    parser.add_argument("--tail", type=int, default=10000)
+    parser.add_argument("--policies", default=",".join(FSYNC_POLICIES))
+    args = parser.parse_args()
+
+    results = {"write_throughput": [], "restart": []}
+    for policy in args.policies.split(","):
+        result = asyncio.run(write_throughput(policy, args.writes, args.concurrency))
+        results["write_throughput"].append(result)
+        print(f"fsync={policy:9s} {result['writes_per_second']:>9,} writes/s")
+    for snapshot in (False, True):
+        result = restart_time(args.records, args.tail, snapshot)
+        results["restart"].append(result)
+        print(f"restart {result['mode']:14s} {result['records']:,} records: {result['seconds']:.2f} s")
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Compare the default response path with the FAST_JSON path of the read endpoints.
+
+Run from the project root:
+
+    python -m benchmarks.serialization --records 2000 --requests 2000 --rounds 5
+
+Both services are loaded in-process with --records students and academic
+records (Service 2's personal cache is filled directly, so no Service 1 is
+needed) and requests are sent straight to the ASGI apps, so only routing,
+validation and serialization are measured. Each endpoint is timed with
+FAST_JSON off and on; the two answers are checked to decode to the same
+JSON. The fast path uses orjson when it is installed (pip install orjson).
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+os.environ.setdefault("SERVICE1_CHANGE_FEED", "0")
+os.environ.setdefault("METRICS_ENABLED", "0")
+os.environ.setdefault("TRACING_ENABLED", "0")
+
+import fastjson
+import service1
+import service2
+
+COURSES = [f"Course {number:03d}" for number in range(20)]
+
+def http_scope(method: str, path: str, query: str = "") -> dict:
+    return {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": query.encode(),
+        "headers": [(b"host", b"localhost"), (b"content-type", b"application/json")],
+        "client": ("127.0.0.1", 1), "server": ("127.0.0.1", 80),
+    }
+
+async def call(app, method: str, path: str, query: str = "", body: bytes = b"") -> bytes:
+    """Send one request to an ASGI app and return the response body."""
+    chunks = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(http_scope(method, path, query), receive, send)
+    return b"".join(chunks)
+
+def load(records: int) -> None:
+    for number in range(records):
+        student_id = f"student{number:06d}"
+        student = service1.StudentPersonal(
+            student_id=student_id, first_name=f"First{number}", last_name=f"Last{number}",
+            email=f"{student_id}@example.edu", phone="555-0100")
+        service1.write_student(student_id, student)
+        service2.personal_cache.put(student_id, student)
+        courses = [COURSES[(number + offset) % len(COURSES)] for offset in range(4)]
+        service2.write_academic_record(student_id, service2.StudentAcademic(
+            student_id=student_id, courses=courses,
+            grades={course: float(60 + (number + index) % 40) for index, course in enumerate(courses)},
+            enrollment_status="active"))
+
+def workloads(records: int, requests: int):
+    """(name, app, [(method, path, query, body)]) for each endpoint measured."""
+    ids = [f"student{number % records:06d}" for number in range(requests)]
+    batch = json.dumps({"student_ids": ids[:100]}).encode()
+    pages = max(1, requests // 20)
+    return [
+        ("service1 GET /students/{id}", service1.app, [("GET", f"/students/{i}", "", b"") for i in ids]),
+        ("service1 GET /students?limit=100", service1.app, [("GET", "/students", "limit=100", b"")] * pages),
+        ("service1 GET /students (all)", service1.app, [("GET", "/students", "", b"")] * 5),
+        ("service1 POST /students:batchGet x100", service1.app,
+         [("POST", "/students:batchGet", "", batch)] * pages),
+        ("service2 GET /students/{id}/academic", service2.app,
+         [("GET", f"/students/{i}/academic", "", b"") for i in ids]),
+        ("service2 GET /students/{id}/complete", service2.app,
+         [("GET", f"/students/{i}/complete", "", b"") for i in ids]),
+        ("service2 GET /students/academic?limit=100", service2.app,
+         [("GET", "/students/academic", "limit=100", b"")] * pages),
+        ("service2 POST /students:batchComplete x100", service2.app,
+         [("POST", "/students:batchComplete", "", batch)] * pages),
+    ]
+
+async def best_time(app, requests, rounds: int) -> float:
+    """Best per-request time in microseconds over several rounds (filters out noise)."""
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for request in requests:
+            await call(app, *request)
+        best = min(best, time.perf_counter() - started)
+    return best / len(requests) * 1e6
+
+def set_fast_json(enabled: bool) -> None:
+    service1.FAST_JSON = service2.FAST_JSON = enabled
+
+async def run(records: int, requests: int, rounds: int) -> list:
+    load(records)
+    results = []
+    for name, app, batch in workloads(records, requests):
+        answers = {}
+        times = {}
+        for enabled in (False, True):
+            set_fast_json(enabled)
+            answers[enabled] = json.loads(await call(app, *batch[0]))
+            await best_time(app, batch[:50], 1)  # warm up (and fill the encoded-record cache)
+            times[enabled] = await best_time(app, batch, rounds)
+        assert answers[False] == answers[True], f"{name}: the fast path answers differently"
+        results.append({"request": name, "default_us": round(times[False], 1), "fast_us": round(times[True], 1),
+                        "speedup": round(times[False] / times[True], 2)})
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.records, args.requests, args.rounds))
+    print(f"encoder: {'orjson' if fastjson.orjson is not None else 'json'}")
+    for result in results:
+        print(f"{result['request']:44s} {result['default_us']:9.1f} us -> {result['fast_us']:9.1f} us"
+              f"  ({result['speedup']:.2f}x)")
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
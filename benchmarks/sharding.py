@@ -0,0 +1,57 @@
+"""Measure how evenly the consistent-hash ring spreads keys and how many move on a change.
+
+Run from the project root:
+
+    python -m benchmarks.sharding --keys 200000 --shards 4 --virtual-nodes 1,40,160
+
+For each virtual node count, reports the largest shard's share relative to
+a perfectly even split, and the fraction of keys that change owner when a
+shard is added to N shards or one of the N+1 is removed (ideal: 1/(N+1) both ways).
+"""
+import argparse
+import json
+
+from sharding import HashRing
+
+def owners(ring: HashRing, keys):
+    return [ring.owner(key) for key in keys]
+
+def measure(keys, shards: int, virtual_nodes: int) -> dict:
+    nodes = [f"http://127.0.0.1:{8180 + index}" for index in range(shards + 1)]
+    ring = HashRing(nodes[:shards], virtual_nodes)
+    before = owners(ring, keys)
+    counts = {node: 0 for node in nodes[:shards]}
+    for owner in before:
+        counts[owner] += 1
+    ring.add(nodes[shards])
+    added = owners(ring, keys)
+    ring.remove(nodes[0])
+    removed = owners(ring, keys)
+    return {
+        "virtual_nodes": virtual_nodes,
+        "max_share_vs_even": round(max(counts.values()) * shards / len(keys), 3),
+        "moved_on_add": round(sum(a != b for a, b in zip(before, added)) / len(keys), 4),
+        "ideal_on_add": round(1 / (shards + 1), 4),
+        "moved_on_remove": round(sum(a != b for a, b in zip(added, removed)) / len(keys), 4),
+        "ideal_on_remove": round(1 / (shards + 1), 4),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--keys", type=int, default=200000)
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--virtual-nodes", default="1,40,160")
+    args = parser.parse_args()
+
+    keys = [f"student{number:07d}" for number in range(args.keys)]
+    results = []
+    for virtual_nodes in map(int, args.virtual_nodes.split(",")):
+        result = measure(keys, args.shards, virtual_nodes)
+        results.append(result)
+        print(f"virtual nodes={virtual_nodes:<4d} largest shard {result['max_share_vs_even']:.2f}x even, "
+              f"moved on add {result['moved_on_add']:.1%} (ideal {result['ideal_on_add']:.1%}), "
+              f"on remove {result['moved_on_remove']:.1%}")
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
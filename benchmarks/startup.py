@@ -0,0 +1,116 @@
+"""Measure cold start: the time from launching main.py to the first successful requests.
+
+Run from the project root:
+
+    python -m benchmarks.startup --runs 5 --output startup.json
+    PRELOAD=1 SERVICE2_WORKERS=4 python -m benchmarks.startup --runs 5 --compare startup.json
+
+Each run starts both services with main.py (so PRELOAD, SERVICE*_WORKERS,
+SERVICE*_SHARDS and the other environment settings apply) and polls until
+GET /ready answers 200 on each service and a first real request succeeds
+on each (a Service 1 lookup and a Service 2 complete-info lookup, which
+also calls Service 1). Every process then reports its own timings on
+GET /debug/startup: imports plus app construction, startup handlers, and
+with STARTUP_PROFILE=1 the slowest imports. Results are the median, min
+and max over --runs runs and are written as JSON with sorted keys, as for
+benchmarks/loadgen.py.
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+import urllib.error
+import urllib.request
+
+from benchmarks.loadgen import start_services, stop_services
+
+# Local addresses, so any configured HTTP proxy is bypassed
+opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+
+MILESTONES = ("service1_ready", "service2_ready", "service1_first_request", "service2_first_request")
+
+def get(url: str):
+    """(status, JSON body) of a GET, or (None, None) if nothing answers yet."""
+    try:
+        with opener.open(url, timeout=2) as response:
+            return response.status, json.loads(response.read() or b"null")
+    except urllib.error.HTTPError as exc:
+        return exc.code, None
+    except OSError:
+        return None, None
+
+def wait_for(url: str, accept, started: float, timeout: float) -> float:
+    """Seconds since started at which GET url first answered with a status in accept."""
+    while time.perf_counter() - started < timeout:
+        status, _ = get(url)
+        if status in accept:
+            return time.perf_counter() - started
+        time.sleep(0.005)
+    raise RuntimeError(f"{url} did not answer {accept} within {timeout:g}s")
+
+def one_run(args) -> dict:
+    started = time.perf_counter()
+    process = start_services()
+    try:
+        # Unknown students: 404 is a successful answer that went through the whole request path
+        times = {
+            "service1_ready": wait_for(f"{args.service1_url}/ready", (200,), started, args.timeout),
+            "service1_first_request": wait_for(f"{args.service1_url}/students/startup-probe", (200, 404),
+                                               started, args.timeout),
+            "service2_ready": wait_for(f"{args.service2_url}/ready", (200,), started, args.timeout),
+            "service2_first_request": wait_for(f"{args.service2_url}/students/startup-probe/complete", (200, 404),
+                                               started, args.timeout),
+        }
+        _, service1_profile = get(f"{args.service1_url}/debug/startup")
+        _, service2_profile = get(f"{args.service2_url}/debug/startup")
+    finally:
+        stop_services(process)
+    return {"seconds": {name: round(value, 4) for name, value in times.items()},
+            "processes": {"service1": service1_profile, "service2": service2_profile}}
+
+def summarize(runs) -> dict:
+    summary = {}
+    for name in MILESTONES:
+        values = [run["seconds"][name] for run in runs]
+        summary[name] = {"median": round(statistics.median(values), 4), "min": min(values), "max": max(values)}
+    return summary
+
+def compare(baseline: dict, current: dict) -> None:
+    """Print the relative change of each median against an earlier results file."""
+    for name in MILESTONES:
+        old = baseline["summary"].get(name, {}).get("median")
+        new = current["summary"][name]["median"]
+        change = f"{(new - old) / old:+.1%}" if old else "n/a"
+        print(f"{name:24s} vs baseline: {change}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--service1-url", default="http://127.0.0.1:8080")
+    parser.add_argument("--service2-url", default="http://127.0.0.1:8081")
+    parser.add_argument("--output", help="write the JSON results to this file")
+    parser.add_argument("--compare", help="earlier JSON results to compare against")
+    args = parser.parse_args()
+
+    runs = []
+    for number in range(args.runs):
+        runs.append(one_run(args))
+        print(f"run {number + 1}: " + "  ".join(f"{name} {value:.3f}s" for name, value in runs[-1]["seconds"].items()),
+              flush=True)
+    environment = {name: value for name, value in sorted(os.environ.items())
+                   if name.startswith(("SERVICE1_", "SERVICE2_", "PRELOAD", "STARTUP_", "STUDENT_STORE"))}
+    results = {"config": {"runs": args.runs}, "environment": environment, "summary": summarize(runs), "runs": runs}
+    for name, values in results["summary"].items():
+        print(f"{name:24s} median {values['median']:.3f}s  min {values['min']:.3f}s  max {values['max']:.3f}s")
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Compare the memory used by the "dict" and "compact" record stores.
+
+Run from the project root:
+
+    python -m benchmarks.storage_memory --records 200000
+
+Records are generated the way the API would produce them (fresh strings per
+request, a shared catalog of course names) and inserted one at a time. The
+memory held by each store is measured with tracemalloc.
+"""
+import argparse
+import gc
+import json
+import random
+import tracemalloc
+
+from service1 import StudentPersonal
+from service2 import StudentAcademic
+from storage import AcademicCodec, PersonalCodec, make_store
+
+COURSE_CATALOG = [f"Course {number:03d}" for number in range(200)]
+STATUSES = ["active", "inactive", "graduated", "suspended"]
+
+def personal_record(number: int, rng: random.Random) -> StudentPersonal:
+    student_id = f"student{number:07d}"
+    return StudentPersonal(
+        student_id=student_id,
+        first_name=f"First{number % 5000}",
+        last_name=f"Last{number % 7000}",
+        email=f"{student_id}@example.edu",
+        phone=f"555-{number % 10000:04d}" if number % 2 else None,
+    )
+
+def academic_record(number: int, rng: random.Random) -> StudentAcademic:
+    # Course names are rebuilt per record, like strings parsed from a request body
+    courses = ["".join(name) for name in rng.sample(COURSE_CATALOG, rng.randint(3, 6))]
+    return StudentAcademic(
+        student_id=f"student{number:07d}",
+        courses=courses,
+        grades={course: round(rng.uniform(50, 100), 1) for course in courses},
+        enrollment_status="".join(rng.choice(STATUSES)),
+    )
+
+def measure(kind: str, codec, build, records: int) -> int:
+    """Return the bytes held by a store of the given kind after inserting records."""
+    rng = random.Random(42)
+    gc.collect()
+    tracemalloc.start()
+    store = make_store(kind, codec)
+    baseline = tracemalloc.get_traced_memory()[0]
+    for number in range(records):
+        record = build(number, rng)
+        store[record.student_id] = record
+    del record
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    del store
+    return used
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=200000)
+    args = parser.parse_args()
+
+    results = []
+    for name, codec_factory, build in [
+        ("personal", lambda: PersonalCodec(StudentPersonal), personal_record),
+        ("academic", lambda: AcademicCodec(StudentAcademic), academic_record),
+    ]:
+        for kind in ("dict", "compact"):
+            used = measure(kind, codec_factory(), build, args.records)
+            results.append({
+                "store": name,
+                "kind": kind,
+                "records": args.records,
+                "bytes": used,
+                "bytes_per_record": round(used / args.records, 1),
+            })
+            print(f"{name:9s} {kind:8s} {used / 2**20:9.1f} MiB  {used / args.records:7.1f} B/record")
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Benchmark service1 read throughput as the number of workers grows.
+
+Run from the project root:
+
+    python -m benchmarks.workers --workers 1,2,4 --students 10000 --seconds 10
+
+For each worker count, service1 is started with main.start_service on
+--port, loaded with --students students through the bulk import endpoint,
+then read with GET /students/{id} for --seconds from --clients load
+generator processes (one per core by default) with --concurrency requests
+in flight each. Reads for students owned by another worker take one extra
+internal hop, so the gain per worker is below linear; scaling also needs
+free cores for both the workers and the load generators.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import time
+
+import aiohttp
+
+from main import start_service, worker_urls
+
+def student(number: int) -> dict:
+    return {
+        "student_id": f"student{number:07d}",
+        "first_name": f"First{number % 5000}",
+        "last_name": f"Last{number % 7000}",
+        "email": f"student{number:07d}@example.edu",
+    }
+
+async def wait_ready(urls, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        for url in urls:
+            while True:
+                try:
+                    async with session.get(url + "/") as response:
+                        if response.status == 200:
+                            break
+                except aiohttp.ClientError:
+                    pass
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"{url} did not start")
+                await asyncio.sleep(0.2)
+
+async def load_students(base_url: str, students: int) -> None:
+    body = "".join(json.dumps(student(number)) + "\n" for number in range(students))
+    async with aiohttp.ClientSession() as session:
+        async with session.post(f"{base_url}/students:import", params={"mode": "upsert"}, data=body) as response:
+            lines = (await response.text()).splitlines()
+    summary = json.loads(lines[-1])["summary"]
+    assert summary.get("error", 0) == 0, summary
+
+async def read_load(base_url: str, students: int, seconds: float, concurrency: int) -> dict:
+    completed = 0
+    errors = 0
+    deadline = time.monotonic() + seconds
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(base_url, connector=connector) as session:
+        async def reader():
+            nonlocal completed, errors
+            while time.monotonic() < deadline:
+                student_id = f"student{random.randrange(students):07d}"
+                try:
+                    async with session.get(f"/students/{student_id}") as response:
+                        await response.read()
+                        if response.status == 200:
+                            completed += 1
+                        else:
+                            errors += 1
+                except aiohttp.ClientError:
+                    errors += 1
+
+        await asyncio.gather(*(reader() for _ in range(concurrency)))
+    return {"completed": completed, "errors": errors}
+
+def client_process(base_url: str, students: int, seconds: float, concurrency: int, results) -> None:
+    results.put(asyncio.run(read_load(base_url, students, seconds, concurrency)))
+
+def measure(workers: int, args) -> dict:
+    base_url = f"http://127.0.0.1:{args.port}"
+    processes = start_service("service1", args.port, args.internal_port, workers)
+    try:
+        asyncio.run(wait_ready(worker_urls(args.internal_port, workers) + [base_url]))
+        asyncio.run(load_students(base_url, args.students))
+        results = multiprocessing.Queue()
+        clients = [
+            multiprocessing.Process(target=client_process,
+                                    args=(base_url, args.students, args.seconds, args.concurrency, results))
+            for _ in range(args.clients)
+        ]
+        for client in clients:
+            client.start()
+        totals = [results.get() for _ in clients]
+        for client in clients:
+            client.join()
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+    completed = sum(total["completed"] for total in totals)
+    return {"workers": workers, "clients": args.clients, "concurrency": args.concurrency,
+            "requests": completed, "errors": sum(total["errors"] for total in totals),
+            "requests_per_second": round(completed / args.seconds)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--students", type=int, default=10000)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--clients", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--port", type=int, default=9080)
+    parser.add_argument("--internal-port", type=int, default=19080)
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} cores")
+    results = []
+    for workers in map(int, args.workers.split(",")):
+        result = measure(workers, args)
+        results.append(result)
+        print(f"workers={workers:<3d} {result['requests_per_second']:>9,} requests/s ({result['errors']} errors)")
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
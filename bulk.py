@@ -0,0 +1,54 @@
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import json
+
+from pydantic import ValidationError
+
+IMPORT_MODES = ("create", "upsert")
+
+async def ndjson_batches(chunks: AsyncIterator[bytes], batch_size: int) -> AsyncIterator[List[Tuple[int, bytes]]]:
+    """Split a streamed request body into NDJSON lines, batch_size lines at a time.
+
+    Yields lists of (line_number, raw_line); blank lines are skipped. Only
+    the current batch and one partial line are held in memory.
+    """
+    buffer = b""
+    line_number = 0
+    batch: List[Tuple[int, bytes]] = []
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_number += 1
+            if line.strip():
+                batch.append((line_number, line))
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+    if buffer.strip():
+        batch.append((line_number + 1, buffer))
+    if batch:
+        yield batch
+
+def parse_line(model, raw: bytes) -> Tuple[Optional[Any], Optional[str]]:
+    """Validate one NDJSON line as model; return (record, None) or (None, error)."""
+    try:
+        return model.parse_obj(json.loads(raw)), None
+    except ValueError as exc:
+        # json.JSONDecodeError and pydantic.ValidationError are both ValueErrors
+        if isinstance(exc, ValidationError):
+            return None, "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in exc.errors())
+        return None, f"invalid JSON: {exc}"
+
+def line_result(line_number: int, status: str, student_id: Optional[str] = None,
+                error: Optional[str] = None) -> str:
+    """One NDJSON line of the per-line import report."""
+    result: Dict[str, Any] = {"line": line_number, "status": status}
+    if student_id is not None:
+        result["student_id"] = student_id
+    if error is not None:
+        result["error"] = error
+    return json.dumps(result) + "\n"
+
+def summary_line(counts: Dict[str, int]) -> str:
+    """Final NDJSON line of the import report with the count per status."""
+    return json.dumps({"summary": counts}) + "\n"
@@ -0,0 +1,167 @@
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+import time
+
+# Returned by TTLCache.get when a key is not cached (None is a valid cached value)
+MISSING = object()
+
+# Response header carrying the age in seconds of stale cached data served in a response
+STALE_AGE_HEADER = "X-Stale-Age"
+
+class TTLCache:
+    """Bounded in-process cache with per-entry TTL and LRU eviction.
+
+    A value of None is treated as a negative entry ("known not to exist") and
+    is kept for the shorter negative_ttl instead of ttl.
+
+    With stale_ttl > 0, an expired positive entry is kept for stale_ttl more
+    seconds: get() no longer returns it, but get_stale() does, so a caller
+    can serve it while refreshing it or while the source is failing.
+
+    An entry may carry a tag (e.g. an ETag). Expired entries with a tag stay
+    until LRU eviction, and validator() returns them, so the caller can ask
+    the source whether they changed instead of downloading them again.
+    """
+
+    def __init__(self, max_entries: int, ttl: float, negative_ttl: float, stale_ttl: float = 0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stale_ttl = stale_ttl
+        # key -> (value, stored_at, expires_at, tag); ordered from least to most recently used
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float, float, Optional[str]]]" = OrderedDict()
+        self.hits = 0
+        self.negative_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Any:
+        """Return the cached value for key, or MISSING if absent or expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return MISSING
+        value, _, expires_at, tag = entry
+        now = time.monotonic()
+        if expires_at <= now:
+            if tag is None and (value is None or expires_at + self.stale_ttl <= now):
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return MISSING
+        self._entries.move_to_end(key)
+        self.hits += 1
+        if value is None:
+            self.negative_hits += 1
+        return value
+
+    def get_stale(self, key: Hashable) -> Any:
+        """Return (value, age in seconds) for an expired entry still in its stale window, or MISSING."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return MISSING
+        value, stored_at, expires_at, _ = entry
+        now = time.monotonic()
+        if value is None or not expires_at <= now < expires_at + self.stale_ttl:
+            return MISSING
+        self.stale_hits += 1
+        return value, now - stored_at
+
+    def validator(self, key: Hashable) -> Any:
+        """Return (value, tag) for any entry of key that has a tag, fresh or expired, or MISSING."""
+        entry = self._entries.get(key)
+        if entry is None or entry[3] is None:
+            return MISSING
+        return entry[0], entry[3]
+
+    def put(self, key: Hashable, value: Any, tag: Optional[str] = None) -> None:
+        """Cache value for key, evicting the least recently used entries if full."""
+        ttl = self.negative_ttl if value is None else self.ttl
+        now = time.monotonic()
+        self._entries[key] = (value, now, now + ttl, tag)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def refresh(self, key: Hashable, value: Any, tag: Optional[str] = None) -> bool:
+        """Replace the value of an already cached key; return False if it was not cached."""
+        if key not in self._entries:
+            return False
+        self.put(key, value, tag)
+        return True
+
+    def invalidate(self, key: Hashable) -> None:
+        """Drop key from the cache if it is present."""
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Drop every cached entry (counters are kept)."""
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss/eviction counters for tuning the cache."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "negative_ttl": self.negative_ttl,
+            "stale_ttl": self.stale_ttl,
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+class LookupGuard:
+    """Tells a cache filler which answers may have gone stale while it waited for them.
+
+    Call begin() with the keys before asking the source and end() with its
+    token once the answers are in; end() returns the keys that saw no
+    change in between, whose answers are safe to cache. changed(key) marks
+    one key as changed, changed_all() every key (e.g. after missed events).
+    Only keys with a lookup in flight are tracked, so memory stays bounded.
+    """
+
+    def __init__(self):
+        self.epoch = 0
+        # key -> [lookups in flight, changes seen while any was in flight]
+        self._keys: Dict[Hashable, List[int]] = {}
+
+    def begin(self, keys: Iterable[Hashable]) -> Tuple[int, Dict[Hashable, int]]:
+        seen = {}
+        for key in dict.fromkeys(keys):
+            entry = self._keys.setdefault(key, [0, 0])
+            entry[0] += 1
+            seen[key] = entry[1]
+        return self.epoch, seen
+
+    def changed(self, key: Hashable) -> None:
+        entry = self._keys.get(key)
+        if entry is not None:
+            entry[1] += 1
+
+    def changed_all(self) -> None:
+        self.epoch += 1
+
+    def end(self, token: Tuple[int, Dict[Hashable, int]]) -> Set[Hashable]:
+        """Finish a lookup started with begin() and return its keys that did not change meanwhile."""
+        epoch, seen = token
+        unchanged = set()
+        for key, changes in seen.items():
+            entry = self._keys[key]
+            if epoch == self.epoch and entry[1] == changes:
+                unchanged.add(key)
+            entry[0] -= 1
+            if not entry[0]:
+                del self._keys[key]
+        return unchanged
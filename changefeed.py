@@ -0,0 +1,114 @@
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Set, Tuple
+import asyncio
+import json
+import threading
+import uuid
+
+class ChangeFeed:
+    """In-memory log of create/update/delete events with increasing sequence numbers.
+
+    Only the most recent max_events are retained. Subscribers that fall
+    further behind than that are told to reset instead of silently missing
+    events. feed_id changes every time the process starts, so a subscriber
+    can tell a restarted feed (whose sequence numbers start again at 1)
+    from the one it was following.
+    """
+
+    def __init__(self, max_events: int = 10000):
+        self.feed_id = uuid.uuid4().hex
+        self.last_seq = 0
+        self._events: Deque[Dict[str, Any]] = deque(maxlen=max_events)
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._waiters: Set[asyncio.Event] = set()
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Attach the event loop that subscribers run on, so publishers can wake them."""
+        self._loop = loop
+
+    def publish(self, event_type: str, student_id: str, record: Optional[Dict[str, Any]] = None,
+                etag: Optional[str] = None) -> Dict[str, Any]:
+        """Append an event to the feed. Safe to call from worker threads."""
+        with self._lock:
+            self.last_seq += 1
+            event = {"seq": self.last_seq, "type": event_type, "student_id": student_id, "record": record,
+                     "etag": etag}
+            self._events.append(event)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake_subscribers)
+        return event
+
+    def _wake_subscribers(self) -> None:
+        for waiter in self._waiters:
+            waiter.set()
+
+    def events_since(self, seq: int) -> Tuple[List[Dict[str, Any]], bool]:
+        """Return retained events after seq, and whether some were already dropped."""
+        with self._lock:
+            if not self._events:
+                return [], seq < self.last_seq
+            oldest = self._events[0]["seq"]
+            start = max(seq + 1 - oldest, 0)
+            events = [self._events[i] for i in range(start, len(self._events))]
+            return events, seq + 1 < oldest
+
+    async def subscribe(self, since: Optional[int] = None, feed_id: Optional[str] = None,
+                        heartbeat: float = 15.0) -> AsyncIterator[Dict[str, Any]]:
+        """Yield control messages and events after since, then follow new events.
+
+        The first message is always a "hello" (continuing where the subscriber
+        left off) or a "reset" (the subscriber must drop everything it derived
+        from the feed). None is yielded every heartbeat seconds while idle.
+        """
+        waiter = asyncio.Event()
+        self._waiters.add(waiter)
+        try:
+            if since is None:
+                since = self.last_seq
+                yield {"seq": since, "type": "hello", "feed_id": self.feed_id}
+            else:
+                reset = (feed_id is not None and feed_id != self.feed_id) or since > self.last_seq
+                if reset or self.events_since(since)[1]:
+                    # The subscriber drops everything it derived from the feed,
+                    # so it only needs events from now on
+                    since = self.last_seq
+                    yield {"seq": since, "type": "reset", "feed_id": self.feed_id}
+                else:
+                    yield {"seq": since, "type": "hello", "feed_id": self.feed_id}
+
+            while True:
+                waiter.clear()
+                events, missed = self.events_since(since)
+                if missed:
+                    since = self.last_seq
+                    yield {"seq": since, "type": "reset", "feed_id": self.feed_id}
+                    continue
+                for event in events:
+                    since = event["seq"]
+                    yield event
+                if not events:
+                    try:
+                        await asyncio.wait_for(waiter.wait(), timeout=heartbeat)
+                    except asyncio.TimeoutError:
+                        yield None
+        finally:
+            self._waiters.discard(waiter)
+
+def format_sse(event: Optional[Dict[str, Any]]) -> str:
+    """Encode a feed message as a Server-Sent Events frame (None is a heartbeat)."""
+    if event is None:
+        return ": heartbeat\n\n"
+    return f"id: {event['seq']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+async def read_sse(stream: asyncio.StreamReader) -> AsyncIterator[Dict[str, Any]]:
+    """Parse Server-Sent Events frames from a byte stream into feed messages."""
+    data_lines: List[str] = []
+    async for raw_line in stream:
+        line = raw_line.decode("utf-8").rstrip("\r\n")
+        if not line:
+            if data_lines:
+                yield json.loads("\n".join(data_lines))
+                data_lines = []
+        elif line.startswith("data:"):
+            data_lines.append(line[5:].lstrip())
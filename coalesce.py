@@ -0,0 +1,143 @@
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+import asyncio
+
+class SingleFlight:
+    """Let concurrent callers asking for the same key share one in-flight call.
+
+    The first caller (the leader) starts the call as a task; callers that
+    arrive while it is running await the same task instead of starting
+    their own. The task is shielded, so a cancelled caller does not cancel
+    the call for everyone else.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the result of fn(), sharing it with concurrent callers for key."""
+        task = self._calls.get(key)
+        if task is not None:
+            self.shared += 1
+        else:
+            self.calls += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task)
+
+    async def do_many(self, keys: List[Hashable],
+                      fn_many: Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]]) -> Dict[Hashable, Any]:
+        """Like do() for several keys at once, returning key -> result.
+
+        Keys with no call in flight are fetched together with one
+        fn_many(keys) call, which must answer every key it is given; the
+        others share the calls already running.
+        """
+        keys = list(dict.fromkeys(keys))
+        leading = [key for key in keys if key not in self._calls]
+        self.shared += len(keys) - len(leading)
+        if leading:
+            batch = asyncio.ensure_future(fn_many(leading))
+            for key in leading:
+                self.calls += 1
+                task = asyncio.ensure_future(self._pick(batch, key))
+                self._calls[key] = task
+                task.add_done_callback(lambda done, key=key: self._finish(key, done))
+        tasks = [self._calls[key] for key in keys]
+        return dict(zip(keys, await asyncio.shield(asyncio.gather(*tasks))))
+
+    @staticmethod
+    async def _pick(batch: asyncio.Future, key: Hashable) -> Any:
+        return (await batch)[key]
+
+    def _finish(self, key: Hashable, task: asyncio.Future) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved even if every caller went away
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        requested = self.calls + self.shared
+        return {
+            "in_flight": len(self._calls),
+            "calls": self.calls,
+            "shared": self.shared,
+            "shared_ratio": self.shared / requested if requested else 0.0,
+        }
+
+class MicroBatcher:
+    """Merge lookups for different keys made within a short window into one batch call.
+
+    fetch_many receives the list of distinct keys collected during the
+    window and must return a dict with a result for each of them. A batch
+    is sent early once max_batch keys are waiting.
+    """
+
+    def __init__(self, fetch_many: Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]],
+                 window: float, max_batch: int):
+        self.fetch_many = fetch_many
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: Dict[Hashable, asyncio.Future] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.lookups = 0
+        self.merged = 0
+        self.batches = 0
+
+    async def get(self, key: Hashable) -> Any:
+        """Return the result for key from the next batch call."""
+        self.lookups += 1
+        future = self._pending.get(key)
+        if future is not None:
+            self.merged += 1
+        else:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._pending[key] = future
+            if len(self._pending) >= self.max_batch:
+                self._flush()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.window, self._flush)
+        return await asyncio.shield(future)
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, {}
+        if pending:
+            self.batches += 1
+            asyncio.ensure_future(self._run(pending))
+
+    async def _run(self, pending: Dict[Hashable, asyncio.Future]) -> None:
+        try:
+            results = await self.fetch_many(list(pending))
+        except asyncio.CancelledError:
+            for future in pending.values():
+                future.cancel()
+            raise
+        except Exception as exc:
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(exc)
+                    # Mark the exception as retrieved even if every caller went away
+                    future.exception()
+        else:
+            for key, future in pending.items():
+                if not future.done():
+                    future.set_result(results.get(key))
+
+    def stats(self) -> Dict[str, Any]:
+        sent = self.lookups - self.merged
+        return {
+            "window": self.window,
+            "max_batch": self.max_batch,
+            "pending": len(self._pending),
+            "lookups": self.lookups,
+            "merged": self.merged,
+            "batches": self.batches,
+            "average_batch_size": sent / self.batches if self.batches else 0.0,
+        }
@@ -0,0 +1,97 @@
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+import json
+import threading
+
+from starlette.responses import Response
+
+from startup import optional_module
+
+# orjson is optional (dumps() falls back to the json module) and only
+# imported by the first dumps() call, which only the FAST_JSON path makes
+orjson = optional_module("orjson")
+
+def dumps(obj: Any) -> bytes:
+    """Compact JSON bytes for plain Python data, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def json_array(items: Iterable[bytes]) -> bytes:
+    """Join already encoded JSON values into a JSON array."""
+    return b"[" + b",".join(items) + b"]"
+
+def json_object(pairs: Iterable[Tuple[str, bytes]]) -> bytes:
+    """Build a JSON object from keys and already encoded JSON values."""
+    return b"{" + b",".join(dumps(key) + b":" + value for key, value in pairs) + b"}"
+
+def ndjson_line(data: bytes) -> bytes:
+    return data + b"\n"
+
+def keyed_records(keys: Iterable[str], lookup: Callable[[str], Optional[bytes]]) -> bytes:
+    """A JSON object of key -> encoded record, skipping keys whose record is gone."""
+    return json_object((key, data) for key in keys for data in (lookup(key),) if data is not None)
+
+def record_page(items: List[bytes], next_cursor: Optional[str]) -> bytes:
+    """The {"items", "next_cursor"} page of the list endpoints, from encoded records."""
+    return json_object((("items", json_array(items)), ("next_cursor", dumps(next_cursor))))
+
+class RawJSONResponse(Response):
+    """A response whose content is already encoded JSON.
+
+    Returning it from an endpoint skips FastAPI's response_model validation
+    and encoding, while the route keeps its response_model for OpenAPI.
+    """
+
+    media_type = "application/json"
+
+class RecordJSON:
+    """JSON bytes of the records in a store, encoded on first read and dropped on write.
+
+    Records in the store were validated when they were written, so their
+    encoded form can be reused until the record changes. At most
+    max_entries records are kept encoded; the oldest encodings are dropped
+    first.
+
+    get() is called from the threadpool (sync read endpoints) while writes
+    invalidate on the event loop. An encoding is only kept if no
+    invalidation happened while it was being made, so a record read just
+    before a write can never stay cached after it.
+    """
+
+    def __init__(self, store: Mapping[str, Any], max_entries: int):
+        self.store = store
+        self.max_entries = max_entries
+        self._encoded: Dict[str, bytes] = {}
+        self._invalidations = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        """The record for key as JSON bytes, or None if it is not in the store."""
+        with self._lock:
+            data = self._encoded.get(key)
+            if data is not None:
+                self.hits += 1
+                return data
+            invalidations = self._invalidations
+        record = self.store.get(key)
+        if record is None:
+            return None
+        data = dumps(record.dict())
+        with self._lock:
+            self.misses += 1
+            if self.max_entries > 0 and self._invalidations == invalidations:
+                if key not in self._encoded and len(self._encoded) >= self.max_entries:
+                    del self._encoded[next(iter(self._encoded))]
+                self._encoded[key] = data
+        return data
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._invalidations += 1
+            self._encoded.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"encoded": len(self._encoded), "max_entries": self.max_entries,
+                "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,45 @@
+from collections import defaultdict
+from typing import Dict, Optional, Set
+
+class AcademicIndexes:
+    """Secondary indexes over academic records.
+
+    by_status maps enrollment_status to student ids and by_course is an
+    inverted index from course name to the ids of students taking it. Both
+    are kept up to date incrementally by add/remove, so a filtered lookup
+    costs time proportional to the result instead of a full scan.
+    """
+
+    def __init__(self):
+        self.by_status: Dict[str, Set[str]] = defaultdict(set)
+        self.by_course: Dict[str, Set[str]] = defaultdict(set)
+
+    def add(self, student_id: str, record) -> None:
+        self.by_status[record.enrollment_status].add(student_id)
+        for course in record.courses:
+            self.by_course[course].add(student_id)
+
+    def remove(self, student_id: str, record) -> None:
+        _discard(self.by_status, record.enrollment_status, student_id)
+        for course in record.courses:
+            _discard(self.by_course, course, student_id)
+
+    def lookup(self, enrollment_status: Optional[str] = None, course: Optional[str] = None) -> Set[str]:
+        """Return the ids matching every given filter (at least one must be given)."""
+        matches = []
+        if enrollment_status is not None:
+            matches.append(self.by_status.get(enrollment_status, set()))
+        if course is not None:
+            matches.append(self.by_course.get(course, set()))
+        matches.sort(key=len)
+        result = set(matches[0])
+        for other in matches[1:]:
+            result.intersection_update(other)
+        return result
+
+def _discard(index: Dict[str, Set[str]], value: str, student_id: str) -> None:
+    ids = index.get(value)
+    if ids is not None:
+        ids.discard(student_id)
+        if not ids:
+            del index[value]
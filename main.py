@@ -1,8 +1,47 @@
+import importlib
 import multiprocessing
+import os
+import secrets
+import socket
+import urllib.request
 import uvicorn
 import time
 import sys
 
+# Worker processes per service. With more than one, the workers share the
+# public port and each owns a hash partition of the student ids; worker i
+# also listens on 127.0.0.1:<internal port + i> for requests routed to it
+# by the other workers.
+SERVICE1_WORKERS = int(os.getenv("SERVICE1_WORKERS", "1"))
+SERVICE2_WORKERS = int(os.getenv("SERVICE2_WORKERS", "1"))
+SERVICE1_INTERNAL_PORT = int(os.getenv("SERVICE1_INTERNAL_PORT", "18080"))
+SERVICE2_INTERNAL_PORT = int(os.getenv("SERVICE2_INTERNAL_PORT", "18180"))
+# Shared by the workers of a service, which only trust requests carrying it
+# as routed by one another (workers.py); a new one for every launch by default
+WORKER_SECRET = os.getenv("WORKER_SECRET") or secrets.token_hex(16)
+
+# Instances (shards) per service. With more than one, shard i listens on
+# <shard port + i>, owns the student ids that consistent hashing gives it,
+# and a router on the public port places each request on its shard(s).
+SERVICE1_SHARDS = int(os.getenv("SERVICE1_SHARDS", "1"))
+SERVICE2_SHARDS = int(os.getenv("SERVICE2_SHARDS", "1"))
+SERVICE1_SHARD_PORT = int(os.getenv("SERVICE1_SHARD_PORT", "8180"))
+SERVICE2_SHARD_PORT = int(os.getenv("SERVICE2_SHARD_PORT", "8280"))
+
+# Set PRELOAD=1 to import the heavy third-party modules once here, before the
+# service processes are forked, so each starts with them already loaded (and
+# shares their memory copy-on-write). The service modules themselves are
+# still imported in every process, since they read per-worker settings at
+# import time. Only has an effect where multiprocessing forks (Linux).
+PRELOAD = os.getenv("PRELOAD", "0") == "1"
+PRELOAD_MODULES = (
+    "fastapi", "fastapi.responses", "pydantic", "starlette.middleware.base", "aiohttp",
+    "uvicorn.loops.auto", "uvicorn.protocols.http.auto", "uvicorn.protocols.websockets.auto", "uvicorn.lifespan.on",
+)
+
+# Service 2 is started once service1 answers GET /ready, or after this many seconds
+SERVICE1_READY_TIMEOUT = float(os.getenv("SERVICE1_READY_TIMEOUT", "30"))
+
 def run_service1():
     """Run Service 1 (Student Personal Information Service) on port 8080"""
     from service1 import app as app1
@@ -13,31 +52,137 @@ def run_service2():
     from service2 import app as app2
     uvicorn.run(app2, host="0.0.0.0", port=8081)
 
+def run_router(service, port, shard_urls):
+    """Run the shard router for service on port"""
+    from router import make_router
+    from sharding import ShardMap
+    uvicorn.run(make_router(service, ShardMap(shard_urls)), host="0.0.0.0", port=port)
+
+def preload():
+    for name in PRELOAD_MODULES:
+        importlib.import_module(name)
+
+def wait_ready(url, timeout):
+    """Wait until url/ready answers 200; False if it has not after timeout seconds."""
+    # Local address, so any configured HTTP proxy is bypassed
+    opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with opener.open(url + "/ready", timeout=1) as response:
+                if response.status == 200:
+                    return True
+        except OSError:
+            pass
+        time.sleep(0.02)
+    return False
+
+def worker_urls(internal_port, workers):
+    return [f"http://127.0.0.1:{internal_port + index}" for index in range(workers)]
+
+def run_worker(module, public_socket, index, urls, env):
+    """Run one worker of a service on the shared public socket plus its internal port."""
+    # Set before the service module is imported, since it reads them at import time
+    os.environ.update(env)
+    os.environ["WORKER_INDEX"] = str(index)
+    os.environ["WORKER_URLS"] = ",".join(urls)
+    app = __import__(module).app
+    internal_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    internal_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    internal_socket.bind(("127.0.0.1", int(urls[index].rsplit(":", 1)[1])))
+    config = uvicorn.Config(app, host="0.0.0.0", port=public_socket.getsockname()[1])
+    uvicorn.Server(config).run(sockets=[public_socket, internal_socket])
+
+def start_service(module, port, internal_port, workers, env=None):
+    """Start a service as `workers` processes sharing one listening socket on port."""
+    public_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    public_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    public_socket.bind(("0.0.0.0", port))
+    public_socket.set_inheritable(True)
+    urls = worker_urls(internal_port, workers)
+    processes = []
+    for index in range(workers):
+        worker_env = {"WORKER_SECRET": WORKER_SECRET, **(env or {})}
+        process = multiprocessing.Process(target=run_worker, args=(module, public_socket, index, urls, worker_env))
+        process.start()
+        processes.append(process)
+    public_socket.close()
+    return processes
+
+def start_shards(module, shards, shard_port, internal_port, workers, env):
+    """Start `shards` instances of a service, each with `workers` workers.
+
+    Each shard persists to its own shard-N subdirectory of the data directory.
+    Returns the processes, the shard URLs and the URLs of every change feed.
+    """
+    data_dir_name = "SERVICE1_DATA_DIR" if module == "service1" else "SERVICE2_DATA_DIR"
+    processes, shard_urls, feed_urls = [], [], []
+    for shard in range(shards):
+        shard_env = dict(env)
+        if os.getenv(data_dir_name):
+            shard_env[data_dir_name] = os.path.join(os.environ[data_dir_name], f"shard-{shard}")
+        shard_internal_port = internal_port + shard * workers
+        processes += start_service(module, shard_port + shard, shard_internal_port, workers, shard_env)
+        shard_urls.append(f"http://127.0.0.1:{shard_port + shard}")
+        feed_urls += worker_urls(shard_internal_port, workers) if workers > 1 else shard_urls[-1:]
+    return processes, shard_urls, feed_urls
+
 if __name__ == "__main__":
     print("Starting both microservices...")
-    print("Service 1 (Personal Info): http://localhost:8080")
-    print("Service 2 (Academic Info): http://localhost:8081")
+    print(f"Service 1 (Personal Info): http://localhost:8080 "
+          f"({SERVICE1_SHARDS} shard(s) x {SERVICE1_WORKERS} worker(s))")
+    print(f"Service 2 (Academic Info): http://localhost:8081 "
+          f"({SERVICE2_SHARDS} shard(s) x {SERVICE2_WORKERS} worker(s))")
     print("Press Ctrl+C to stop all services")
-    
-    # Create processes for each service
-    service1_process = multiprocessing.Process(target=run_service1)
-    service2_process = multiprocessing.Process(target=run_service2)
-    
+
+    processes = []
+    if PRELOAD:
+        preload()
     try:
-        # Start both services
-        service1_process.start()
-        time.sleep(1)  # Small delay to ensure service1 starts first
-        service2_process.start()
-        
-        # Wait for both processes to complete
-        service1_process.join()
-        service2_process.join()
-        
+        # Start both services. Service 2 looks students up on the owning
+        # service1 shard and follows every service1 worker's change feed directly.
+        service2_env = {}
+        if SERVICE1_SHARDS > 1:
+            started, shard_urls, feed_urls = start_shards("service1", SERVICE1_SHARDS, SERVICE1_SHARD_PORT,
+                                                          SERVICE1_INTERNAL_PORT, SERVICE1_WORKERS, {})
+            processes += started
+            processes.append(multiprocessing.Process(target=run_router, args=("service1", 8080, shard_urls)))
+            processes[-1].start()
+            service2_env["SERVICE1_SHARD_URLS"] = ",".join(shard_urls)
+            service2_env["SERVICE1_FEED_URLS"] = ",".join(feed_urls)
+        elif SERVICE1_WORKERS > 1:
+            processes += start_service("service1", 8080, SERVICE1_INTERNAL_PORT, SERVICE1_WORKERS)
+            service2_env["SERVICE1_FEED_URLS"] = ",".join(worker_urls(SERVICE1_INTERNAL_PORT, SERVICE1_WORKERS))
+        else:
+            processes.append(multiprocessing.Process(target=run_service1))
+            processes[-1].start()
+        service2_env = {name: value for name, value in service2_env.items() if name not in os.environ}
+        # Start service2 once service1 can answer its lookups and change feed
+        if not wait_ready("http://127.0.0.1:8080", SERVICE1_READY_TIMEOUT):
+            print(f"Service 1 not ready after {SERVICE1_READY_TIMEOUT:g}s; starting Service 2 anyway")
+
+        if SERVICE2_SHARDS > 1:
+            started, shard_urls, _ = start_shards("service2", SERVICE2_SHARDS, SERVICE2_SHARD_PORT,
+                                                  SERVICE2_INTERNAL_PORT, SERVICE2_WORKERS, service2_env)
+            processes += started
+            processes.append(multiprocessing.Process(target=run_router, args=("service2", 8081, shard_urls)))
+            processes[-1].start()
+        elif SERVICE2_WORKERS > 1:
+            processes += start_service("service2", 8081, SERVICE2_INTERNAL_PORT, SERVICE2_WORKERS, service2_env)
+        else:
+            os.environ.update(service2_env)
+            processes.append(multiprocessing.Process(target=run_service2))
+            processes[-1].start()
+
+        # Wait for all processes to complete
+        for process in processes:
+            process.join()
+
     except KeyboardInterrupt:
         print("\nShutting down services...")
-        service1_process.terminate()
-        service2_process.terminate()
-        service1_process.join()
-        service2_process.join()
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
         print("All services stopped.")
-        sys.exit(0)
\ No newline at end of file
+        sys.exit(0)
@@ -0,0 +1,245 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+import asyncio
+import functools
+import os
+import threading
+import time
+
+from fastapi.routing import APIRoute
+from starlette.responses import Response
+
+# Set METRICS_ENABLED=0 to skip request instrumentation (/metrics then only
+# reports the gauges), e.g. to measure its overhead with benchmarks.loadgen
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+# Latency histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+class Metric:
+    """One metric family; samples are kept per tuple of label values."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, values)} {_number(value)}")
+        return lines
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *label_values: str, amount: float = 1) -> None:
+        self.inc(*label_values, amount=-amount)
+
+    def set(self, *label_values: str, value: float) -> None:
+        with self._lock:
+            self._values[label_values] = value
+
+class CallbackGauge(Metric):
+    """Gauge whose value is read from a function at scrape time (e.g. a store size)."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, read: Callable[[], float]):
+        super().__init__(name, help)
+        self.read = read
+
+    def render(self) -> List[str]:
+        return super().render() + [f"{self.name} {_number(self.read())}"]
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        # label values -> [count per bucket (last is +Inf), sum]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(label_values)
+            if state is None:
+                state = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, *label_values: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            snapshot = sorted((values, list(counts), total) for values, (counts, total) in self._values.items())
+        for values, counts, total in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _labels(self.labels + ("le",), values + (_number(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, values)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labels, values)} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    """The metrics of one service, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help, labels))
+
+    def callback_gauge(self, name: str, help: str, read: Callable[[], float]) -> CallbackGauge:
+        return self.register(CallbackGauge(name, help, read))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+class HttpMetrics:
+    """Request metrics recorded by MetricsMiddleware and instrument_handlers."""
+
+    def __init__(self, registry: MetricsRegistry):
+        self.requests = registry.counter(
+            "http_requests_total", "Requests handled, by route template and status code.",
+            ("method", "route", "status"))
+        self.duration = registry.histogram(
+            "http_request_duration_seconds", "Time from request start to the end of the response, by route.",
+            ("method", "route"))
+        self.handler_duration = registry.histogram(
+            "http_handler_duration_seconds",
+            "Time spent in the endpoint function itself; the rest of the request duration is "
+            "parsing, validation and serialization.", ("route",))
+        self.in_flight = registry.gauge("http_requests_in_flight", "Requests currently being handled.")
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status and in-flight count per route template."""
+
+    def __init__(self, app, metrics: HttpMetrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        self.metrics.in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.metrics.in_flight.dec()
+            # FastAPI leaves the matched route in the scope; templates keep label cardinality low
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            self.metrics.duration.observe(elapsed, scope["method"], path)
+            self.metrics.requests.inc(scope["method"], path, str(status))
+
+def instrument_handlers(app, metrics: HttpMetrics) -> None:
+    """Time every endpoint function of app, separately from the framework work around it.
+
+    Must be called after all routes are added.
+    """
+    for route in app.routes:
+        if isinstance(route, APIRoute):
+            route.dependant.call = _timed(route.dependant.call, metrics.handler_duration, route.path)
+
+def _timed(call, histogram: Histogram, path: str):
+    # Keep the function sync or async as it was, since FastAPI decided how to run it
+    if asyncio.iscoroutinefunction(call):
+        @functools.wraps(call)
+        async def timed_async(**values):
+            with histogram.time(path):
+                return await call(**values)
+        return timed_async
+
+    @functools.wraps(call)
+    def timed_sync(**values):
+        with histogram.time(path):
+            return call(**values)
+    return timed_sync
+
+def install_metrics(app, registry: MetricsRegistry) -> None:
+    """Add GET /metrics to app and, unless METRICS_ENABLED=0, the request instrumentation.
+
+    Call it after all routes are added, and before any middleware that should
+    run outside it (e.g. worker routing, so forwarded requests are measured
+    once, by the worker that handles them).
+    """
+    @app.get("/metrics", include_in_schema=False)
+    def read_metrics():
+        return Response(registry.render(), media_type=CONTENT_TYPE)
+
+    if METRICS_ENABLED:
+        metrics = HttpMetrics(registry)
+        instrument_handlers(app, metrics)
+        app.add_middleware(MetricsMiddleware, metrics=metrics)
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
@@ -0,0 +1,290 @@
+from typing import Any, Dict, List, Optional
+import json
+import os
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from startup import optional_module
+
+# Both optional and imported on first use: without brotli only gzip is
+# offered, without msgpack bodies stay JSON
+brotli = optional_module("brotli")
+msgpack = optional_module("msgpack")
+
+# Set COMPRESSION_ENABLED=0 to never compress responses. Bodies shorter than
+# COMPRESSION_MIN_SIZE bytes are sent as they are, since compressing them
+# costs more time than it saves on the wire.
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "1") == "1"
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+MSGPACK_TYPE = "application/msgpack"
+MSGPACK_TYPES = (MSGPACK_TYPE, "application/x-msgpack", "application/vnd.msgpack")
+
+# Added inside the quotes of the ETag of an encoded response, since each
+# encoding is a different representation with its own (strong) validator
+VARIANT_SUFFIXES = ("-msgpack", "-gzip", "-br")
+
+def _weights(header: Optional[str]) -> Dict[str, float]:
+    """Parse an Accept or Accept-Encoding header into {value: q}."""
+    weights = {}
+    for part in (header or "").split(","):
+        value, _, params = part.strip().partition(";")
+        if not value:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, number = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(number)
+                except ValueError:
+                    q = 0.0
+        weights[value.strip().lower()] = q
+    return weights
+
+def choose_coding(accept_encoding: Optional[str]) -> Optional[str]:
+    """The content coding to compress with ("br" or "gzip"), or None."""
+    weights = _weights(accept_encoding)
+    offered = [coding for coding in (("br", "gzip") if brotli is not None else ("gzip",))
+               if weights.get(coding, weights.get("*", 0)) > 0]
+    if not offered:
+        return None
+    # Highest q wins; on a tie the order above (brotli first) decides
+    return max(offered, key=lambda coding: weights.get(coding, weights.get("*", 0)))
+
+def accepts_msgpack(accept: Optional[str]) -> bool:
+    """Whether an Accept header asks for MessagePack at least as much as for JSON."""
+    if msgpack is None:
+        return False
+    weights = _weights(accept)
+    wanted = max((weights.get(media_type, 0) for media_type in MSGPACK_TYPES), default=0)
+    return wanted > 0 and wanted >= weights.get("application/json", 0)
+
+def is_msgpack(content_type: Optional[str]) -> bool:
+    return (content_type or "").split(";")[0].strip().lower() in MSGPACK_TYPES
+
+def variant_etag(etag: str, suffix: str) -> str:
+    """The ETag of an encoded representation: etag with suffix inside its quotes."""
+    return etag[:-1] + suffix + '"' if etag.endswith('"') else etag
+
+def strip_variant(tag: str) -> str:
+    """The app's own ETag for a tag that may name an encoded representation."""
+    tag = tag.strip()
+    if not tag.endswith('"'):
+        return tag
+    value = tag[:-1]
+    stripped = True
+    while stripped:
+        stripped = False
+        for suffix in VARIANT_SUFFIXES:
+            if value.endswith(suffix):
+                value = value[:-len(suffix)]
+                stripped = True
+    return value + '"'
+
+def pack(document: Any) -> bytes:
+    return msgpack.packb(document, use_bin_type=True)
+
+def unpack(data: bytes) -> Any:
+    return msgpack.unpackb(data, raw=False)
+
+class _Compressor:
+    """Incremental gzip or brotli compression of one response body."""
+
+    def __init__(self, coding: str):
+        if coding == "br":
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+            self._zlib = None
+        else:
+            self._brotli = None
+            # wbits=31 writes a gzip header and trailer
+            self._zlib = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes) -> bytes:
+        """Compress data and flush it, so a streamed line reaches the client right away."""
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self._brotli is not None:
+            return self._brotli.process(data) + self._brotli.finish()
+        return self._zlib.compress(data) + self._zlib.flush()
+
+class NegotiationMiddleware:
+    """ASGI middleware for content negotiation of bodies.
+
+    Request bodies sent as MessagePack are turned into JSON before the app
+    sees them. JSON responses are re-encoded as MessagePack when the Accept
+    header prefers it, and any response body of at least min_size bytes is
+    compressed with brotli or gzip when Accept-Encoding allows it. Streamed
+    responses are compressed chunk by chunk; server-sent events and bodies
+    that already have a Content-Encoding are left alone.
+
+    Every response that could have been encoded differently carries Vary
+    for the headers that decide it. An encoded response's ETag gets the
+    encodings as a suffix (VARIANT_SUFFIXES); the suffixes are taken off
+    If-None-Match and If-Match before the app compares them, and a 304
+    answers with the tag the client sent.
+    """
+
+    def __init__(self, app, compression: bool = COMPRESSION_ENABLED, min_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.compression = compression
+        self.min_size = min_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (msgpack is None and not self.compression):
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        if msgpack is not None and is_msgpack(headers.get("content-type")):
+            scope, receive = await _json_request(scope, receive)
+        if_none_match = headers.get("if-none-match")
+        if if_none_match is not None or "if-match" in headers:
+            scope = _without_variants(scope)
+        to_msgpack = accepts_msgpack(headers.get("accept"))
+        coding = choose_coding(headers.get("accept-encoding")) if self.compression else None
+        responder = _Responder(send, to_msgpack, coding, self.min_size, self.compression, if_none_match)
+        await self.app(scope, receive, responder.send)
+
+def _without_variants(scope):
+    """scope with the variant suffixes taken off the tags of If-None-Match and If-Match."""
+    raw = []
+    for name, value in scope["headers"]:
+        if name in (b"if-none-match", b"if-match"):
+            tags = value.decode("latin-1").split(",")
+            value = ", ".join(strip_variant(tag) for tag in tags).encode("latin-1")
+        raw.append((name, value))
+    return {**scope, "headers": raw}
+
+async def _json_request(scope, receive):
+    """Read a MessagePack request body and present it to the app as JSON."""
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    try:
+        body = json.dumps(unpack(b"".join(chunks))).encode("utf-8")
+    except (ValueError, TypeError):
+        # Let the app reject it as invalid JSON
+        body = b"".join(chunks)
+    raw = [(name, value) for name, value in scope["headers"] if name not in (b"content-type", b"content-length")]
+    raw += [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode("latin-1"))]
+    sent = False
+
+    async def replay():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+    return {**scope, "headers": raw}, replay
+
+class _Responder:
+    """The send() of one response: buffers what it must, re-encodes and compresses."""
+
+    def __init__(self, send, to_msgpack: bool, coding: Optional[str], min_size: int, compression: bool,
+                 if_none_match: Optional[str]):
+        self._send = send
+        self.to_msgpack = to_msgpack
+        self.coding = coding
+        self.min_size = min_size
+        self.compression = compression
+        self.if_none_match = if_none_match
+        self._start: Optional[dict] = None
+        self._chunks: List[bytes] = []
+        self._compressor: Optional[_Compressor] = None
+        self._passthrough = False
+
+    async def send(self, message) -> None:
+        if message["type"] == "http.response.start":
+            self._start = message
+            headers = MutableHeaders(raw=message["headers"])
+            content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+            if message["status"] in (204, 304):
+                # No body: sent as it is, but varying like the full answer would
+                negotiable_type = compressible = True
+                self.to_msgpack = False
+                self.coding = None
+                if message["status"] == 304 and "etag" in headers:
+                    headers["etag"] = self._requested_tag(headers["etag"])
+            else:
+                negotiable_type = content_type == "application/json"
+                compressible = "content-encoding" not in headers and content_type != "text/event-stream"
+                self.to_msgpack = self.to_msgpack and negotiable_type
+                if not compressible:
+                    self.coding = None
+            if msgpack is not None and negotiable_type:
+                _add_vary(headers, "Accept")
+            if self.compression and compressible:
+                _add_vary(headers, "Accept-Encoding")
+            self._passthrough = not self.to_msgpack and self.coding is None
+            if self._passthrough:
+                await self._send(message)
+            return
+        if message["type"] != "http.response.body" or self._passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self._compressor is not None:
+            # Already streaming compressed chunks
+            data = self._compressor.chunk(body) if more_body else self._compressor.finish(body)
+            await self._send({"type": "http.response.body", "body": data, "more_body": more_body})
+            return
+        if self.to_msgpack:
+            self._chunks.append(body)
+            if more_body:
+                return
+            body = pack(json.loads(b"".join(self._chunks)))
+            MutableHeaders(raw=self._start["headers"])["content-type"] = MSGPACK_TYPE
+        if self.coding is not None and (len(body) >= self.min_size or more_body):
+            self._compressor = _Compressor(self.coding)
+            self._set_encoding_headers(more_body)
+            body = self._compressor.chunk(body) if more_body else self._compressor.finish(body)
+        headers = MutableHeaders(raw=self._start["headers"])
+        if not more_body:
+            headers["content-length"] = str(len(body))
+        suffix = ("-msgpack" if self.to_msgpack else "") + (f"-{self.coding}" if self._compressor else "")
+        if suffix and "etag" in headers:
+            headers["etag"] = variant_etag(headers["etag"], suffix)
+        await self._send(self._start)
+        await self._send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+    def _set_encoding_headers(self, streaming: bool) -> None:
+        headers = MutableHeaders(raw=self._start["headers"])
+        headers["content-encoding"] = self.coding
+        if streaming and "content-length" in headers:
+            del headers["content-length"]
+
+    def _requested_tag(self, etag: str) -> str:
+        """The tag of If-None-Match that matched etag, so a 304 confirms the representation the client has."""
+        for tag in (self.if_none_match or "").split(","):
+            tag = tag.strip()
+            if strip_variant(tag[2:] if tag.startswith("W/") else tag) == etag:
+                return tag[2:] if tag.startswith("W/") else tag
+        return etag
+
+def _add_vary(headers: MutableHeaders, name: str) -> None:
+    """Add name to Vary unless it is already listed (a routed answer may carry it)."""
+    vary = headers.get("vary")
+    if vary is None:
+        headers["vary"] = name
+    elif name.lower() not in {value.strip().lower() for value in vary.split(",")}:
+        headers["vary"] = f"{vary}, {name}"
+
+def install_negotiation(app) -> None:
+    """Add NegotiationMiddleware to app.
+
+    Call it last, so it runs outside every other middleware (including
+    worker routing): workers and shards then exchange plain JSON, and only
+    the process facing the client encodes and compresses.
+    """
+    app.add_middleware(NegotiationMiddleware)
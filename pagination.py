@@ -0,0 +1,135 @@
+from bisect import bisect_left, bisect_right
+from typing import Any, AsyncIterator, Callable, List, Optional, Tuple, Union
+import base64
+import binascii
+import threading
+
+from fastapi import HTTPException
+
+class SortedKeys:
+    """Record keys kept in sorted order for stable cursor pagination.
+
+    Keys live in a list of sorted chunks, so an insert or delete only
+    shifts one small chunk instead of the whole key list.
+    """
+
+    def __init__(self, keys: Optional[List[str]] = None, chunk_size: int = 1024):
+        self.chunk_size = chunk_size
+        self._chunks: List[List[str]] = []
+        self._maxes: List[str] = []
+        self._len = 0
+        self._lock = threading.Lock()
+        if keys:
+            ordered = sorted(set(keys))
+            self._chunks = [ordered[i:i + chunk_size] for i in range(0, len(ordered), chunk_size)]
+            self._maxes = [chunk[-1] for chunk in self._chunks]
+            self._len = len(ordered)
+
+    def __len__(self) -> int:
+        return self._len
+
+    def add(self, key: str) -> None:
+        with self._lock:
+            if not self._chunks:
+                self._chunks.append([key])
+                self._maxes.append(key)
+                self._len = 1
+                return
+            index = min(bisect_left(self._maxes, key), len(self._chunks) - 1)
+            chunk = self._chunks[index]
+            position = bisect_left(chunk, key)
+            if position < len(chunk) and chunk[position] == key:
+                return
+            chunk.insert(position, key)
+            self._len += 1
+            self._maxes[index] = chunk[-1]
+            if len(chunk) > 2 * self.chunk_size:
+                self._chunks[index:index + 1] = [chunk[:self.chunk_size], chunk[self.chunk_size:]]
+                self._maxes[index:index + 1] = [chunk[self.chunk_size - 1], chunk[-1]]
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            index = bisect_left(self._maxes, key)
+            if index == len(self._chunks):
+                return
+            chunk = self._chunks[index]
+            position = bisect_left(chunk, key)
+            if position == len(chunk) or chunk[position] != key:
+                return
+            del chunk[position]
+            self._len -= 1
+            if chunk:
+                self._maxes[index] = chunk[-1]
+            else:
+                del self._chunks[index]
+                del self._maxes[index]
+
+    def page_after(self, after: Optional[str], limit: int) -> List[str]:
+        """Return up to limit keys that sort strictly after the given key."""
+        with self._lock:
+            if after is None:
+                index, position = 0, 0
+            else:
+                index = bisect_right(self._maxes, after)
+                position = bisect_right(self._chunks[index], after) if index < len(self._chunks) else 0
+            keys: List[str] = []
+            while index < len(self._chunks) and len(keys) < limit:
+                chunk = self._chunks[index]
+                keys.extend(chunk[position:position + limit - len(keys)])
+                index += 1
+                position = 0
+            return keys
+
+def encode_cursor(key: str) -> str:
+    """Opaque cursor pointing just past key."""
+    return base64.urlsafe_b64encode(key.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: Optional[str]) -> Optional[str]:
+    if cursor is None:
+        return None
+    try:
+        return base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+    except (binascii.Error, UnicodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def paginate(keys: SortedKeys, lookup: Callable[[str], Any], cursor: Optional[str],
+             limit: int) -> Tuple[List[Any], Optional[str]]:
+    """Return one page of records in key order and the cursor for the next page.
+
+    One key past the page is fetched, so the last page has no next cursor
+    even when it is exactly full.
+    """
+    page_keys = keys.page_after(decode_cursor(cursor), limit + 1)
+    more = len(page_keys) > limit
+    del page_keys[limit:]
+    items = [record for record in map(lookup, page_keys) if record is not None]
+    next_cursor = encode_cursor(page_keys[-1]) if more else None
+    return items, next_cursor
+
+def model_line(record: Any) -> str:
+    return record.json() + "\n"
+
+async def ndjson_stream(keys: SortedKeys, lookup: Callable[[str], Any], cursor: Optional[str] = None,
+                        limit: Optional[int] = None, chunk_records: int = 500,
+                        encode: Callable[[Any], Union[str, bytes]] = model_line) -> AsyncIterator[Union[str, bytes]]:
+    """Stream records in key order as newline-delimited JSON.
+
+    Records are serialized a chunk at a time, so the full payload is never
+    built in memory. encode turns one looked-up record into its line; it
+    may return bytes instead of str (e.g. for lookups that return JSON bytes).
+    """
+    after = decode_cursor(cursor)
+    remaining = limit
+    while remaining is None or remaining > 0:
+        batch = chunk_records if remaining is None else min(chunk_records, remaining)
+        page_keys = keys.page_after(after, batch)
+        if not page_keys:
+            break
+        lines = [encode(record) for record in map(lookup, page_keys) if record is not None]
+        if lines:
+            yield lines[0][:0].join(lines)
+        after = page_keys[-1]
+        if remaining is not None:
+            remaining -= len(page_keys)
+        if len(page_keys) < batch:
+            break
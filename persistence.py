@@ -0,0 +1,322 @@
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import asyncio
+import glob
+import json
+import mmap
+import os
+import threading
+import time
+
+# How a commit waits for durability:
+#   always   - every commit fsyncs the log itself
+#   group    - commits wait for a shared fsync issued by a background thread,
+#              so concurrent writers pay for one fsync between them
+#   interval - commits return at once; the log is fsynced every interval seconds
+#   none     - commits only hand the data to the OS
+FSYNC_POLICIES = ("always", "group", "interval", "none")
+
+class CorruptJournalError(Exception):
+    """Raised by recover() for a log entry that cannot be read and is not a torn final write."""
+
+class Journal:
+    """Append-only write-ahead log plus periodic snapshots for one record store.
+
+    Each mutation is one JSON line [lsn, key, value] (value None is a delete).
+    A snapshot holds every record as of some lsn, so recovery memory-maps the
+    newest snapshot and replays only the log entries written after it.
+    """
+
+    def __init__(self, directory: str, fsync: str = "group", interval: Optional[float] = None):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy {fsync!r}, expected one of {FSYNC_POLICIES}")
+        self.directory = directory
+        self.fsync = fsync
+        # group: how long to gather writers before one fsync; interval: time between fsyncs
+        if interval is None:
+            interval = 0.002 if fsync == "group" else 1.0
+        self.interval = interval
+        self.lsn = 0
+        self.durable_lsn = 0
+        self.snapshot_lsn = 0
+        self.entries_since_snapshot = 0
+        self._wal = None
+        # _lock guards the log file; _cond tracks durability and waiting commits
+        self._lock = threading.Lock()
+        # One snapshot at a time: each rotates the log and removes the files it replaces
+        self._snapshot_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._requested_lsn = 0
+        self._async_waiters: List[Tuple[int, asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self._flusher: Optional[threading.Thread] = None
+        self._closed = False
+        os.makedirs(directory, exist_ok=True)
+
+    # Recovery
+
+    def recover(self, apply: Callable[[str, Optional[Dict[str, Any]]], None]) -> Dict[str, Any]:
+        """Rebuild state by calling apply(key, value) for the snapshot, then the log tail.
+
+        A torn write at the very end of the log is cut off; an unreadable
+        entry anywhere else raises CorruptJournalError rather than silently
+        dropping what follows it. Must be called once, before the first append.
+        """
+        started = time.perf_counter()
+        snapshot_records = 0
+        snapshots = self._files("snapshot-*.ndjson")
+        if snapshots:
+            self.snapshot_lsn, path = snapshots[-1]
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                mm.readline()  # header
+                for line in iter(mm.readline, b""):
+                    key, value = json.loads(line)
+                    apply(key, value)
+                    snapshot_records += 1
+        self.lsn = self.snapshot_lsn
+
+        replayed = 0
+        truncated = 0
+        segments = self._files("wal-*.log")
+        for number, (_, path) in enumerate(segments):
+            with open(path, "rb") as f:
+                good_end = 0
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("no line end")
+                        lsn, key, value = json.loads(line)
+                    except ValueError:
+                        # Only the very last line of the log can be a torn write from
+                        # a crash (it was never acknowledged); anything else is damage
+                        if number != len(segments) - 1 or f.read(1):
+                            raise CorruptJournalError(f"Unreadable log entry at byte {good_end} of {path}")
+                        break
+                    good_end += len(line)
+                    if lsn <= self.lsn:
+                        continue
+                    apply(key, value)
+                    self.lsn = lsn
+                    replayed += 1
+            size = os.path.getsize(path)
+            if size > good_end:
+                # Cut the torn write off, so entries appended after recovery
+                # (possibly to this very segment) are not hidden behind it
+                with open(path, "r+b") as f:
+                    f.truncate(good_end)
+                    os.fsync(f.fileno())
+                truncated += size - good_end
+
+        self.durable_lsn = self.lsn
+        self.entries_since_snapshot = replayed
+        self._open_segment()
+        return {
+            "snapshot_lsn": self.snapshot_lsn,
+            "snapshot_records": snapshot_records,
+            "replayed_entries": replayed,
+            "truncated_bytes": truncated,
+            "seconds": time.perf_counter() - started,
+        }
+
+    def _files(self, pattern: str) -> List[Tuple[int, str]]:
+        """Files matching pattern as (lsn in the name, path), oldest first."""
+        found = []
+        for path in glob.glob(os.path.join(self.directory, pattern)):
+            name = os.path.basename(path)
+            found.append((int(name.split("-", 1)[1].split(".", 1)[0]), path))
+        return sorted(found)
+
+    def _open_segment(self) -> None:
+        path = os.path.join(self.directory, f"wal-{self.lsn + 1:020d}.log")
+        self._wal = open(path, "a", encoding="utf-8")
+
+    # Writing
+
+    def start(self) -> None:
+        """Start the background fsync thread used by the group and interval policies."""
+        if self.fsync in ("group", "interval") and self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, name="journal-fsync", daemon=True)
+            self._flusher.start()
+
+    def append(self, key: str, value: Optional[Dict[str, Any]]) -> int:
+        """Write one mutation to the log and return its lsn (not yet durable)."""
+        with self._lock:
+            self.lsn += 1
+            self._wal.write(json.dumps([self.lsn, key, value], separators=(",", ":")) + "\n")
+            self.entries_since_snapshot += 1
+            return self.lsn
+
+    def commit(self, lsn: int) -> None:
+        """Block until the entry at lsn is as durable as the fsync policy promises."""
+        if self.fsync == "always":
+            self._sync()
+        elif self.fsync == "group":
+            with self._cond:
+                self._requested_lsn = max(self._requested_lsn, lsn)
+                self._cond.notify_all()
+                while self.durable_lsn < lsn and not self._closed:
+                    self._cond.wait()
+        else:
+            with self._lock:
+                self._wal.flush()
+
+    async def commit_async(self, lsn: int) -> None:
+        """commit() for coroutines: waits without blocking the event loop."""
+        if self.fsync == "always":
+            await asyncio.get_running_loop().run_in_executor(None, self._sync)
+        elif self.fsync == "group":
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            with self._cond:
+                if self.durable_lsn >= lsn:
+                    return
+                self._async_waiters.append((lsn, loop, future))
+                self._requested_lsn = max(self._requested_lsn, lsn)
+                self._cond.notify_all()
+            await future
+        else:
+            with self._lock:
+                self._wal.flush()
+
+    def _sync(self) -> None:
+        """Flush and fsync everything appended so far, then wake waiting commits."""
+        with self._lock:
+            self._wal.flush()
+            target = self.lsn
+            # fsync a duplicate descriptor outside the lock, so appends are
+            # not blocked and a concurrent segment rotation cannot close it
+            fd = os.dup(self._wal.fileno())
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        with self._cond:
+            self.durable_lsn = max(self.durable_lsn, target)
+            self._cond.notify_all()
+            still_waiting = []
+            for lsn, loop, future in self._async_waiters:
+                if lsn <= self.durable_lsn:
+                    loop.call_soon_threadsafe(_resolve, future)
+                else:
+                    still_waiting.append((lsn, loop, future))
+            self._async_waiters = still_waiting
+
+    def _flush_loop(self) -> None:
+        while True:
+            with self._cond:
+                if self.fsync == "group":
+                    while not self._closed and self._requested_lsn <= self.durable_lsn:
+                        self._cond.wait()
+                if self._closed:
+                    return
+            # Give concurrent writers a moment to join this fsync
+            time.sleep(self.interval)
+            if self.lsn > self.durable_lsn:
+                self._sync()
+
+    # Snapshots
+
+    def snapshot(self, records: Callable[[], Iterable[Tuple[str, Dict[str, Any]]]]) -> Dict[str, Any]:
+        """Write every record to a new snapshot and drop the log it replaces.
+
+        The log is rotated first, so records() may be read while writes go
+        on: entries written during the snapshot are in the new log segment
+        and are replayed over it, which gives the same final state. A call
+        made while another snapshot is running waits for it to finish.
+        """
+        with self._snapshot_lock:
+            return self._snapshot(records)
+
+    def _snapshot(self, records: Callable[[], Iterable[Tuple[str, Dict[str, Any]]]]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        with self._lock:
+            self._wal.flush()
+            os.fsync(self._wal.fileno())
+            self._wal.close()
+            snapshot_lsn = self.lsn
+            self.entries_since_snapshot = 0
+            self._open_segment()
+
+        path = os.path.join(self.directory, f"snapshot-{snapshot_lsn:020d}.ndjson")
+        count = 0
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(json.dumps({"lsn": snapshot_lsn}) + "\n")
+            for key, value in records():
+                f.write(json.dumps([key, value], separators=(",", ":")) + "\n")
+                count += 1
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        self._fsync_directory()
+        self.snapshot_lsn = snapshot_lsn
+
+        for lsn, old in self._files("snapshot-*.ndjson"):
+            if lsn < snapshot_lsn:
+                _remove_if_present(old)
+        for first_lsn, old in self._files("wal-*.log"):
+            if first_lsn <= snapshot_lsn:
+                _remove_if_present(old)
+        return {"snapshot_lsn": snapshot_lsn, "records": count, "seconds": time.perf_counter() - started}
+
+    def _fsync_directory(self) -> None:
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def close(self) -> None:
+        """Make everything appended durable and stop the background thread."""
+        if self._wal is None:
+            return
+        self._sync()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._flusher is not None:
+            self._flusher.join()
+        with self._lock:
+            self._wal.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "directory": self.directory,
+            "fsync": self.fsync,
+            "lsn": self.lsn,
+            "durable_lsn": self.durable_lsn,
+            "snapshot_lsn": self.snapshot_lsn,
+            "entries_since_snapshot": self.entries_since_snapshot,
+        }
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+def _remove_if_present(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+async def snapshot_periodically(journal: Journal, records: Callable[[], Iterable[Tuple[str, Dict[str, Any]]]],
+                                interval: float, min_entries: int) -> None:
+    """Snapshot in a worker thread every interval seconds once min_entries have been logged.
+
+    Cancelling it while a snapshot runs waits for that snapshot: its thread
+    cannot be stopped, and the caller usually snapshots or closes next.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        if journal.entries_since_snapshot >= min_entries:
+            running = loop.run_in_executor(None, journal.snapshot, records)
+            try:
+                await asyncio.shield(running)
+            except asyncio.CancelledError:
+                await asyncio.wait([running])
+                raise
+
+async def stop_snapshots(task: Optional[asyncio.Task]) -> None:
+    """Cancel a snapshot_periodically task and wait until no snapshot of it is running."""
+    if task is None:
+        return
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
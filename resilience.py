@@ -0,0 +1,194 @@
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Type
+import asyncio
+import random
+import time
+
+from metrics import MetricsRegistry
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+# Values of the circuit state gauge
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+class TransientError(Exception):
+    """An upstream answer worth retrying (5xx or 429), as opposed to a definite one like 404."""
+
+    def __init__(self, status: int):
+        super().__init__(f"Upstream answered {status}")
+        self.status = status
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+    def __init__(self, upstream: str, retry_after: float):
+        super().__init__(f"Circuit for {upstream} is open")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """Stop calling an upstream after failure_threshold consecutive failures.
+
+    While open, calls fail immediately. After reset_timeout one probe call
+    is let through (half open): if it succeeds the circuit closes, if it
+    fails the circuit opens again for another reset_timeout.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float,
+                 on_change: Optional[Callable[[str], None]] = None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.on_change = on_change
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead now; a call that is let through must be recorded."""
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self._set(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self._probing:
+                return False
+            self._probing = True
+        return True
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def record_success(self) -> None:
+        self._probing = False
+        self.failures = 0
+        if self.state != CLOSED:
+            self._set(CLOSED)
+
+    def record_failure(self) -> None:
+        self._probing = False
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            if self.state != OPEN:
+                self._set(OPEN)
+
+    def release(self) -> None:
+        """Forget a call that was let through but ended without an answer (e.g. cancelled)."""
+        self._probing = False
+
+    def _set(self, state: str) -> None:
+        self.state = state
+        if self.on_change is not None:
+            self.on_change(state)
+
+def backoff_delay(attempt: int, base: float, maximum: float) -> float:
+    """Exponential backoff with full jitter: uniform in [0, min(maximum, base * 2**attempt)]."""
+    return random.uniform(0, min(maximum, base * (2 ** attempt)))
+
+class Resilience:
+    """Circuit breaker per upstream, bounded retries and optional hedging for idempotent calls.
+
+    Calls that raise one of retry_on count as failures of the upstream and
+    are retried up to attempts times in all, after a jittered backoff. With
+    hedge_delay > 0, a call that has not answered after hedge_delay seconds
+    is sent a second time and the first answer wins, which cuts the tail
+    latency caused by one slow connection or process. All attempts of a
+    call share one deadline (0 for none), so retries never make a caller
+    wait longer than a single slow call would have.
+    """
+
+    def __init__(self, attempts: int, backoff_base: float, backoff_max: float, hedge_delay: float,
+                 failure_threshold: int, reset_timeout: float, deadline: float = 0,
+                 retry_on: Tuple[Type[BaseException], ...] = (TransientError, asyncio.TimeoutError),
+                 registry: Optional[MetricsRegistry] = None, prefix: str = "upstream"):
+        self.attempts = max(1, attempts)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_delay = hedge_delay
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.deadline = deadline
+        self.retry_on = retry_on
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        registry = registry if registry is not None else MetricsRegistry()
+        self.state_gauge = registry.gauge(
+            f"{prefix}_circuit_state", "Circuit breaker state per upstream (0 closed, 1 half open, 2 open).",
+            ("upstream",))
+        self.opened = registry.counter(
+            f"{prefix}_circuit_opened_total", "Times the circuit of an upstream opened.", ("upstream",))
+        self.rejected = registry.counter(
+            f"{prefix}_circuit_rejected_total", "Calls failed fast because the circuit was open.", ("upstream",))
+        self.retries = registry.counter(
+            f"{prefix}_retries_total", "Calls retried after a transient failure.", ("upstream",))
+        self.hedges = registry.counter(
+            f"{prefix}_hedged_requests_total",
+            "Second requests sent because the first was slow, by which one answered first.", ("upstream", "winner"))
+
+    def breaker(self, upstream: str) -> CircuitBreaker:
+        breaker = self.breakers.get(upstream)
+        if breaker is None:
+            def on_change(state: str) -> None:
+                self.state_gauge.set(upstream, value=STATE_VALUES[state])
+                if state == OPEN:
+                    self.opened.inc(upstream)
+            breaker = self.breakers[upstream] = CircuitBreaker(self.failure_threshold, self.reset_timeout, on_change)
+            self.state_gauge.set(upstream, value=STATE_VALUES[CLOSED])
+        return breaker
+
+    async def call(self, upstream: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fn() against upstream with the breaker, retries and hedging applied.
+
+        Raises CircuitOpenError when the circuit is open, asyncio.TimeoutError
+        when the deadline passes, or the last error once the attempts are used up.
+        """
+        breaker = self.breaker(upstream)
+        give_up_at = time.monotonic() + self.deadline if self.deadline > 0 else None
+        for attempt in range(self.attempts):
+            if not breaker.allow():
+                self.rejected.inc(upstream)
+                raise CircuitOpenError(upstream, breaker.retry_after())
+            try:
+                if give_up_at is None:
+                    result = await self._hedged(upstream, fn)
+                else:
+                    result = await asyncio.wait_for(self._hedged(upstream, fn), give_up_at - time.monotonic())
+            except self.retry_on:
+                breaker.record_failure()
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+                if attempt + 1 >= self.attempts or (give_up_at is not None and time.monotonic() + delay >= give_up_at):
+                    raise
+                self.retries.inc(upstream)
+                await asyncio.sleep(delay)
+            except Exception:
+                # A definite answer (e.g. a 4xx): the upstream itself is fine
+                breaker.record_success()
+                raise
+            except BaseException:
+                breaker.release()
+                raise
+            else:
+                breaker.record_success()
+                return result
+
+    async def _hedged(self, upstream: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        if self.hedge_delay <= 0:
+            return await fn()
+        tasks = [asyncio.ensure_future(fn())]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay)
+            if done:
+                return tasks[0].result()
+            tasks.append(asyncio.ensure_future(fn()))
+            pending = set(tasks)
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.hedges.inc(upstream, "hedge" if task is tasks[1] else "first")
+                        return task.result()
+                if not pending:
+                    # Both failed; report the original request's error
+                    return tasks[0].result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
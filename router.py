@@ -0,0 +1,64 @@
+# First, so its startup timings (and STARTUP_PROFILE) cover every other import
+import startup
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response
+from typing import Any, Dict, List
+import os
+import uvicorn
+
+from negotiation import install_negotiation
+from routes import service1_routes, service2_routes
+from sharding import ShardMap
+from workers import WorkerRouter, WorkerRouting, merge_stats
+
+# Thin router in front of several instances (shards) of one service. It
+# places every request on the shard(s) owning its students, using the same
+# route tables as the multi-worker mode, and merges fanned-out answers.
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "1000"))
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+SERVICE_ROUTES = {"service1": service1_routes, "service2": service2_routes}
+
+def per_shard(results: List[Any]) -> Dict[str, Any]:
+    """Merge for endpoints whose answers only make sense per shard (stats)."""
+    return merge_stats(results, "shards")
+
+def make_router(service: str, shards: ShardMap) -> FastAPI:
+    """Build the router app for service ("service1" or "service2") over shards."""
+    routes = SERVICE_ROUTES[service](MAX_BATCH_SIZE, IMPORT_BATCH_SIZE, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, per_shard)
+    router = WorkerRouter(shards, routes)
+    # Docs come from the home shard, which serves the same API
+    app = FastAPI(title=f"{service} shard router", docs_url=None, redoc_url=None, openapi_url=None)
+    app.add_middleware(WorkerRouting, router=router)
+    install_negotiation(app)
+    app.add_event_handler("startup", router.open)
+    app.add_event_handler("shutdown", router.close)
+    # Before the catch-all route below, which would forward /ready to a shard
+    startup.install_readiness(app, f"{service} router")
+
+    @app.get("/")
+    def read_root():
+        return {"message": f"Shard router for {service}", "shards": shards.urls}
+
+    @app.get("/events")
+    def read_events():
+        raise HTTPException(status_code=404, detail="Change feeds are per shard; follow each shard's /events")
+
+    @app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH"])
+    async def forward_to_home_shard(request: Request, path: str):
+        # Requests no route places (docs, invalid input) behave as on one shard
+        status, headers, content = await router.forward(
+            shards.home, request.method, request.url.path, list(request.query_params.multi_items()),
+            dict(request.headers), await request.body(),
+        )
+        return Response(content, status_code=status, headers=headers)
+
+    return app
+
+if __name__ == "__main__":
+    service = os.getenv("ROUTER_SERVICE", "service1")
+    shard_urls = "SERVICE1_SHARD_URLS" if service == "service1" else "SERVICE2_SHARD_URLS"
+    port = 8080 if service == "service1" else 8081
+    uvicorn.run(make_router(service, ShardMap.from_env(shard_urls, "")), host="0.0.0.0", port=port)
@@ -0,0 +1,51 @@
+from typing import Any, Callable, Dict, List
+
+from aggregates import merge_course_stats, merge_one_course
+from cache import STALE_AGE_HEADER
+from tracing import merge_slowest, merge_trace
+from workers import Route, by_body, by_path, fan_out, merge_list, split_batch, split_ndjson
+
+# Route tables that place each request on the member(s) owning its students.
+# The same tables serve the workers of one service (workers.py) and the
+# shard router in front of several instances (router.py); per_member merges
+# the answers of endpoints that only make sense per process, such as stats.
+
+def service1_routes(max_batch_size: int, import_batch_size: int, default_page_size: int, max_page_size: int,
+                    per_member: Callable[[List[Any]], Dict[str, Any]]) -> List[Route]:
+    # /events is not routed: every member publishes the changes to its own partition
+    return [
+        Route("POST", "/students", by_body("student_id")),
+        Route("GET PUT DELETE", "/students/{student_id}", by_path("student_id")),
+        Route("POST", "/students:batchGet", split_batch("student_ids", lambda s: s["student_id"], max_batch_size)),
+        Route("GET", "/students", merge_list("/students", default_page_size, max_page_size)),
+        Route("GET", "/students:export", merge_list("/students", default_page_size, max_page_size, ndjson=True)),
+        Route("POST", "/students:import", split_ndjson("student_id", import_batch_size)),
+        Route("GET", "/persistence/stats", fan_out(per_member)),
+        Route("GET", "/debug/traces", fan_out(merge_slowest)),
+        Route("GET", "/debug/traces/{trace_id}", fan_out(merge_trace)),
+    ]
+
+def service2_routes(max_batch_size: int, import_batch_size: int, default_page_size: int, max_page_size: int,
+                    per_member: Callable[[List[Any]], Dict[str, Any]]) -> List[Route]:
+    return [
+        Route("GET POST PUT DELETE", "/students/{student_id}/academic", by_path("student_id")),
+        Route("GET", "/students/{student_id}/academic/stats", by_path("student_id")),
+        Route("GET", "/students/{student_id}/academic/operations/{operation_id}", by_path("student_id")),
+        Route("GET", "/students/{student_id}/complete", by_path("student_id")),
+        Route("GET", "/students/academic", merge_list("/students/academic", default_page_size, max_page_size)),
+        Route("GET", "/students/academic:export",
+              merge_list("/students/academic", default_page_size, max_page_size, ndjson=True)),
+        Route("POST", "/students/academic:import", split_ndjson("student_id", import_batch_size)),
+        Route("POST", "/students:batchComplete",
+              split_batch("student_ids", lambda s: s["personal_info"]["student_id"], max_batch_size,
+                          max_headers=(STALE_AGE_HEADER,))),
+        Route("GET", "/stats/courses", fan_out(merge_course_stats)),
+        Route("GET", "/stats/courses/{course:path}", fan_out(merge_one_course)),
+        Route("POST", "/stats/rebuild", fan_out(per_member)),
+        Route("GET", "/persistence/stats", fan_out(per_member)),
+        Route("GET", "/cache/stats", fan_out(per_member)),
+        Route("GET", "/coalescing/stats", fan_out(per_member)),
+        Route("GET", "/writes/stats", fan_out(per_member)),
+        Route("GET", "/debug/traces", fan_out(merge_slowest)),
+        Route("GET", "/debug/traces/{trace_id}", fan_out(merge_trace)),
+    ]
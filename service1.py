@@ -1,13 +1,67 @@
-from fastapi import FastAPI, HTTPException, status
+# First, so its startup timings (and STARTUP_PROFILE) cover every other import
+import startup
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, Optional
+from typing import Dict, List, Optional
+import asyncio
+import os
 import uvicorn
 
+from bulk import IMPORT_MODES, line_result, ndjson_batches, parse_line, summary_line
+from changefeed import ChangeFeed, format_sse
+from fastjson import RawJSONResponse, RecordJSON, dumps, json_array, json_object, keyed_records, ndjson_line, record_page
+from pagination import SortedKeys, ndjson_stream, paginate
+from metrics import MetricsRegistry, install_metrics
+from negotiation import install_negotiation
+from persistence import Journal, snapshot_periodically, stop_snapshots
+from storage import PersonalCodec, make_store
+from routes import service1_routes
+from tracing import Tracer, install_tracing
+from versioning import RecordVersions, check_if_match, none_match, not_modified
+from workers import WorkerGroup, enable_worker_routing, per_worker
+
 app = FastAPI(title="Student Personal Information Service")
 
-# In-memory storage for student personal data
-# In a real application, this would be a database
-student_personal_data: Dict[str, "StudentPersonal"] = {}
+# Record store backend: "dict" keeps one model per student, "compact" keeps tuple rows
+STUDENT_STORE = os.getenv("STUDENT_STORE", "dict")
+
+# Student ids in sorted order, for cursor pagination of the list endpoint
+personal_student_ids = SortedKeys()
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Change events for create/update/delete, followed by service2 to keep its cache fresh
+CHANGE_FEED_MAX_EVENTS = int(os.getenv("CHANGE_FEED_MAX_EVENTS", "10000"))
+CHANGE_FEED_HEARTBEAT = float(os.getenv("CHANGE_FEED_HEARTBEAT", "15"))
+change_feed = ChangeFeed(CHANGE_FEED_MAX_EVENTS)
+
+# Optional fast JSON path for the read endpoints (fastjson.py): each stored
+# record is encoded once, its bytes are reused until it is written again, and
+# responses are returned without re-validating them against response_model
+FAST_JSON = os.getenv("FAST_JSON", "0") == "1"
+FAST_JSON_MAX_ENTRIES = int(os.getenv("FAST_JSON_MAX_ENTRIES", "100000"))
+
+# Largest number of ids accepted by one batch lookup
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "1000"))
+
+# Lines validated and written together by the bulk import endpoint
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+
+# This process's place among the service's workers when main.py runs several;
+# each worker owns the students whose id hashes to it
+worker_group = WorkerGroup.from_env()
+
+# Optional durable persistence: set SERVICE1_DATA_DIR to keep a write-ahead
+# log and periodic snapshots there, and to reload them on startup
+# (each worker keeps its own partition in a worker-N subdirectory)
+SERVICE1_DATA_DIR = worker_group.data_dir(os.getenv("SERVICE1_DATA_DIR"))
+JOURNAL_FSYNC = os.getenv("JOURNAL_FSYNC", "group")
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "300"))
+SNAPSHOT_MIN_ENTRIES = int(os.getenv("SNAPSHOT_MIN_ENTRIES", "10000"))
+journal: Optional[Journal] = Journal(SERVICE1_DATA_DIR, JOURNAL_FSYNC) if SERVICE1_DATA_DIR else None
+journal_recovery: Optional[dict] = None
+snapshot_task: Optional[asyncio.Task] = None
 
 class StudentPersonal(BaseModel):
     student_id: str
@@ -17,40 +71,308 @@ class StudentPersonal(BaseModel):
     phone: Optional[str] = None
     address: Optional[str] = None
 
+# In-memory storage for student personal data
+# In a real application, this would be a database
+student_personal_data: Dict[str, StudentPersonal] = make_store(STUDENT_STORE, PersonalCodec(StudentPersonal))
+
+# Encoded JSON of the stored students, for the FAST_JSON path
+student_json = RecordJSON(student_personal_data, FAST_JSON_MAX_ENTRIES)
+
+# Version of every student, sent as its ETag for conditional requests
+student_versions = RecordVersions()
+
+# Prometheus-style metrics served on /metrics (request metrics are added by install_metrics)
+metrics = MetricsRegistry()
+metrics.callback_gauge("students_stored", "Student personal records in this process's store.",
+                       lambda: len(student_personal_data))
+metrics.callback_gauge("change_feed_last_seq", "Sequence number of the latest change event.",
+                       lambda: change_feed.last_seq)
+metrics.callback_gauge("fast_json_encoded_records", "Student records kept as encoded JSON (FAST_JSON).",
+                       lambda: student_json.stats()["encoded"])
+
+# Request spans, continuing the trace of callers that send a traceparent header
+tracer = Tracer("service1")
+
+class StudentPage(BaseModel):
+    items: List[StudentPersonal]
+    next_cursor: Optional[str] = None
+
+class StudentBatchGetRequest(BaseModel):
+    student_ids: List[str]
+    # student_id -> ETag the caller already holds; unchanged students are
+    # listed in not_modified instead of being sent again
+    if_none_match: Dict[str, str] = {}
+
+class StudentBatchGetResponse(BaseModel):
+    students: List[StudentPersonal]
+    missing: List[str]
+    not_modified: List[str] = []
+    # student_id -> current ETag, for every student found (modified or not)
+    etags: Dict[str, str] = {}
+
+@app.on_event("startup")
+async def bind_change_feed():
+    change_feed.bind_loop(asyncio.get_running_loop())
+
+@app.on_event("startup")
+async def open_journal():
+    """Reload the latest snapshot plus the log tail, then start logging writes."""
+    global personal_student_ids, journal_recovery, snapshot_task
+    if journal is None:
+        return
+    journal_recovery = journal.recover(load_student)
+    personal_student_ids = SortedKeys(list(student_personal_data))
+    journal.start()
+    snapshot_task = asyncio.create_task(
+        snapshot_periodically(journal, snapshot_records, SNAPSHOT_INTERVAL, SNAPSHOT_MIN_ENTRIES)
+    )
+
+@app.on_event("shutdown")
+async def close_journal():
+    """Take a final snapshot so the next start only has a short log to replay."""
+    if journal is None:
+        return
+    await stop_snapshots(snapshot_task)
+    if journal.entries_since_snapshot:
+        journal.snapshot(snapshot_records)
+    journal.close()
+
+def load_student(student_id: str, record: Optional[dict]) -> None:
+    """Apply one recovered snapshot record or log entry to the store."""
+    student_json.invalidate(student_id)
+    if record is None:
+        student_personal_data.pop(student_id, None)
+        student_versions.drop(student_id)
+    else:
+        student_versions.bump(student_id)
+        # Already validated when it was first written
+        student_personal_data[student_id] = StudentPersonal.construct(**record)
+
+def snapshot_records():
+    # Copy the ids first; the store may change while the snapshot is written
+    for student_id in list(student_personal_data):
+        student = student_personal_data.get(student_id)
+        if student is not None:
+            yield student_id, student.dict()
+
+def write_student(student_id: str, student: Optional[StudentPersonal]) -> Optional[int]:
+    """Apply one write (student None for a delete) to the store, sorted ids and change feed.
+
+    The write is also appended to the journal; its lsn is returned so the
+    caller can wait for it with wait_durable. Writes run on the event loop,
+    so the store, the change feed and the log all see them in the same order.
+    """
+    student_json.invalidate(student_id)
+    if student is None:
+        del student_personal_data[student_id]
+        personal_student_ids.discard(student_id)
+        student_versions.drop(student_id)
+        change_feed.publish("deleted", student_id)
+    else:
+        created = student_id not in student_personal_data
+        student_personal_data[student_id] = student
+        if created:
+            personal_student_ids.add(student_id)
+        student_versions.bump(student_id)
+        change_feed.publish("created" if created else "updated", student_id, student.dict(),
+                            student_versions.etag(student_id))
+    if journal is None:
+        return None
+    return journal.append(student_id, student.dict() if student is not None else None)
+
+async def wait_durable(lsn: Optional[int]) -> None:
+    """Wait until the journal entry at lsn is durable (no-op without persistence)."""
+    if lsn is not None:
+        with tracer.span("journal commit", lsn=lsn):
+            await journal.commit_async(lsn)
+
 @app.get("/")
 def read_root():
     return {"message": "Student Personal Information Service"}
 
 @app.post("/students", response_model=StudentPersonal, status_code=status.HTTP_201_CREATED)
-def create_student(student: StudentPersonal):
+async def create_student(student: StudentPersonal, response: Response):
     if student.student_id in student_personal_data:
         raise HTTPException(status_code=400, detail="Student already exists")
-    student_personal_data[student.student_id] = student
+    await wait_durable(write_student(student.student_id, student))
+    response.headers["ETag"] = student_versions.etag(student.student_id)
     return student
 
+@app.post("/students:batchGet", response_model=StudentBatchGetResponse)
+def batch_get_students(batch: StudentBatchGetRequest):
+    """Look up many students at once; ids that do not exist are listed in missing.
+
+    Students whose ETag is given in if_none_match and still current are
+    listed in not_modified instead of students.
+    """
+    if len(batch.student_ids) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SIZE} student ids per batch")
+    lookup = student_json.get if FAST_JSON else student_personal_data.get
+    students = []
+    missing = []
+    not_modified_ids = []
+    etags = {}
+    for student_id in dict.fromkeys(batch.student_ids):
+        etag = student_versions.etag(student_id)
+        if etag is not None and none_match(batch.if_none_match.get(student_id), etag):
+            not_modified_ids.append(student_id)
+            etags[student_id] = etag
+            continue
+        student = lookup(student_id)
+        if student is None:
+            missing.append(student_id)
+        else:
+            students.append(student)
+            etags[student_id] = etag
+    if FAST_JSON:
+        return RawJSONResponse(json_object((
+            ("students", json_array(students)), ("missing", dumps(missing)),
+            ("not_modified", dumps(not_modified_ids)), ("etags", dumps(etags)),
+        )))
+    return StudentBatchGetResponse(students=students, missing=missing, not_modified=not_modified_ids, etags=etags)
+
 @app.get("/students/{student_id}", response_model=StudentPersonal)
-def read_student(student_id: str):
-    if student_id not in student_personal_data:
+def read_student(student_id: str, response: Response, if_none_match: Optional[str] = Header(None)):
+    etag = student_versions.etag(student_id)
+    if etag is None:
         raise HTTPException(status_code=404, detail="Student not found")
-    return student_personal_data[student_id]
+    if none_match(if_none_match, etag):
+        return not_modified(etag)
+    if FAST_JSON:
+        data = student_json.get(student_id)
+        if data is None:
+            raise HTTPException(status_code=404, detail="Student not found")
+        return RawJSONResponse(data, headers={"ETag": etag})
+    student = student_personal_data.get(student_id)
+    if student is None:
+        raise HTTPException(status_code=404, detail="Student not found")
+    response.headers["ETag"] = etag
+    return student
 
 @app.put("/students/{student_id}", response_model=StudentPersonal)
-def update_student(student_id: str, student_update: StudentPersonal):
+async def update_student(student_id: str, student_update: StudentPersonal, response: Response,
+                         if_match: Optional[str] = Header(None)):
+    """Replace a student. With If-Match, only if the student still has that ETag (else 412)."""
     if student_id not in student_personal_data:
         raise HTTPException(status_code=404, detail="Student not found")
-    student_personal_data[student_id] = student_update
+    check_if_match(if_match, student_versions.etag(student_id))
+    await wait_durable(write_student(student_id, student_update))
+    response.headers["ETag"] = student_versions.etag(student_id)
     return student_update
 
 @app.delete("/students/{student_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_student(student_id: str):
+async def delete_student(student_id: str, if_match: Optional[str] = Header(None)):
     if student_id not in student_personal_data:
         raise HTTPException(status_code=404, detail="Student not found")
-    del student_personal_data[student_id]
+    check_if_match(if_match, student_versions.etag(student_id))
+    await wait_durable(write_student(student_id, None))
     return
 
 @app.get("/students")
-def list_students():
-    return student_personal_data
+def list_students(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    format: str = Query("json", regex="^(json|ndjson)$"),
+    if_none_match: Optional[str] = Header(None),
+):
+    """List students.
+
+    Without limit/cursor the whole store is returned as one object keyed by
+    student_id. With them, one page sorted by student_id is returned with an
+    opaque next_cursor. format=ndjson streams one record per line instead.
+    The ETag changes on every write, so If-None-Match gets a 304 until then.
+    """
+    etag = student_versions.collection_etag()
+    if none_match(if_none_match, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    if format == "ndjson":
+        return stream_students(cursor, limit, etag)
+    if FAST_JSON:
+        if limit is None and cursor is None:
+            return RawJSONResponse(keyed_records(list(student_personal_data), student_json.get), headers={"ETag": etag})
+        items, next_cursor = paginate(personal_student_ids, student_json.get, cursor, limit or DEFAULT_PAGE_SIZE)
+        return RawJSONResponse(record_page(items, next_cursor), headers={"ETag": etag})
+    if limit is None and cursor is None:
+        return student_personal_data
+    items, next_cursor = paginate(personal_student_ids, student_personal_data.get, cursor, limit or DEFAULT_PAGE_SIZE)
+    return StudentPage(items=items, next_cursor=next_cursor)
+
+@app.post("/students:import")
+async def import_students(request: Request, mode: str = Query("create", regex=f"^({'|'.join(IMPORT_MODES)})$")):
+    """Bulk-load students from an NDJSON request body, one student per line.
+
+    The body is parsed as it streams in and written IMPORT_BATCH_SIZE lines
+    at a time, with one durable commit per batch. A bad line is reported
+    and skipped; it does not abort the load. The response is NDJSON with one
+    result per input line followed by a summary line. mode=upsert replaces
+    existing students instead of reporting them as errors.
+    """
+    results: List[str] = []
+    counts = {"created": 0, "updated": 0, "error": 0}
+    async for batch in ndjson_batches(request.stream(), IMPORT_BATCH_SIZE):
+        last_lsn = None
+        for line_number, raw in batch:
+            student, error = parse_line(StudentPersonal, raw)
+            if student is None:
+                status_name, student_id = "error", None
+            elif mode == "create" and student.student_id in student_personal_data:
+                status_name, student_id, error = "error", student.student_id, "Student already exists"
+            else:
+                student_id = student.student_id
+                status_name = "updated" if student_id in student_personal_data else "created"
+                last_lsn = write_student(student_id, student) or last_lsn
+            counts[status_name] += 1
+            results.append(line_result(line_number, status_name, student_id, error))
+        await wait_durable(last_lsn)
+    results.append(summary_line(counts))
+    return StreamingResponse(iter(results), media_type="application/x-ndjson")
+
+def stream_students(cursor: Optional[str] = None, limit: Optional[int] = None,
+                    etag: Optional[str] = None) -> StreamingResponse:
+    """Students in student_id order as an NDJSON stream, from encoded JSON with FAST_JSON."""
+    if FAST_JSON:
+        lines = ndjson_stream(personal_student_ids, student_json.get, cursor, limit, encode=ndjson_line)
+    else:
+        lines = ndjson_stream(personal_student_ids, student_personal_data.get, cursor, limit)
+    return StreamingResponse(lines, media_type="application/x-ndjson", headers={"ETag": etag} if etag else None)
+
+@app.get("/students:export")
+def export_students():
+    """Stream every student as NDJSON, sorted by student_id (the import format)."""
+    return stream_students()
+
+@app.get("/persistence/stats")
+def read_persistence_stats():
+    if journal is None:
+        return {"enabled": False}
+    return {"enabled": True, **journal.stats(), "recovery": journal_recovery}
+
+@app.get("/events")
+async def stream_change_events(since: Optional[int] = None, feed_id: Optional[str] = None):
+    """Stream change events as Server-Sent Events.
+
+    Pass the last seen sequence number and feed_id to resume after a
+    reconnect; events missed in between are replayed first.
+    """
+    async def event_stream():
+        async for event in change_feed.subscribe(since, feed_id, CHANGE_FEED_HEARTBEAT):
+            yield format_sse(event)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+install_metrics(app, metrics)
+# /events streams stay open for as long as a subscriber follows them, so they are not traced
+install_tracing(app, tracer, skip_paths=("/events", "/ready"))
+
+# With several workers, route each request to the worker(s) owning its students
+enable_worker_routing(app, worker_group,
+                      service1_routes(MAX_BATCH_SIZE, IMPORT_BATCH_SIZE, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, per_worker))
+# MessagePack and compressed bodies for clients that ask for them (outermost)
+install_negotiation(app)
+# GET /ready answers 200 once every startup handler above has run
+startup.install_readiness(app, "service1")
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8080)
\ No newline at end of file
@@ -1,17 +1,193 @@
-from fastapi import FastAPI, HTTPException, status
+# First, so its startup timings (and STARTUP_PROFILE) cover every other import
+import startup
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, List, Optional
-import requests
+from typing import Dict, List, Optional, Set, Tuple
+from contextvars import ContextVar
+import aiohttp
+import asyncio
+import math
+import os
 import uvicorn
 
+from bulk import IMPORT_MODES, line_result, ndjson_batches, parse_line, summary_line
+from cache import MISSING, STALE_AGE_HEADER, LookupGuard, TTLCache
+from changefeed import read_sse
+from coalesce import MicroBatcher, SingleFlight
+from fastjson import RawJSONResponse, RecordJSON, dumps, json_array, json_object, keyed_records, ndjson_line, record_page
+from aggregates import GradeAggregates
+from indexes import AcademicIndexes
+from pagination import SortedKeys, ndjson_stream, paginate
+from metrics import MetricsRegistry, install_metrics
+from negotiation import MSGPACK_TYPE, install_negotiation, is_msgpack, msgpack, pack, strip_variant, unpack
+from persistence import Journal, snapshot_periodically, stop_snapshots
+from resilience import CircuitOpenError, Resilience, TransientError
+from storage import AcademicCodec, make_store
+from routes import service2_routes
+from sharding import ShardMap
+from tracing import Tracer, install_tracing
+from versioning import RecordVersions, check_if_match, none_match, not_modified
+from workers import WorkerGroup, enable_worker_routing, per_worker
+from writebehind import Operation, QueueFullError, WriteBehind
+
 app = FastAPI(title="Student Academic Information Service")
 
-# In-memory storage for student academic data
-# In a real application, this would be a database
-student_academic_data: Dict[str, "StudentAcademic"] = {}
+# Record store backend: "dict" keeps one model per record, "compact" keeps tuple rows
+STUDENT_STORE = os.getenv("STUDENT_STORE", "dict")
+
+# Student ids in sorted order, for cursor pagination of the list endpoint
+academic_student_ids = SortedKeys()
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# enrollment_status -> ids and course -> ids, for filtered list queries
+academic_indexes = AcademicIndexes()
+
+# Running per-student and per-course grade statistics
+grade_aggregates = GradeAggregates()
+# One POST /stats/rebuild at a time
+grade_rebuild_lock = asyncio.Lock()
+
+# This process's place among the service's workers when main.py runs several;
+# each worker owns the academic records whose student id hashes to it
+worker_group = WorkerGroup.from_env()
+
+# Optional durable persistence: set SERVICE2_DATA_DIR to keep a write-ahead
+# log and periodic snapshots there, and to reload them on startup
+# (each worker keeps its own partition in a worker-N subdirectory)
+SERVICE2_DATA_DIR = worker_group.data_dir(os.getenv("SERVICE2_DATA_DIR"))
+JOURNAL_FSYNC = os.getenv("JOURNAL_FSYNC", "group")
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "300"))
+SNAPSHOT_MIN_ENTRIES = int(os.getenv("SNAPSHOT_MIN_ENTRIES", "10000"))
+journal: Optional[Journal] = Journal(SERVICE2_DATA_DIR, JOURNAL_FSYNC) if SERVICE2_DATA_DIR else None
+journal_recovery: Optional[dict] = None
+snapshot_task: Optional[asyncio.Task] = None
+
+# Optional fast JSON path for the read endpoints (fastjson.py): each stored
+# record is encoded once, its bytes are reused until it is written again, and
+# responses are returned without re-validating them against response_model
+FAST_JSON = os.getenv("FAST_JSON", "0") == "1"
+FAST_JSON_MAX_ENTRIES = int(os.getenv("FAST_JSON_MAX_ENTRIES", "100000"))
 
 # Service 1 URL
-SERVICE1_URL = "http://localhost:8080"
+SERVICE1_URL = os.getenv("SERVICE1_URL", "http://localhost:8080")
+
+# When service1 runs as several instances, SERVICE1_SHARD_URLS lists them and
+# each student is looked up directly on the shard that owns it (sharding.py)
+service1_shards = ShardMap.from_env("SERVICE1_SHARD_URLS", SERVICE1_URL)
+
+# Connection pool and timeout settings for the shared service1 client
+SERVICE1_POOL_LIMIT = int(os.getenv("SERVICE1_POOL_LIMIT", "100"))
+SERVICE1_KEEPALIVE_TIMEOUT = float(os.getenv("SERVICE1_KEEPALIVE_TIMEOUT", "30"))
+SERVICE1_CONNECT_TIMEOUT = float(os.getenv("SERVICE1_CONNECT_TIMEOUT", "2"))
+SERVICE1_READ_TIMEOUT = float(os.getenv("SERVICE1_READ_TIMEOUT", "5"))
+
+# Read-only service1 calls are tried up to SERVICE1_RETRY_ATTEMPTS times on
+# connection errors, timeouts and 5xx answers, with jittered exponential
+# backoff between SERVICE1_RETRY_BASE_DELAY and SERVICE1_RETRY_MAX_DELAY seconds
+SERVICE1_RETRY_ATTEMPTS = int(os.getenv("SERVICE1_RETRY_ATTEMPTS", "3"))
+SERVICE1_RETRY_BASE_DELAY = float(os.getenv("SERVICE1_RETRY_BASE_DELAY", "0.05"))
+SERVICE1_RETRY_MAX_DELAY = float(os.getenv("SERVICE1_RETRY_MAX_DELAY", "1"))
+# All attempts of one call together give up after SERVICE1_CALL_DEADLINE seconds
+SERVICE1_CALL_DEADLINE = float(os.getenv("SERVICE1_CALL_DEADLINE", "5"))
+# After SERVICE1_BREAKER_FAILURES failures in a row, calls to that service1
+# shard fail fast with a 503 for SERVICE1_BREAKER_RESET seconds
+SERVICE1_BREAKER_FAILURES = int(os.getenv("SERVICE1_BREAKER_FAILURES", "5"))
+SERVICE1_BREAKER_RESET = float(os.getenv("SERVICE1_BREAKER_RESET", "5"))
+# Send a second copy of a lookup still unanswered after this many seconds and
+# use whichever answers first (0 disables hedging)
+SERVICE1_HEDGE_DELAY = float(os.getenv("SERVICE1_HEDGE_DELAY", "0"))
+
+# Body encoding for calls to service1: "json", or "msgpack" for smaller
+# payloads (needs the msgpack package in both services)
+SERVICE1_ENCODING = os.getenv("SERVICE1_ENCODING", "json")
+if SERVICE1_ENCODING not in ("json", "msgpack"):
+    raise ValueError(f"Unknown SERVICE1_ENCODING {SERVICE1_ENCODING!r}, expected json or msgpack")
+if SERVICE1_ENCODING == "msgpack" and msgpack is None:
+    raise ImportError("SERVICE1_ENCODING=msgpack needs the msgpack package (pip install msgpack)")
+
+# Shared client session, opened on startup and closed on shutdown
+service1_session: Optional[aiohttp.ClientSession] = None
+
+# Follow service1's change feed so cached personal records are invalidated on write.
+# When service1 runs as several workers or shards, each publishes its own feed, so
+# SERVICE1_FEED_URLS lists every one of them (main.py sets it for workers); it
+# defaults to the service1 shards.
+SERVICE1_CHANGE_FEED = os.getenv("SERVICE1_CHANGE_FEED", "1") == "1"
+SERVICE1_FEED_URLS = [url for url in os.getenv("SERVICE1_FEED_URLS", ",".join(service1_shards.urls)).split(",") if url]
+CHANGE_FEED_READ_TIMEOUT = float(os.getenv("CHANGE_FEED_READ_TIMEOUT", "45"))
+CHANGE_FEED_RETRY_DELAY = float(os.getenv("CHANGE_FEED_RETRY_DELAY", "1"))
+change_feed_tasks: List[asyncio.Task] = []
+change_feed_state = {
+    "enabled": SERVICE1_CHANGE_FEED,
+    "messages": 0,
+    "events_applied": 0,
+    "resets": 0,
+    "reconnects": 0,
+    "feeds": {url: {"connected": False, "feed_id": None, "last_seq": 0} for url in SERVICE1_FEED_URLS},
+}
+
+# Cache of service1 personal records (None entries cache a 404).
+# With the change feed keeping it fresh, entries can live much longer.
+PERSONAL_CACHE_MAX_ENTRIES = int(os.getenv("PERSONAL_CACHE_MAX_ENTRIES", "10000"))
+PERSONAL_CACHE_TTL = float(os.getenv("PERSONAL_CACHE_TTL", "300" if SERVICE1_CHANGE_FEED else "30"))
+PERSONAL_CACHE_NEGATIVE_TTL = float(os.getenv("PERSONAL_CACHE_NEGATIVE_TTL", "2"))
+# Expired personal records are kept this many more seconds for the stale modes below
+PERSONAL_CACHE_STALE_TTL = float(os.getenv("PERSONAL_CACHE_STALE_TTL", "60"))
+personal_cache = TTLCache(PERSONAL_CACHE_MAX_ENTRIES, PERSONAL_CACHE_TTL, PERSONAL_CACHE_NEGATIVE_TTL,
+                          PERSONAL_CACHE_STALE_TTL)
+# Change events seen for students whose lookup is in flight: an answer is only
+# cached if no event about that student (and no feed reset) arrived meanwhile
+personal_lookups = LookupGuard()
+
+# What the read-only composite endpoints do with an expired personal record
+# still in its stale window: "off" never serves it, "if-error" serves it when
+# service1 cannot answer instead of a 503, and "revalidate" serves it at once
+# while a background lookup refreshes it (and also when service1 is failing).
+# Writes always check the student against service1 itself.
+STALE_OFF, STALE_IF_ERROR, STALE_REVALIDATE = "off", "if-error", "revalidate"
+STALE_MODES = (STALE_OFF, STALE_IF_ERROR, STALE_REVALIDATE)
+COMPLETE_STALE_MODE = os.getenv("COMPLETE_STALE_MODE", STALE_IF_ERROR)
+BATCH_COMPLETE_STALE_MODE = os.getenv("BATCH_COMPLETE_STALE_MODE", STALE_IF_ERROR)
+for _mode in (COMPLETE_STALE_MODE, BATCH_COMPLETE_STALE_MODE):
+    if _mode not in STALE_MODES:
+        raise ValueError(f"Unknown stale mode {_mode!r}, expected one of {', '.join(STALE_MODES)}")
+# Background refreshes started by the revalidate mode
+stale_refresh_tasks: Set[asyncio.Task] = set()
+
+# Largest number of ids sent to service1's batch lookup in one request,
+# and accepted by the bulk composite endpoint
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "1000"))
+
+# Lines validated, checked against service1 and written together by the bulk import endpoint
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+
+# Optional write-behind for academic creates and updates (writebehind.py):
+# with ACADEMIC_WRITE_BEHIND=1 they are answered with 202 and an operation id
+# as soon as the body is valid, and applied in the background in batches of up
+# to WRITE_BEHIND_MAX_BATCH, with one batched service1 check and one journal
+# commit per batch. Once WRITE_BEHIND_QUEUE_SIZE writes are waiting, further
+# writes are refused with a 503 until the queue drains. The outcome of the last
+# WRITE_BEHIND_KEEP_OPERATIONS writes can be read back by operation id.
+ACADEMIC_WRITE_BEHIND = os.getenv("ACADEMIC_WRITE_BEHIND", "0") == "1"
+WRITE_BEHIND_QUEUE_SIZE = int(os.getenv("WRITE_BEHIND_QUEUE_SIZE", "10000"))
+WRITE_BEHIND_MAX_BATCH = int(os.getenv("WRITE_BEHIND_MAX_BATCH", "500"))
+WRITE_BEHIND_KEEP_OPERATIONS = int(os.getenv("WRITE_BEHIND_KEEP_OPERATIONS", "100000"))
+
+# Concurrent cache misses for the same student share one upstream lookup, and
+# misses for different students within SERVICE1_BATCH_WINDOW seconds are
+# merged into one batch call (0 sends each miss as its own GET)
+SERVICE1_BATCH_WINDOW = float(os.getenv("SERVICE1_BATCH_WINDOW", "0.002"))
+personal_single_flight = SingleFlight()
+
+# Personal records already fetched while handling the current inbound request.
+# None (the value for a known-missing student) is remembered as well.
+request_personal_lookups: ContextVar[Optional[Dict[str, Optional["StudentPersonal"]]]] = ContextVar(
+    "request_personal_lookups", default=None
+)
+# Ages in seconds of the stale personal records served in the current inbound request
+request_stale_ages: ContextVar[Optional[List[float]]] = ContextVar("request_stale_ages", default=None)
 
 class StudentAcademic(BaseModel):
     student_id: str
@@ -19,6 +195,44 @@ class StudentAcademic(BaseModel):
     grades: Dict[str, float]  # course: grade
     enrollment_status: str
 
+# In-memory storage for student academic data
+# In a real application, this would be a database
+student_academic_data: Dict[str, StudentAcademic] = make_store(STUDENT_STORE, AcademicCodec(StudentAcademic))
+
+# Encoded JSON of the stored academic records, for the FAST_JSON path
+academic_json = RecordJSON(student_academic_data, FAST_JSON_MAX_ENTRIES)
+
+# Version of every academic record, sent as its ETag for conditional requests
+academic_versions = RecordVersions()
+
+# Prometheus-style metrics served on /metrics (request metrics are added by install_metrics)
+metrics = MetricsRegistry()
+metrics.callback_gauge("academic_records_stored", "Academic records in this process's store.",
+                       lambda: len(student_academic_data))
+metrics.callback_gauge("personal_cache_entries", "Entries in the cache of service1 personal records.",
+                       lambda: len(personal_cache))
+metrics.callback_gauge("fast_json_encoded_records", "Academic records kept as encoded JSON (FAST_JSON).",
+                       lambda: academic_json.stats()["encoded"])
+metrics.callback_gauge("academic_writes_queued", "Academic writes accepted but not applied yet (write-behind).",
+                       lambda: academic_writes.depth() if academic_writes is not None else 0)
+service1_call_duration = metrics.histogram(
+    "service1_request_duration_seconds", "Latency of calls to service1, by operation.", ("operation",))
+service1_call_errors = metrics.counter(
+    "service1_request_errors_total",
+    "Failed calls to service1, by operation and kind (connection or status).", ("operation", "kind"))
+service1_not_modified = metrics.counter(
+    "service1_not_modified_total",
+    "Cached personal records revalidated by ETag instead of downloaded again, by operation.", ("operation",))
+
+# Breaker per service1 shard, retries and hedging for service1 lookups (resilience.py)
+service1_resilience = Resilience(
+    SERVICE1_RETRY_ATTEMPTS, SERVICE1_RETRY_BASE_DELAY, SERVICE1_RETRY_MAX_DELAY, SERVICE1_HEDGE_DELAY,
+    SERVICE1_BREAKER_FAILURES, SERVICE1_BREAKER_RESET, SERVICE1_CALL_DEADLINE,
+    retry_on=(TransientError, aiohttp.ClientError, asyncio.TimeoutError), registry=metrics, prefix="service1")
+
+# Request spans, continued from the caller's traceparent and propagated to service1
+tracer = Tracer("service2")
+
 class StudentPersonal(BaseModel):
     student_id: str
     first_name: str
@@ -31,82 +245,806 @@ class StudentCompleteInfo(BaseModel):
     personal_info: StudentPersonal
     academic_info: Optional[StudentAcademic] = None
 
-def verify_student_exists(student_id: str) -> bool:
-    """Verify if a student exists in the personal information service."""
+class StudentAcademicPage(BaseModel):
+    items: List[StudentAcademic]
+    next_cursor: Optional[str] = None
+
+class StudentBatchRequest(BaseModel):
+    student_ids: List[str]
+
+class StudentCompleteBatch(BaseModel):
+    students: List[StudentCompleteInfo]
+    missing: List[str]
+
+@app.on_event("startup")
+async def open_service1_session():
+    """Open the pooled keep-alive client used for all calls to service1."""
+    global service1_session
+    connector = aiohttp.TCPConnector(
+        limit=SERVICE1_POOL_LIMIT,
+        limit_per_host=SERVICE1_POOL_LIMIT,
+        keepalive_timeout=SERVICE1_KEEPALIVE_TIMEOUT,
+    )
+    timeout = aiohttp.ClientTimeout(
+        sock_connect=SERVICE1_CONNECT_TIMEOUT,
+        sock_read=SERVICE1_READ_TIMEOUT,
+    )
+    service1_session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+@app.on_event("startup")
+async def start_change_feed():
+    if SERVICE1_CHANGE_FEED:
+        change_feed_tasks.extend(asyncio.create_task(follow_change_feed(url)) for url in SERVICE1_FEED_URLS)
+
+@app.on_event("shutdown")
+async def close_service1_session():
+    """Apply the writes still queued, stop following the change feed, then close the service1 client."""
+    global service1_session
+    if academic_writes is not None:
+        await academic_writes.stop()
+    for task in [*change_feed_tasks, *stale_refresh_tasks]:
+        task.cancel()
+    await asyncio.gather(*change_feed_tasks, *stale_refresh_tasks, return_exceptions=True)
+    change_feed_tasks.clear()
+    if service1_session is not None:
+        await service1_session.close()
+        service1_session = None
+
+class RequestScopedLookups:
+    """ASGI middleware that gives every inbound request its own lookup memo.
+
+    If the response used stale personal records, the age of the oldest is
+    sent in the STALE_AGE_HEADER header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stale_ages: List[float] = []
+
+        async def send_with_stale_age(message):
+            if message["type"] == "http.response.start" and stale_ages:
+                header = (STALE_AGE_HEADER.lower().encode("latin-1"), str(int(max(stale_ages))).encode("latin-1"))
+                message = {**message, "headers": [*message.get("headers", []), header]}
+            await send(message)
+
+        token = request_personal_lookups.set({})
+        stale_token = request_stale_ages.set(stale_ages)
+        try:
+            await self.app(scope, receive, send_with_stale_age)
+        finally:
+            request_stale_ages.reset(stale_token)
+            request_personal_lookups.reset(token)
+
+app.add_middleware(RequestScopedLookups)
+
+def apply_change_event(feed: dict, event: dict) -> None:
+    """Bring personal_cache in line with one message from one of service1's change feeds."""
+    event_type = event["type"]
+    change_feed_state["messages"] += 1
+    if event_type in ("hello", "reset"):
+        # A reset, or a feed we were not following before, may have skipped
+        # events, so nothing cached so far can be trusted
+        if event_type == "reset" or event["feed_id"] != feed["feed_id"]:
+            personal_cache.clear()
+            personal_lookups.changed_all()
+            change_feed_state["resets"] += 1
+        feed["feed_id"] = event["feed_id"]
+    elif event_type in ("created", "updated"):
+        personal_cache.refresh(event["student_id"], StudentPersonal(**event["record"]), event.get("etag"))
+        personal_lookups.changed(event["student_id"])
+        change_feed_state["events_applied"] += 1
+    elif event_type == "deleted":
+        personal_cache.refresh(event["student_id"], None)
+        personal_lookups.changed(event["student_id"])
+        change_feed_state["events_applied"] += 1
+    feed["last_seq"] = event["seq"]
+
+async def follow_change_feed(url: str):
+    """Follow the change feed published at url for the lifetime of the app.
+
+    After a disconnect it reconnects with the last applied sequence number,
+    so service1 replays the events that were missed in between.
+    """
+    timeout = aiohttp.ClientTimeout(sock_connect=SERVICE1_CONNECT_TIMEOUT, sock_read=CHANGE_FEED_READ_TIMEOUT)
+    feed = change_feed_state["feeds"][url]
+    while True:
+        params = {}
+        if feed["feed_id"] is not None:
+            params = {"since": feed["last_seq"], "feed_id": feed["feed_id"]}
+        try:
+            async with service1_session.get(f"{url}/events", params=params, timeout=timeout) as response:
+                if response.status == 200:
+                    feed["connected"] = True
+                    async for event in read_sse(response.content):
+                        apply_change_event(feed, event)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            service1_call_errors.inc("change_feed", "connection")
+        feed["connected"] = False
+        change_feed_state["reconnects"] += 1
+        await asyncio.sleep(CHANGE_FEED_RETRY_DELAY)
+
+def service1_headers(extra: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Headers for a service1 call: trace context, the body encoding to accept, and extra."""
+    headers = {**tracer.headers(), **(extra or {})}
+    if SERVICE1_ENCODING == "msgpack":
+        headers["Accept"] = MSGPACK_TYPE
+    return headers
+
+def service1_body(document) -> Dict[str, object]:
+    """aiohttp keyword arguments sending document in SERVICE1_ENCODING."""
+    if SERVICE1_ENCODING == "msgpack":
+        return {"data": pack(document), "headers": service1_headers({"Content-Type": MSGPACK_TYPE})}
+    return {"json": document, "headers": service1_headers()}
+
+async def read_service1_body(response: aiohttp.ClientResponse):
+    """Decode a service1 answer, JSON or MessagePack by its Content-Type."""
+    if is_msgpack(response.headers.get("Content-Type")):
+        return unpack(await response.read())
+    return await response.json()
+
+def raise_for_service1_status(status_code: int) -> None:
+    """Raise for an unexpected service1 status: 5xx and 429 may be retried, others are passed on."""
+    if status_code >= 500 or status_code == 429:
+        raise TransientError(status_code)
+    raise HTTPException(status_code=status_code, detail="Failed to retrieve student personal information")
+
+async def call_service1(url: str, request):
+    """Run a read-only service1 call through the breaker, retries and hedging for url.
+
+    Every way service1 can fail to answer becomes a 503, so callers never
+    mistake an unavailable service1 for a student that does not exist.
+    """
     try:
-        response = requests.get(f"{SERVICE1_URL}/students/{student_id}", timeout=5)
-        return response.status_code == 200
-    except requests.RequestException:
-        # If service1 is down or unreachable, we might want to handle this differently
-        # For now, we'll assume student doesn't exist if we can't verify
-        return False
-
-def get_student_personal_info(student_id: str) -> StudentPersonal:
-    """Get student personal information from service1."""
+        return await service1_resilience.call(url, request)
+    except CircuitOpenError as exc:
+        raise HTTPException(status_code=503, detail="Personal information service unavailable (circuit open)",
+                            headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))})
+    except TransientError:
+        raise HTTPException(status_code=503, detail="Personal information service unavailable")
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        raise HTTPException(status_code=503, detail="Unable to connect to personal information service")
+
+# A service1 answer for one student: (record or None if missing, its ETag or None)
+PersonalAnswer = Tuple[Optional["StudentPersonal"], Optional[str]]
+
+async def request_students_personal(student_ids: List[str]) -> Dict[str, PersonalAnswer]:
+    """Look up students in service1 with one batch call per shard and MAX_BATCH_SIZE ids.
+
+    The calls to different shards run concurrently. Every requested id is in
+    the result; missing students map to (None, None). Students still held in
+    personal_cache with an ETag are sent as if_none_match, and the cached
+    record is reused for those service1 reports as not modified.
+    """
+    validators = {}
+    for student_id in student_ids:
+        validator = personal_cache.validator(student_id)
+        if validator is not MISSING:
+            validators[student_id] = validator
+
+    async def request_chunk(url: str, chunk: List[str]) -> dict:
+        body = {"student_ids": chunk,
+                "if_none_match": {i: validators[i][1] for i in chunk if i in validators}}
+        with service1_call_duration.time("batch_get"), \
+                tracer.span("service1 POST /students:batchGet", kind="client", url=url, ids=len(chunk)) as span:
+            try:
+                async with service1_session.post(f"{url}/students:batchGet", **service1_body(body)) as response:
+                    span.set("http.status_code", response.status)
+                    if response.status != 200:
+                        service1_call_errors.inc("batch_get", "status")
+                        raise_for_service1_status(response.status)
+                    return await read_service1_body(response)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                service1_call_errors.inc("batch_get", "connection")
+                raise
+
+    chunks = [
+        (url, ids[start:start + MAX_BATCH_SIZE])
+        for url, ids in service1_shards.split(student_ids).items()
+        for start in range(0, len(ids), MAX_BATCH_SIZE)
+    ]
+    # batchGet only reads, so it is as safe to retry and hedge as a GET
+    answers = await asyncio.gather(*(
+        call_service1(url, lambda url=url, chunk=chunk: request_chunk(url, chunk)) for url, chunk in chunks
+    ))
+    found: Dict[str, PersonalAnswer] = {}
+    for data in answers:
+        etags = data.get("etags", {})
+        for record in data["students"]:
+            found[record["student_id"]] = (StudentPersonal(**record), etags.get(record["student_id"]))
+        for student_id in data["missing"]:
+            found[student_id] = (None, None)
+        for student_id in data.get("not_modified", ()):
+            found[student_id] = (validators[student_id][0], etags.get(student_id, validators[student_id][1]))
+            service1_not_modified.inc("batch_get")
+    return found
+
+def use_stale(stale) -> Optional["StudentPersonal"]:
+    """Take the value of a personal_cache.get_stale() answer and note its age for the response."""
+    personal, age = stale
+    stale_ages = request_stale_ages.get()
+    if stale_ages is not None:
+        stale_ages.append(age)
+    return personal
+
+def refresh_in_background(refresh) -> None:
+    """Run refresh() as a background task, for the revalidate stale mode."""
+    async def run():
+        try:
+            await refresh()
+        except HTTPException:
+            # service1 is failing; the stale entry stays until its window ends
+            pass
+
+    task = asyncio.ensure_future(run())
+    stale_refresh_tasks.add(task)
+    task.add_done_callback(stale_refresh_tasks.discard)
+
+async def load_students_personal(student_ids: List[str]) -> Dict[str, Optional[StudentPersonal]]:
+    """Look up many students in service1 and store the answers in personal_cache."""
+    lookup = personal_lookups.begin(student_ids)
     try:
-        response = requests.get(f"{SERVICE1_URL}/students/{student_id}", timeout=5)
-        if response.status_code == 200:
-            data = response.json()
-            return StudentPersonal(**data)
+        answers = await request_students_personal(student_ids)
+    finally:
+        unchanged = personal_lookups.end(lookup)
+    for student_id, (personal, etag) in answers.items():
+        if student_id in unchanged:
+            personal_cache.put(student_id, personal, etag)
+    return {student_id: personal for student_id, (personal, _) in answers.items()}
+
+async def fetch_students_personal(student_ids: List[str],
+                                  stale_mode: str = STALE_OFF) -> Dict[str, Optional[StudentPersonal]]:
+    """Fetch many personal records, or None for students that do not exist.
+
+    Ids already seen in this request or held in personal_cache are answered
+    locally; all the others are resolved with batched service1 lookups.
+    stale_mode is applied as in fetch_student_personal; with if-error, stale
+    records are only served if every id that needed service1 has one.
+    """
+    lookups = request_personal_lookups.get()
+    results: Dict[str, Optional[StudentPersonal]] = {}
+    to_fetch = []
+    to_refresh = []
+    for student_id in dict.fromkeys(student_ids):
+        if lookups is not None and student_id in lookups:
+            results[student_id] = lookups[student_id]
+            continue
+        personal = personal_cache.get(student_id)
+        if personal is not MISSING:
+            results[student_id] = personal
+            continue
+        stale = personal_cache.get_stale(student_id) if stale_mode == STALE_REVALIDATE else MISSING
+        if stale is MISSING:
+            to_fetch.append(student_id)
         else:
-            raise HTTPException(status_code=response.status_code, detail="Failed to retrieve student personal information")
-    except requests.RequestException:
-        raise HTTPException(status_code=503, detail="Unable to connect to personal information service")
+            results[student_id] = use_stale(stale)
+            to_refresh.append(student_id)
+
+    if to_refresh:
+        # Shared with lookups already refreshing some of these students
+        refresh_in_background(lambda: personal_single_flight.do_many(to_refresh, load_students_personal))
+    if to_fetch:
+        try:
+            with tracer.span("personal lookup", ids=len(to_fetch)):
+                fetched = await load_students_personal(to_fetch)
+        except HTTPException as exc:
+            if stale_mode == STALE_OFF or exc.status_code != 503:
+                raise
+            stale_records = [personal_cache.get_stale(student_id) for student_id in to_fetch]
+            if any(stale is MISSING for stale in stale_records):
+                raise
+            fetched = {student_id: use_stale(stale) for student_id, stale in zip(to_fetch, stale_records)}
+        results.update(fetched)
+
+    if lookups is not None:
+        lookups.update(results)
+    return results
+
+personal_batcher = (
+    MicroBatcher(request_students_personal, SERVICE1_BATCH_WINDOW, MAX_BATCH_SIZE)
+    if SERVICE1_BATCH_WINDOW > 0 else None
+)
+
+async def request_student_personal(student_id: str) -> PersonalAnswer:
+    """GET one student from service1, revalidating a cached copy with If-None-Match.
+
+    Returns the record and its ETag, or (None, None) if it does not exist.
+    """
+    url = service1_shards.url_for(student_id)
+    validator = personal_cache.validator(student_id)
+
+    async def request() -> PersonalAnswer:
+        with service1_call_duration.time("get_student"), \
+                tracer.span("service1 GET /students/{student_id}", kind="client", url=url, student_id=student_id) as span:
+            # Built inside the client span, so service1's span becomes its child
+            headers = service1_headers({"If-None-Match": validator[1]} if validator is not MISSING else None)
+            try:
+                async with service1_session.get(f"{url}/students/{student_id}", headers=headers) as response:
+                    span.set("http.status_code", response.status)
+                    # Kept without the suffix of a compressed answer, so batchGet can send it as well
+                    etag = response.headers.get("ETag")
+                    etag = strip_variant(etag) if etag is not None else None
+                    if response.status == 200:
+                        return StudentPersonal(**await read_service1_body(response)), etag
+                    elif response.status == 304 and validator is not MISSING:
+                        service1_not_modified.inc("get_student")
+                        return validator[0], etag or validator[1]
+                    elif response.status == 404:
+                        return None, None
+                    service1_call_errors.inc("get_student", "status")
+                    raise_for_service1_status(response.status)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                service1_call_errors.inc("get_student", "connection")
+                raise
+
+    return await call_service1(url, request)
+
+async def load_student_personal(student_id: str) -> Optional[StudentPersonal]:
+    """Look up one student in service1 and store the answer in personal_cache."""
+    # A change event for this student applied while the lookup is in flight
+    # may be newer than the response, so only cache the response if none arrived
+    lookup = personal_lookups.begin([student_id])
+    try:
+        if personal_batcher is not None:
+            personal, etag = await personal_batcher.get(student_id)
+        else:
+            personal, etag = await request_student_personal(student_id)
+    finally:
+        unchanged = personal_lookups.end(lookup)
+    if student_id in unchanged:
+        personal_cache.put(student_id, personal, etag)
+    return personal
+
+async def fetch_student_personal(student_id: str, stale_mode: str = STALE_OFF) -> Optional[StudentPersonal]:
+    """Fetch a student's personal record from service1, or None if it does not exist.
+
+    A single lookup answers both "does the student exist" and "what is their
+    personal info". The result is remembered for the rest of the inbound
+    request, so one request never fetches the same student twice, and kept
+    in personal_cache so later requests can skip service1 entirely. On a
+    cache miss, concurrent requests for the same student share one lookup.
+    stale_mode (one of STALE_MODES) says whether an expired record still in
+    its stale window may be served instead.
+    """
+    lookups = request_personal_lookups.get()
+    if lookups is not None and student_id in lookups:
+        return lookups[student_id]
+
+    def lookup():
+        return personal_single_flight.do(student_id, lambda: load_student_personal(student_id))
+
+    personal = personal_cache.get(student_id)
+    if personal is MISSING:
+        stale = personal_cache.get_stale(student_id) if stale_mode == STALE_REVALIDATE else MISSING
+        if stale is not MISSING:
+            refresh_in_background(lookup)
+            personal = use_stale(stale)
+        else:
+            try:
+                # The call to service1 may be shared with other requests (single flight
+                # or micro-batch); its client span is recorded in the trace that started it
+                with tracer.span("personal lookup", student_id=student_id):
+                    personal = await lookup()
+            except HTTPException as exc:
+                if stale_mode == STALE_OFF or exc.status_code != 503:
+                    raise
+                stale = personal_cache.get_stale(student_id)
+                if stale is MISSING:
+                    raise
+                personal = use_stale(stale)
+
+    if lookups is not None:
+        lookups[student_id] = personal
+    return personal
+
+async def verify_student_exists(student_id: str) -> bool:
+    """Verify if a student exists in the personal information service."""
+    return await fetch_student_personal(student_id) is not None
+
+async def get_student_personal_info(student_id: str, stale_mode: str = STALE_OFF) -> StudentPersonal:
+    """Get student personal information from service1."""
+    personal = await fetch_student_personal(student_id, stale_mode)
+    if personal is None:
+        raise HTTPException(status_code=404, detail="Student not found in personal information service")
+    return personal
+
+def apply_academic_write(student_id: str, old_record: Optional[StudentAcademic],
+                         new_record: Optional[StudentAcademic]) -> None:
+    """Update the sorted ids, secondary indexes and grade aggregates after a write.
+
+    old_record is None for a create and new_record is None for a delete.
+    """
+    if old_record is None:
+        academic_student_ids.add(student_id)
+    else:
+        academic_indexes.remove(student_id, old_record)
+        grade_aggregates.remove(student_id, old_record)
+    if new_record is None:
+        academic_student_ids.discard(student_id)
+    else:
+        academic_indexes.add(student_id, new_record)
+        grade_aggregates.add(student_id, new_record)
+
+@app.on_event("startup")
+async def open_journal():
+    """Reload the latest snapshot plus the log tail, then start logging writes."""
+    global academic_student_ids, journal_recovery, snapshot_task
+    if journal is None:
+        return
+    journal_recovery = journal.recover(load_academic_record)
+    # Rebuild the derived state in bulk rather than one write at a time
+    academic_student_ids = SortedKeys(list(student_academic_data))
+    for student_id, record in student_academic_data.items():
+        academic_indexes.add(student_id, record)
+    grade_aggregates.rebuild(student_academic_data.items())
+    journal.start()
+    snapshot_task = asyncio.create_task(
+        snapshot_periodically(journal, snapshot_records, SNAPSHOT_INTERVAL, SNAPSHOT_MIN_ENTRIES)
+    )
+
+@app.on_event("shutdown")
+async def close_journal():
+    """Take a final snapshot so the next start only has a short log to replay."""
+    if journal is None:
+        return
+    await stop_snapshots(snapshot_task)
+    if journal.entries_since_snapshot:
+        journal.snapshot(snapshot_records)
+    journal.close()
+
+def load_academic_record(student_id: str, record: Optional[dict]) -> None:
+    """Apply one recovered snapshot record or log entry to the store."""
+    academic_json.invalidate(student_id)
+    if record is None:
+        student_academic_data.pop(student_id, None)
+        academic_versions.drop(student_id)
+    else:
+        academic_versions.bump(student_id)
+        # Already validated when it was first written
+        student_academic_data[student_id] = StudentAcademic.construct(**record)
+
+def snapshot_records():
+    # Copy the ids first; the store may change while the snapshot is written
+    for student_id in list(student_academic_data):
+        record = student_academic_data.get(student_id)
+        if record is not None:
+            yield student_id, record.dict()
+
+def write_academic_record(student_id: str, record: Optional[StudentAcademic]) -> Optional[int]:
+    """Apply one write (record None for a delete) to the store and its derived state.
+
+    The write is also appended to the journal; its lsn is returned so the
+    caller can wait for it with wait_durable.
+    """
+    academic_json.invalidate(student_id)
+    if record is None:
+        old_record = student_academic_data.pop(student_id)
+        academic_versions.drop(student_id)
+    else:
+        old_record = student_academic_data.get(student_id)
+        student_academic_data[student_id] = record
+        academic_versions.bump(student_id)
+    apply_academic_write(student_id, old_record, record)
+    if journal is None:
+        return None
+    return journal.append(student_id, record.dict() if record is not None else None)
+
+async def wait_durable(lsn: Optional[int]) -> None:
+    """Wait until the journal entry at lsn is durable (no-op without persistence)."""
+    if lsn is not None:
+        with tracer.span("journal commit", lsn=lsn):
+            await journal.commit_async(lsn)
+
+async def apply_academic_operations(operations: List[Operation]) -> None:
+    """Apply a batch of queued academic writes in the order they were accepted.
+
+    The students of the whole batch are checked with one batched service1
+    lookup and the writes are made durable with one journal commit. Each
+    operation ends with the status code and detail the synchronous endpoint
+    would have answered.
+    """
+    student_ids = list(dict.fromkeys(operation.key for operation in operations))
+    with tracer.span("write-behind batch", size=len(operations)):
+        try:
+            personal_records = await fetch_students_personal(student_ids)
+        except HTTPException as exc:
+            for operation in operations:
+                operation.finish(exc.status_code, exc.detail)
+            return
+        written = []
+        last_lsn = None
+        for operation in operations:
+            student_id = operation.key
+            if personal_records.get(student_id) is None:
+                operation.finish(404, "Student not found in personal information service")
+                continue
+            if operation.kind == "create" and student_id in student_academic_data:
+                operation.finish(400, "Academic record already exists for this student")
+                continue
+            if operation.kind == "update":
+                if student_id not in student_academic_data:
+                    operation.finish(404, "Academic record not found")
+                    continue
+                try:
+                    check_if_match(operation.condition, academic_versions.etag(student_id))
+                except HTTPException as exc:
+                    operation.finish(exc.status_code, exc.detail)
+                    continue
+            last_lsn = write_academic_record(student_id, operation.payload) or last_lsn
+            written.append((operation, academic_versions.etag(student_id)))
+        await wait_durable(last_lsn)
+        for operation, etag in written:
+            operation.finish(201 if operation.kind == "create" else 200, etag=etag)
+
+academic_writes: Optional[WriteBehind] = WriteBehind(
+    apply_academic_operations, WRITE_BEHIND_QUEUE_SIZE, WRITE_BEHIND_MAX_BATCH, WRITE_BEHIND_KEEP_OPERATIONS
+) if ACADEMIC_WRITE_BEHIND else None
+
+@app.on_event("startup")
+async def start_write_behind():
+    if academic_writes is not None:
+        academic_writes.start()
+
+def accept_academic_write(kind: str, student_id: str, record: StudentAcademic,
+                          if_match: Optional[str] = None) -> JSONResponse:
+    """Queue a write for the write-behind task and answer 202 with its operation."""
+    try:
+        operation = academic_writes.submit(kind, student_id, record, if_match)
+    except QueueFullError as exc:
+        raise HTTPException(status_code=503, detail=f"Too many pending writes: {exc}", headers={"Retry-After": "1"})
+    location = f"/students/{student_id}/academic/operations/{operation.operation_id}"
+    return JSONResponse(operation.to_dict(), status_code=status.HTTP_202_ACCEPTED, headers={"Location": location})
 
 @app.get("/")
 def read_root():
     return {"message": "Student Academic Information Service"}
 
+@app.get("/persistence/stats")
+def read_persistence_stats():
+    if journal is None:
+        return {"enabled": False}
+    return {"enabled": True, **journal.stats(), "recovery": journal_recovery}
+
+@app.get("/cache/stats")
+def read_cache_stats():
+    return {**personal_cache.stats(), "change_feed": change_feed_state, "fast_json": academic_json.stats()}
+
+@app.get("/writes/stats")
+def read_write_behind_stats():
+    if academic_writes is None:
+        return {"enabled": False}
+    return {"enabled": True, **academic_writes.stats()}
+
+@app.get("/coalescing/stats")
+def read_coalescing_stats():
+    return {
+        "single_flight": personal_single_flight.stats(),
+        "micro_batching": personal_batcher.stats() if personal_batcher is not None else None,
+    }
+
 @app.post("/students/{student_id}/academic", response_model=StudentAcademic, status_code=status.HTTP_201_CREATED)
-def create_academic_record(student_id: str, academic_record: StudentAcademic):
+async def create_academic_record(student_id: str, academic_record: StudentAcademic, response: Response):
+    """Create an academic record, or with write-behind queue it and answer 202 with its operation."""
+    if academic_writes is not None:
+        return accept_academic_write("create", student_id, academic_record)
     # Verify student exists in service1
-    if not verify_student_exists(student_id):
+    if not await verify_student_exists(student_id):
         raise HTTPException(status_code=404, detail="Student not found in personal information service")
     
     # Check if academic record already exists
     if student_id in student_academic_data:
         raise HTTPException(status_code=400, detail="Academic record already exists for this student")
     
-    student_academic_data[student_id] = academic_record
+    await wait_durable(write_academic_record(student_id, academic_record))
+    response.headers["ETag"] = academic_versions.etag(student_id)
     return academic_record
 
 @app.get("/students/{student_id}/academic", response_model=StudentAcademic)
-def read_academic_record(student_id: str):
-    if student_id not in student_academic_data:
+def read_academic_record(student_id: str, response: Response, if_none_match: Optional[str] = Header(None)):
+    etag = academic_versions.etag(student_id)
+    if etag is None:
+        raise HTTPException(status_code=404, detail="Academic record not found")
+    if none_match(if_none_match, etag):
+        return not_modified(etag)
+    if FAST_JSON:
+        data = academic_json.get(student_id)
+        if data is None:
+            raise HTTPException(status_code=404, detail="Academic record not found")
+        return RawJSONResponse(data, headers={"ETag": etag})
+    record = student_academic_data.get(student_id)
+    if record is None:
         raise HTTPException(status_code=404, detail="Academic record not found")
-    return student_academic_data[student_id]
+    response.headers["ETag"] = etag
+    return record
 
 @app.put("/students/{student_id}/academic", response_model=StudentAcademic)
-def update_academic_record(student_id: str, academic_update: StudentAcademic):
+async def update_academic_record(student_id: str, academic_update: StudentAcademic, response: Response,
+                                 if_match: Optional[str] = Header(None)):
+    """Replace an academic record. With If-Match, only if it still has that ETag (else 412).
+
+    With write-behind the update is queued and answered with 202; If-Match is
+    then checked when it is applied.
+    """
+    if academic_writes is not None:
+        return accept_academic_write("update", student_id, academic_update, if_match)
     # Verify student exists in service1
-    if not verify_student_exists(student_id):
+    if not await verify_student_exists(student_id):
         raise HTTPException(status_code=404, detail="Student not found in personal information service")
     
     if student_id not in student_academic_data:
         raise HTTPException(status_code=404, detail="Academic record not found")
     
-    student_academic_data[student_id] = academic_update
+    # Checked after the await above, so no other write can come in between
+    check_if_match(if_match, academic_versions.etag(student_id))
+    await wait_durable(write_academic_record(student_id, academic_update))
+    response.headers["ETag"] = academic_versions.etag(student_id)
     return academic_update
 
+@app.get("/students/{student_id}/academic/operations/{operation_id}")
+def read_academic_write(student_id: str, operation_id: str):
+    """Status of a write accepted with 202: pending, applied or failed (with its status code)."""
+    operation = academic_writes.operation(operation_id) if academic_writes is not None else None
+    if operation is None or operation.key != student_id:
+        raise HTTPException(status_code=404, detail="Write operation not found")
+    return operation.to_dict()
+
 @app.delete("/students/{student_id}/academic", status_code=status.HTTP_204_NO_CONTENT)
-def delete_academic_record(student_id: str):
+async def delete_academic_record(student_id: str, if_match: Optional[str] = Header(None)):
+    # Async like create/update, so every index change happens on the event loop
     if student_id not in student_academic_data:
         raise HTTPException(status_code=404, detail="Academic record not found")
-    del student_academic_data[student_id]
+    check_if_match(if_match, academic_versions.etag(student_id))
+    await wait_durable(write_academic_record(student_id, None))
     return
 
+@app.post("/students/academic:import")
+async def import_academic_records(request: Request,
+                                  mode: str = Query("create", regex=f"^({'|'.join(IMPORT_MODES)})$")):
+    """Bulk-load academic records from an NDJSON request body, one record per line.
+
+    Lines are validated IMPORT_BATCH_SIZE at a time and the students of each
+    batch are checked with one batched service1 lookup, then written with
+    one durable commit per batch. A bad line is reported and skipped; it
+    does not abort the load. The response is NDJSON with one result per
+    input line followed by a summary line.
+    """
+    results: List[str] = []
+    counts = {"created": 0, "updated": 0, "error": 0}
+    async for batch in ndjson_batches(request.stream(), IMPORT_BATCH_SIZE):
+        parsed = [(line_number, *parse_line(StudentAcademic, raw)) for line_number, raw in batch]
+        student_ids = [record.student_id for _, record, _ in parsed if record is not None]
+        try:
+            personal_records = await fetch_students_personal(student_ids) if student_ids else {}
+            unavailable = None
+        except HTTPException as exc:
+            personal_records, unavailable = {}, exc.detail
+        last_lsn = None
+        for line_number, record, error in parsed:
+            student_id = record.student_id if record is not None else None
+            if record is None:
+                status_name = "error"
+            elif unavailable is not None:
+                status_name, error = "error", unavailable
+            elif personal_records.get(student_id) is None:
+                status_name, error = "error", "Student not found in personal information service"
+            elif mode == "create" and student_id in student_academic_data:
+                status_name, error = "error", "Academic record already exists for this student"
+            else:
+                status_name = "updated" if student_id in student_academic_data else "created"
+                last_lsn = write_academic_record(student_id, record) or last_lsn
+            counts[status_name] += 1
+            results.append(line_result(line_number, status_name, student_id, error))
+        await wait_durable(last_lsn)
+    results.append(summary_line(counts))
+    return StreamingResponse(iter(results), media_type="application/x-ndjson")
+
+def stream_academic_records(keys: SortedKeys, cursor: Optional[str] = None, limit: Optional[int] = None,
+                            etag: Optional[str] = None) -> StreamingResponse:
+    """Academic records in student_id order as an NDJSON stream, from encoded JSON with FAST_JSON."""
+    if FAST_JSON:
+        lines = ndjson_stream(keys, academic_json.get, cursor, limit, encode=ndjson_line)
+    else:
+        lines = ndjson_stream(keys, student_academic_data.get, cursor, limit)
+    return StreamingResponse(lines, media_type="application/x-ndjson", headers={"ETag": etag} if etag else None)
+
+@app.get("/students/academic:export")
+def export_academic_records():
+    """Stream every academic record as NDJSON, sorted by student_id (the import format)."""
+    return stream_academic_records(academic_student_ids)
+
 @app.get("/students/academic")
-def list_academic_records():
-    return student_academic_data
+def list_academic_records(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    format: str = Query("json", regex="^(json|ndjson)$"),
+    enrollment_status: Optional[str] = None,
+    course: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+):
+    """List academic records.
+
+    Without limit/cursor the whole store is returned as one object keyed by
+    student_id. With them, one page sorted by student_id is returned with an
+    opaque next_cursor. format=ndjson streams one record per line instead.
+    enrollment_status and course filter through the secondary indexes, so
+    only the matching records are visited. The ETag changes on every write,
+    so If-None-Match gets a 304 until then.
+    """
+    etag = academic_versions.collection_etag()
+    if none_match(if_none_match, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    keys = academic_student_ids
+    if enrollment_status is not None or course is not None:
+        keys = SortedKeys(list(academic_indexes.lookup(enrollment_status, course)))
+        if format == "json" and limit is None and cursor is None:
+            if FAST_JSON:
+                return RawJSONResponse(keyed_records(keys.page_after(None, len(keys)), academic_json.get),
+                                       headers={"ETag": etag})
+            records = {}
+            for student_id in keys.page_after(None, len(keys)):
+                record = student_academic_data.get(student_id)
+                if record is not None:
+                    records[student_id] = record
+            return records
+
+    if format == "ndjson":
+        return stream_academic_records(keys, cursor, limit, etag)
+    if FAST_JSON:
+        if limit is None and cursor is None:
+            return RawJSONResponse(keyed_records(list(student_academic_data), academic_json.get), headers={"ETag": etag})
+        items, next_cursor = paginate(keys, academic_json.get, cursor, limit or DEFAULT_PAGE_SIZE)
+        return RawJSONResponse(record_page(items, next_cursor), headers={"ETag": etag})
+    if limit is None and cursor is None:
+        return student_academic_data
+    items, next_cursor = paginate(keys, student_academic_data.get, cursor, limit or DEFAULT_PAGE_SIZE)
+    return StudentAcademicPage(items=items, next_cursor=next_cursor)
+
+@app.get("/students/{student_id}/academic/stats")
+def read_student_grade_stats(student_id: str):
+    stats = grade_aggregates.student_stats(student_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="Academic record not found")
+    return stats
+
+@app.get("/stats/courses")
+def list_course_stats():
+    return grade_aggregates.all_course_stats()
+
+@app.get("/stats/courses/{course:path}")
+def read_course_stats(course: str):
+    stats = grade_aggregates.course_stats(course)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="No grades recorded for this course")
+    return stats
+
+@app.post("/stats/rebuild")
+async def rebuild_grade_stats():
+    """Recompute all grade aggregates in bulk (vectorized with NumPy if installed), off the event loop."""
+    async with grade_rebuild_lock:
+        records = grade_aggregates.snapshot(student_academic_data.items())
+        return await asyncio.get_running_loop().run_in_executor(None, grade_aggregates.rebuild, records)
+
+def complete_info_json(student_id: str, personal_info: StudentPersonal) -> bytes:
+    """StudentCompleteInfo as JSON bytes, built from already validated records."""
+    academic_info = academic_json.get(student_id)
+    return json_object((
+        ("personal_info", dumps(personal_info.dict())),
+        ("academic_info", b"null" if academic_info is None else academic_info),
+    ))
 
 @app.get("/students/{student_id}/complete", response_model=StudentCompleteInfo)
-def get_complete_student_info(student_id: str):
-    # Verify student exists in service1
-    if not verify_student_exists(student_id):
-        raise HTTPException(status_code=404, detail="Student not found in personal information service")
+async def get_complete_student_info(student_id: str):
+    # Get personal information from service1 (404 if the student does not exist)
+    personal_info = await get_student_personal_info(student_id, COMPLETE_STALE_MODE)
     
-    # Get personal information from service1
-    personal_info = get_student_personal_info(student_id)
+    if FAST_JSON:
+        return RawJSONResponse(complete_info_json(student_id, personal_info))
     
     # Get academic information from service2 (if exists)
     academic_info = student_academic_data.get(student_id)
@@ -117,5 +1055,54 @@ def get_complete_student_info(student_id: str):
         academic_info=academic_info
     )
 
+@app.post("/students:batchComplete", response_model=StudentCompleteBatch)
+async def batch_get_complete_student_info(batch: StudentBatchRequest):
+    """Complete info for many students, using one batched service1 lookup."""
+    if len(batch.student_ids) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SIZE} student ids per batch")
+    personal_records = await fetch_students_personal(batch.student_ids, BATCH_COMPLETE_STALE_MODE)
+    students = []
+    missing = []
+    for student_id in dict.fromkeys(batch.student_ids):
+        personal_info = personal_records[student_id]
+        if personal_info is None:
+            missing.append(student_id)
+        elif FAST_JSON:
+            students.append(complete_info_json(student_id, personal_info))
+        else:
+            students.append(StudentCompleteInfo(
+                personal_info=personal_info,
+                academic_info=student_academic_data.get(student_id)
+            ))
+    if FAST_JSON:
+        return RawJSONResponse(json_object((("students", json_array(students)), ("missing", dumps(missing)))))
+    return StudentCompleteBatch(students=students, missing=missing)
+
+async def fetch_service1_spans(trace_id: str) -> List[dict]:
+    """The spans every service1 shard recorded for a trace, for /debug/traces."""
+    async def from_shard(url: str) -> List[dict]:
+        try:
+            async with service1_session.get(f"{url}/debug/traces/{trace_id}") as response:
+                if response.status == 200:
+                    return (await response.json())["spans"]
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            pass
+        return []
+
+    answers = await asyncio.gather(*(from_shard(url) for url in service1_shards.urls))
+    return [span for spans in answers for span in spans]
+
+install_metrics(app, metrics)
+install_tracing(app, tracer, skip_paths=("/ready",), remote_spans=fetch_service1_spans)
+
+# With several workers, route each request to the worker(s) owning its students
+enable_worker_routing(app, worker_group,
+                      service2_routes(MAX_BATCH_SIZE, IMPORT_BATCH_SIZE, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, per_worker))
+# MessagePack and compressed bodies for clients that ask for them (outermost)
+install_negotiation(app)
+# GET /ready answers 200 once every startup handler above (journal recovery
+# included) has run
+startup.install_readiness(app, "service2")
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8081)
\ No newline at end of file
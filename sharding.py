@@ -0,0 +1,165 @@
+"""Consistent-hash shard map, and a tool to move records after the map changes.
+
+Rebalance after adding or removing shards (service1 first, since service2
+checks every imported record against it):
+
+    python -m sharding --service service1 --old URL1,URL2 --new URL1,URL2,URL3
+"""
+from bisect import bisect_right
+from hashlib import blake2b
+from typing import Dict, List, Optional
+import argparse
+import asyncio
+import json
+import os
+
+from startup import lazy_module
+
+# Only needed by rebalance(); the services import this module for ShardMap alone
+aiohttp = lazy_module("aiohttp")
+
+# Points each shard gets on the ring; more points spread keys more evenly
+SHARD_VIRTUAL_NODES = int(os.getenv("SHARD_VIRTUAL_NODES", "160"))
+
+def ring_hash(value: str) -> int:
+    """64-bit hash that is the same in every process (unlike hash())."""
+    return int.from_bytes(blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+class HashRing:
+    """Consistent hashing with virtual nodes.
+
+    Every node is placed at virtual_nodes points on a ring of 64-bit
+    hashes, and a key belongs to the node at the first point after the
+    key's hash. Adding or removing a node only moves the keys next to its
+    points, about 1/N of them, and placement does not depend on node order.
+    """
+
+    def __init__(self, nodes: List[str] = (), virtual_nodes: int = SHARD_VIRTUAL_NODES):
+        self.virtual_nodes = virtual_nodes
+        self._points: List[int] = []
+        self._owners: List[str] = []
+        self.nodes: List[str] = []
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: str) -> None:
+        if node in self.nodes:
+            return
+        self.nodes.append(node)
+        self._rebuild()
+
+    def remove(self, node: str) -> None:
+        self.nodes.remove(node)
+        self._rebuild()
+
+    def _rebuild(self) -> None:
+        points = sorted(
+            (ring_hash(f"{node}#{replica}"), node)
+            for node in self.nodes for replica in range(self.virtual_nodes)
+        )
+        self._points = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def owner(self, key: str) -> str:
+        if not self._points:
+            raise LookupError("The hash ring has no nodes")
+        position = bisect_right(self._points, ring_hash(key))
+        return self._owners[position % len(self._points)]
+
+class ShardMap:
+    """The instances of one service, each owning the student ids the ring gives it.
+
+    Has the same owner()/urls interface as workers.WorkerGroup, so a
+    WorkerRouter can route over shards; no shard is local to a ShardMap.
+    """
+
+    index: Optional[int] = None
+    home = 0
+
+    def __init__(self, urls: List[str], virtual_nodes: int = SHARD_VIRTUAL_NODES):
+        self.urls = [url.rstrip("/") for url in urls]
+        self.ring = HashRing(self.urls, virtual_nodes)
+        self._positions = {url: position for position, url in enumerate(self.urls)}
+
+    @classmethod
+    def from_env(cls, name: str, default: str) -> "ShardMap":
+        """Shard map from a comma-separated list of URLs in the environment variable name."""
+        return cls([url for url in os.getenv(name, default).split(",") if url])
+
+    @property
+    def count(self) -> int:
+        return len(self.urls)
+
+    def owner(self, student_id: str) -> int:
+        """Position in urls of the shard that owns student_id."""
+        return self._positions[self.ring.owner(student_id)]
+
+    def url_for(self, student_id: str) -> str:
+        return self.ring.owner(student_id)
+
+    def split(self, student_ids: List[str]) -> Dict[str, List[str]]:
+        """Group ids by the URL of their owning shard, keeping their order."""
+        parts: Dict[str, List[str]] = {}
+        for student_id in student_ids:
+            parts.setdefault(self.ring.owner(student_id), []).append(student_id)
+        return parts
+
+# Endpoints used to move one service's records between shards
+REBALANCE_ENDPOINTS = {
+    "service1": ("/students:export", "/students:import", "/students/{}"),
+    "service2": ("/students/academic:export", "/students/academic:import", "/students/{}/academic"),
+}
+
+async def rebalance(service: str, old_urls: List[str], new_urls: List[str], batch_size: int = 1000) -> Dict[str, int]:
+    """Move every record whose owner differs between the old and new shard maps.
+
+    Each old shard is exported, records that now belong elsewhere are
+    upserted into their new owner in batches, and deleted from the old
+    shard only once the new owner has accepted them.
+    """
+    export_path, import_path, delete_path = REBALANCE_ENDPOINTS[service]
+    new_map = ShardMap(new_urls)
+    moved = kept = failed = 0
+    async with aiohttp.ClientSession() as session:
+        for old_url in ShardMap(old_urls).urls:
+            pending: Dict[str, List[str]] = {}
+            async with session.get(old_url + export_path) as response:
+                response.raise_for_status()
+                async for line in response.content:
+                    if not line.strip():
+                        continue
+                    student_id = json.loads(line)["student_id"]
+                    target = new_map.url_for(student_id)
+                    if target == old_url.rstrip("/"):
+                        kept += 1
+                    else:
+                        pending.setdefault(target, []).append(line.decode("utf-8").rstrip("\n"))
+            for target, lines in pending.items():
+                for start in range(0, len(lines), batch_size):
+                    chunk = lines[start:start + batch_size]
+                    async with session.post(target + import_path, params={"mode": "upsert"},
+                                            data="\n".join(chunk)) as response:
+                        response.raise_for_status()
+                        results = [json.loads(r) for r in (await response.text()).splitlines()]
+                    for result in results:
+                        if "summary" in result:
+                            continue
+                        if result["status"] == "error":
+                            failed += 1
+                            continue
+                        async with session.delete(old_url + delete_path.format(result["student_id"])) as deleted:
+                            deleted.raise_for_status()
+                        moved += 1
+    return {"moved": moved, "kept": kept, "failed": failed}
+
+def main():
+    parser = argparse.ArgumentParser(description="Move records between shards after the shard list changes.")
+    parser.add_argument("--service", choices=sorted(REBALANCE_ENDPOINTS), required=True)
+    parser.add_argument("--old", required=True, help="comma-separated shard URLs before the change")
+    parser.add_argument("--new", required=True, help="comma-separated shard URLs after the change")
+    args = parser.parse_args()
+    result = asyncio.run(rebalance(args.service, args.old.split(","), args.new.split(",")))
+    print(json.dumps(result))
+
+if __name__ == "__main__":
+    main()
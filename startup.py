@@ -0,0 +1,163 @@
+from typing import Any, Dict, List, Optional
+import builtins
+import importlib
+import importlib.util
+import os
+import sys
+import time
+
+# Roughly when the process started: the services import this module before
+# anything else, so the timings below cover every other import
+PROCESS_STARTED = time.perf_counter()
+
+# Set STARTUP_PROFILE=1 to time every module imported until the service is
+# ready, print the slowest ones and serve them on GET /debug/startup
+STARTUP_PROFILE = os.getenv("STARTUP_PROFILE", "0") == "1"
+STARTUP_PROFILE_TOP = int(os.getenv("STARTUP_PROFILE_TOP", "25"))
+
+class LazyModule:
+    """A module imported on its first attribute access instead of up front."""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute: str) -> Any:
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attribute)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded yet"
+        return f"<lazy module {self._name!r} ({state})>"
+
+def lazy_module(name: str) -> LazyModule:
+    """A module needed only on some code paths, imported the first time one of them uses it."""
+    return LazyModule(name)
+
+def optional_module(name: str) -> Optional[LazyModule]:
+    """Like lazy_module, but None when the module is not installed (checked without importing it)."""
+    return LazyModule(name) if importlib.util.find_spec(name) is not None else None
+
+class ImportProfiler:
+    """Time the first import of every module by wrapping builtins.__import__.
+
+    Each module gets its cumulative time (including the modules it imports
+    in turn) and its own time (excluding them). Relative imports are counted
+    in the own time of the module that makes them. total is the time spent
+    in imports made while no other profiled import was running.
+    """
+
+    def __init__(self):
+        self.modules: Dict[str, List[float]] = {}
+        self.total = 0.0
+        self._stack: List[float] = []
+        self._original = None
+
+    def start(self) -> None:
+        if self._original is None:
+            self._original = builtins.__import__
+            builtins.__import__ = self._import
+
+    def stop(self) -> None:
+        if self._original is not None:
+            builtins.__import__ = self._original
+            self._original = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return self._original(name, globals, locals, fromlist, level)
+        started = time.perf_counter()
+        self._stack.append(0.0)
+        try:
+            return self._original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - started
+            nested = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += elapsed
+            else:
+                self.total += elapsed
+            self.modules.setdefault(name, [elapsed, elapsed - nested])
+
+    def slowest(self, top: int) -> List[Dict[str, Any]]:
+        ranked = sorted(self.modules.items(), key=lambda item: item[1][0], reverse=True)[:top]
+        return [{"module": name, "cumulative_ms": round(cumulative * 1000, 2), "own_ms": round(own * 1000, 2)}
+                for name, (cumulative, own) in ranked]
+
+import_profiler = ImportProfiler()
+if STARTUP_PROFILE:
+    import_profiler.start()
+
+class Readiness:
+    """Whether this process can take traffic, and how long it took to get there.
+
+    Created once the service module has built its app, so module_load is
+    its imports plus app construction; STARTUP_PROFILE splits the two.
+    """
+
+    def __init__(self, service: str):
+        self.service = service
+        self.ready = False
+        self.draining = False
+        self._constructed = time.perf_counter()
+        self._startup_began = self._constructed
+        module_load = self._constructed - PROCESS_STARTED
+        self.timings: Dict[str, float] = {"module_load_seconds": round(module_load, 4)}
+        if STARTUP_PROFILE:
+            self.timings["imports_seconds"] = round(import_profiler.total, 4)
+            self.timings["app_construction_seconds"] = round(module_load - import_profiler.total, 4)
+
+    async def starting(self) -> None:
+        self._startup_began = time.perf_counter()
+        self.timings["server_start_seconds"] = round(self._startup_began - self._constructed, 4)
+
+    async def started(self) -> None:
+        now = time.perf_counter()
+        self.timings["startup_handlers_seconds"] = round(now - self._startup_began, 4)
+        self.timings["ready_after_seconds"] = round(now - PROCESS_STARTED, 4)
+        if STARTUP_PROFILE:
+            import_profiler.stop()
+            print(f"{self.service} (pid {os.getpid()}) ready: {self.timings}", flush=True)
+            for row in import_profiler.slowest(STARTUP_PROFILE_TOP):
+                print(f"  {row['module']:40s} {row['cumulative_ms']:9.2f} ms  (own {row['own_ms']:.2f} ms)",
+                      flush=True)
+        self.ready = True
+
+    async def stopping(self) -> None:
+        self.ready = False
+        self.draining = True
+
+    def state(self) -> Dict[str, Any]:
+        return {"ready": self.ready, "draining": self.draining, "service": self.service, "pid": os.getpid(),
+                **self.timings}
+
+def install_readiness(app, service: str) -> Readiness:
+    """Serve GET /ready, answering 200 only while this process can take traffic.
+
+    It answers 503 until every startup handler (journal recovery, client
+    sessions, ...) has run and again as soon as shutdown begins, so a load
+    balancer or launcher stops sending requests before the process stops.
+    Call it after every other startup handler is registered. GET
+    /debug/startup serves the timings, with the import profile of
+    STARTUP_PROFILE=1.
+    """
+    readiness = Readiness(service)
+    app.router.on_startup.insert(0, readiness.starting)
+    app.add_event_handler("startup", readiness.started)
+    app.router.on_shutdown.insert(0, readiness.stopping)
+
+    # Imported here, not at the top, so the profile started above includes FastAPI
+    from fastapi.responses import JSONResponse
+
+    @app.get("/ready", include_in_schema=False)
+    def read_readiness():
+        return JSONResponse(readiness.state(), status_code=200 if readiness.ready else 503)
+
+    @app.get("/debug/startup", include_in_schema=False)
+    def read_startup_profile():
+        if not STARTUP_PROFILE:
+            return {"enabled": False, **readiness.timings}
+        return {"enabled": True, **readiness.timings, "slowest_imports": import_profiler.slowest(STARTUP_PROFILE_TOP)}
+
+    return readiness
@@ -0,0 +1,133 @@
+from array import array
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, Tuple
+import sys
+
+class PersonalCodec:
+    """Stores a flat model as a plain tuple of its field values, in field order."""
+
+    def __init__(self, model):
+        self.model = model
+        self.fields = tuple(model.__fields__)
+
+    def to_row(self, key: str, record) -> Tuple:
+        values = [getattr(record, field) for field in self.fields]
+        # Share the key object instead of keeping an equal copy of the id
+        if values[0] == key:
+            values[0] = key
+        return tuple(values)
+
+    def from_row(self, row: Tuple):
+        return self.model.construct(**dict(zip(self.fields, row)))
+
+    def release(self, row: Tuple) -> None:
+        """Called when a row is overwritten or deleted; plain tuples share nothing."""
+
+class AcademicCodec:
+    """Stores an academic record as (student_id, courses, graded courses, grades, status).
+
+    Course names and enrollment statuses repeat across thousands of
+    students, so they are interned, and identical course tuples are shared
+    between rows. Shared tuples are reference counted and forgotten once
+    no row uses them, so rewriting records does not grow the table.
+    Grades live in a compact array of doubles aligned with the
+    graded-course tuple.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._course_tuples: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+        self._references: Dict[Tuple[str, ...], int] = {}
+
+    def _shared(self, names) -> Tuple[str, ...]:
+        names = tuple(sys.intern(name) for name in names)
+        shared = self._course_tuples.setdefault(names, names)
+        self._references[shared] = self._references.get(shared, 0) + 1
+        return shared
+
+    def _unshare(self, names: Tuple[str, ...]) -> None:
+        remaining = self._references[names] - 1
+        if remaining:
+            self._references[names] = remaining
+        else:
+            del self._references[names]
+            del self._course_tuples[names]
+
+    def to_row(self, key: str, record) -> Tuple:
+        courses = self._shared(record.courses)
+        graded = self._shared(record.grades)
+        student_id = key if record.student_id == key else record.student_id
+        return (student_id, courses, graded, array("d", record.grades.values()),
+                sys.intern(record.enrollment_status))
+
+    def from_row(self, row: Tuple):
+        student_id, courses, graded, grades, enrollment_status = row
+        return self.model.construct(
+            student_id=student_id,
+            courses=list(courses),
+            grades=dict(zip(graded, grades)),
+            enrollment_status=enrollment_status,
+        )
+
+    def release(self, row: Tuple) -> None:
+        """Called when a row is overwritten or deleted, to drop its course tuples."""
+        self._unshare(row[1])
+        self._unshare(row[2])
+
+    def shared_tuples(self) -> int:
+        return len(self._course_tuples)
+
+class CompactStore(MutableMapping):
+    """Mapping of student_id to model that keeps compact rows instead of models.
+
+    Records are encoded with codec.to_row on write and rebuilt as models
+    (without re-validation) only when they are read at the API boundary.
+    Rows that are overwritten or deleted are handed to codec.release.
+    """
+
+    __slots__ = ("codec", "_rows")
+
+    def __init__(self, codec):
+        self.codec = codec
+        self._rows: Dict[str, Tuple] = {}
+
+    def __getitem__(self, key: str) -> Any:
+        return self.codec.from_row(self._rows[key])
+
+    def __setitem__(self, key: str, record: Any) -> None:
+        # Encoded before the old row is released, so tuples it shares with the new one are kept
+        row = self.codec.to_row(key, record)
+        old = self._rows.get(key)
+        self._rows[key] = row
+        if old is not None:
+            self.codec.release(old)
+
+    def __delitem__(self, key: str) -> None:
+        self.codec.release(self._rows.pop(key))
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._rows
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._rows)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        row = self._rows.get(key)
+        return default if row is None else self.codec.from_row(row)
+
+STORE_KINDS = ("dict", "compact")
+
+def make_store(kind: str, codec) -> MutableMapping:
+    """Create the record store for a service.
+
+    "dict" is a plain dict of models (the original behaviour); "compact"
+    is a CompactStore using the given codec.
+    """
+    if kind == "dict":
+        return {}
+    if kind == "compact":
+        return CompactStore(codec)
+    raise ValueError(f"Unknown store kind {kind!r}, expected one of {STORE_KINDS}")
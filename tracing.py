@@ -0,0 +1,304 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+import json
+import os
+import random
+import re
+import threading
+import time
+
+from fastapi import HTTPException, Query
+
+# Set TRACING_ENABLED=0 to stop recording spans and propagating trace context
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "1") == "1"
+
+# Recent traces kept in memory for /debug/traces; the oldest are dropped first
+TRACE_MAX_TRACES = int(os.getenv("TRACE_MAX_TRACES", "1000"))
+
+# Also append every finished span to this file as one JSON line (unset to disable)
+TRACE_EXPORT_FILE = os.getenv("TRACE_EXPORT_FILE")
+
+# W3C Trace Context header carrying the trace id and the caller's span id
+TRACEPARENT_HEADER = "traceparent"
+# Response header telling the client which trace its request was recorded under
+TRACE_ID_HEADER = "x-trace-id"
+
+_TRACEPARENT = re.compile(r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+def parse_traceparent(value: Optional[str]) -> Optional[Tuple[str, str]]:
+    """(trace id, parent span id) from a traceparent header, or None if it is not valid."""
+    match = _TRACEPARENT.match(value.strip().lower()) if value else None
+    if match is None or match.group(1) == "ff":
+        return None
+    trace_id, parent_id = match.group(2), match.group(3)
+    if trace_id == "0" * 32 or parent_id == "0" * 16:
+        return None
+    return trace_id, parent_id
+
+def new_trace_id() -> str:
+    return f"{random.getrandbits(128) or 1:032x}"
+
+def new_span_id() -> str:
+    return f"{random.getrandbits(64) or 1:016x}"
+
+class Span:
+    """One timed operation of a trace, recorded by the service that ran it."""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "service",
+                 "start_time", "duration", "attributes", "_started")
+
+    def __init__(self, trace_id: str, parent_id: Optional[str], name: str, kind: str, service: str,
+                 attributes: Dict[str, Any]):
+        self.trace_id = trace_id
+        self.span_id = new_span_id()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.service = service
+        self.start_time = time.time()
+        self.duration: Optional[float] = None
+        self.attributes = attributes
+        self._started = time.perf_counter()
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def end(self) -> None:
+        self.duration = time.perf_counter() - self._started
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "service": self.service,
+            "start_time": self.start_time,
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+        }
+
+class _NoSpan:
+    """Stands in for a span while tracing is disabled."""
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+NO_SPAN = _NoSpan()
+
+# The span the current task is working in; child spans and outgoing calls use it
+current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+class SpanCollector:
+    """Keeps the spans of the most recent traces, and optionally writes them to a file."""
+
+    def __init__(self, max_traces: int = TRACE_MAX_TRACES, export_file: Optional[str] = TRACE_EXPORT_FILE):
+        self.max_traces = max_traces
+        self._traces: "OrderedDict[str, List[Span]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Line buffered, so each span is one append and processes sharing the file don't interleave
+        self._file = open(export_file, "a", buffering=1, encoding="utf-8") if export_file else None
+        self.spans = 0
+        self.dropped_traces = 0
+
+    def add(self, span: Span) -> None:
+        with self._lock:
+            spans = self._traces.get(span.trace_id)
+            if spans is None:
+                spans = self._traces[span.trace_id] = []
+                if len(self._traces) > self.max_traces:
+                    self._traces.popitem(last=False)
+                    self.dropped_traces += 1
+            spans.append(span)
+            self.spans += 1
+            if self._file is not None:
+                self._file.write(json.dumps(span.to_dict()) + "\n")
+
+    def trace(self, trace_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            spans = list(self._traces.get(trace_id, ()))
+        return [span.to_dict() for span in spans]
+
+    def slowest(self, limit: int, min_duration_ms: float = 0) -> List[Dict[str, Any]]:
+        """The slowest recent traces, each with its per-span breakdown."""
+        with self._lock:
+            traces = [list(spans) for spans in self._traces.values()]
+        ranked = []
+        for spans in traces:
+            summary = summarize_trace([span.to_dict() for span in spans])
+            if summary["duration_ms"] >= min_duration_ms:
+                ranked.append(summary)
+        ranked.sort(key=lambda summary: summary["duration_ms"], reverse=True)
+        return ranked[:limit]
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+def summarize_trace(spans: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Order a trace's spans as a tree and work out each span's self time.
+
+    The trace's duration is that of its longest root span (a span whose
+    parent was not recorded here, e.g. the edge request). A span's self time
+    is its duration minus that of its direct children, so the spans with the
+    largest self time are where the time actually went.
+    """
+    by_id = {span["span_id"]: span for span in spans}
+    children: Dict[Optional[str], List[Dict[str, Any]]] = {}
+    for span in spans:
+        parent = span["parent_id"] if span["parent_id"] in by_id else None
+        children.setdefault(parent, []).append(span)
+    ordered = []
+
+    def visit(span: Dict[str, Any], depth: int) -> None:
+        kids = sorted(children.get(span["span_id"], ()), key=lambda child: child["start_time"])
+        self_ms = span["duration_ms"] - sum(child["duration_ms"] for child in kids)
+        ordered.append({**span, "depth": depth, "self_ms": round(max(self_ms, 0.0), 3)})
+        for child in kids:
+            visit(child, depth + 1)
+
+    roots = sorted(children.get(None, ()), key=lambda span: span["start_time"])
+    for root in roots:
+        visit(root, 0)
+    slowest_root = max(roots, key=lambda span: span["duration_ms"]) if roots else None
+    start = min((span["start_time"] for span in spans), default=0.0)
+    for span in ordered:
+        span["offset_ms"] = round((span["start_time"] - start) * 1000, 3)
+    return {
+        "trace_id": spans[0]["trace_id"] if spans else None,
+        "name": slowest_root["name"] if slowest_root else None,
+        "duration_ms": slowest_root["duration_ms"] if slowest_root else 0.0,
+        "start_time": start,
+        "services": sorted({span["service"] for span in spans}),
+        "spans": ordered,
+    }
+
+class Tracer:
+    """Starts the spans of one service and hands them to its collector."""
+
+    def __init__(self, service: str, collector: Optional[SpanCollector] = None, enabled: bool = TRACING_ENABLED):
+        self.service = service
+        self.enabled = enabled
+        self.collector = collector if collector is not None else SpanCollector()
+
+    @contextmanager
+    def span(self, name: str, kind: str = "internal", parent: Optional[Tuple[str, str]] = None,
+             **attributes: Any) -> Iterator[Any]:
+        """Time the body as a child of the current span (or of parent, a (trace id, span id) pair).
+
+        Without a current span or parent, the span starts a new trace.
+        """
+        if not self.enabled:
+            yield NO_SPAN
+            return
+        if parent is None:
+            outer = current_span.get()
+            parent = (outer.trace_id, outer.span_id) if outer is not None else (new_trace_id(), None)
+        span = Span(parent[0], parent[1], name, kind, self.service, attributes)
+        token = current_span.set(span)
+        try:
+            yield span
+        except BaseException as exc:
+            span.set("error", type(exc).__name__)
+            raise
+        finally:
+            current_span.reset(token)
+            span.end()
+            self.collector.add(span)
+
+    def headers(self) -> Dict[str, str]:
+        """Headers that continue the current trace in the service being called."""
+        span = current_span.get()
+        return {TRACEPARENT_HEADER: span.traceparent()} if span is not None else {}
+
+class TracingMiddleware:
+    """ASGI middleware recording a server span per request.
+
+    An incoming traceparent header is continued; otherwise the request
+    starts a new trace. The trace id is returned in the x-trace-id header.
+    """
+
+    def __init__(self, app, tracer: Tracer, skip_paths: Sequence[str] = ()):
+        self.app = app
+        self.tracer = tracer
+        self.skip_paths = tuple(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.skip_paths):
+            await self.app(scope, receive, send)
+            return
+        incoming = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                incoming = parse_traceparent(value.decode("latin-1"))
+                break
+
+        with self.tracer.span(f"{scope['method']} {scope['path']}", kind="server", parent=incoming) as span:
+            trace_header = (TRACE_ID_HEADER.encode(), span.trace_id.encode())
+
+            async def send_with_trace(message):
+                if message["type"] == "http.response.start":
+                    span.set("http.status_code", message["status"])
+                    message["headers"] = list(message.get("headers", ())) + [trace_header]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_trace)
+            finally:
+                # Name the span after the route template, as the metrics do
+                route = scope.get("route")
+                if route is not None:
+                    span.name = f"{scope['method']} {route.path}"
+
+def merge_slowest(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Merge /debug/traces answers from several processes, keeping the slowest overall."""
+    limit = results[0]["limit"]
+    traces = sorted((t for result in results for t in result["traces"]),
+                    key=lambda summary: summary["duration_ms"], reverse=True)
+    return {"limit": limit, "traces": traces[:limit]}
+
+def merge_trace(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Merge /debug/traces/{trace_id} answers from several processes."""
+    # Every process may have added the same remote spans, so keep each span once
+    spans = {span["span_id"]: span for result in results for span in result["spans"]}
+    return summarize_trace(list(spans.values()))
+
+def install_tracing(app, tracer: Tracer, skip_paths: Sequence[str] = (),
+                    remote_spans: Optional[Callable[[str], Awaitable[List[Dict[str, Any]]]]] = None) -> None:
+    """Add the /debug/traces endpoints to app and, if tracing is enabled, the request spans.
+
+    remote_spans(trace_id), if given, returns the spans other services
+    recorded for a trace, so the breakdown covers the whole call chain.
+    Call it after install_metrics, so the server span includes the metrics work.
+    """
+    async def with_remote(summary: Dict[str, Any]) -> Dict[str, Any]:
+        if remote_spans is None or summary["trace_id"] is None:
+            return summary
+        return summarize_trace(summary["spans"] + await remote_spans(summary["trace_id"]))
+
+    @app.get("/debug/traces", include_in_schema=False)
+    async def list_slowest_traces(limit: int = Query(10, ge=1, le=100), min_duration_ms: float = Query(0, ge=0)):
+        """The slowest recent traces, with every span's duration and self time."""
+        traces = tracer.collector.slowest(limit, min_duration_ms)
+        return {"limit": limit, "traces": [await with_remote(summary) for summary in traces]}
+
+    @app.get("/debug/traces/{trace_id}", include_in_schema=False)
+    async def read_trace(trace_id: str):
+        spans = tracer.collector.trace(trace_id)
+        if not spans:
+            raise HTTPException(status_code=404, detail="Trace not found")
+        return await with_remote(summarize_trace(spans))
+
+    if tracer.enabled:
+        app.add_middleware(TracingMiddleware, tracer=tracer, skip_paths=("/metrics", "/debug/") + tuple(skip_paths))
+
+        @app.on_event("shutdown")
+        def close_trace_export():
+            tracer.collector.close()
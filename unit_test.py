@@ -1,6 +1,10 @@
 import asyncio
 import aiohttp
+import importlib
 import json
+import os
+import tempfile
+import time
 
 # Base URLs for the services
 SERVICE1_URL = "http://localhost:8080"
@@ -144,6 +148,97 @@ class TestMicroservicesIntegration:
             async with session.delete(f"{SERVICE1_URL}/students/nonexistent") as response:
                 assert response.status == 404
 
+    @staticmethod
+    async def test_service1_paginated_list():
+        """Test Service 1: Cursor pagination and NDJSON streaming of the student list"""
+        async with aiohttp.ClientSession() as session:
+            for suffix in ["a", "b", "c"]:
+                student_data = {
+                    "student_id": f"s1_test007{suffix}",
+                    "first_name": "Page",
+                    "last_name": suffix.upper(),
+                    "email": f"page.{suffix}@test.com"
+                }
+                async with session.post(f"{SERVICE1_URL}/students", json=student_data) as response:
+                    assert response.status == 201
+            
+            # Walk the pages two at a time; ids come back sorted and exactly once
+            seen = []
+            cursor = None
+            while True:
+                params = {"limit": 2}
+                if cursor:
+                    params["cursor"] = cursor
+                async with session.get(f"{SERVICE1_URL}/students", params=params) as response:
+                    assert response.status == 200
+                    page = await response.json()
+                seen.extend(s["student_id"] for s in page["items"])
+                cursor = page["next_cursor"]
+                if cursor is None:
+                    break
+            assert seen == sorted(seen)
+            assert len(seen) == len(set(seen))
+            assert {"s1_test007a", "s1_test007b", "s1_test007c"} <= set(seen)
+            
+            # NDJSON streaming returns one record per line in the same order
+            async with session.get(f"{SERVICE1_URL}/students", params={"format": "ndjson"}) as response:
+                assert response.status == 200
+                lines = (await response.text()).splitlines()
+                streamed = [json.loads(line)["student_id"] for line in lines]
+                assert streamed == seen
+
+    @staticmethod
+    async def test_service1_batch_get_students():
+        """Test Service 1: Batch lookup returns found students and missing ids"""
+        async with aiohttp.ClientSession() as session:
+            student_data = {
+                "student_id": "s1_test006",
+                "first_name": "Grace",
+                "last_name": "Lee",
+                "email": "grace.lee@test.com"
+            }
+            
+            async with session.post(f"{SERVICE1_URL}/students", json=student_data) as response:
+                assert response.status == 201
+            
+            batch = {"student_ids": ["s1_test006", "nonexistent"]}
+            async with session.post(f"{SERVICE1_URL}/students:batchGet", json=batch) as response:
+                assert response.status == 200
+                result = await response.json()
+                assert [s["student_id"] for s in result["students"]] == ["s1_test006"]
+                assert result["missing"] == ["nonexistent"]
+
+    @staticmethod
+    async def test_service1_bulk_import_export():
+        """Test Service 1: NDJSON bulk import reports each line and export streams it back"""
+        async with aiohttp.ClientSession() as session:
+            lines = [
+                json.dumps({"student_id": "s1_test008a", "first_name": "Bulk", "last_name": "A", "email": "bulk.a@test.com"}),
+                "{not json",
+                json.dumps({"student_id": "s1_test008b", "first_name": "Bulk"}),
+                json.dumps({"student_id": "s1_test008a", "first_name": "Bulk", "last_name": "A", "email": "bulk.a@test.com"}),
+            ]
+            body = "\n".join(lines) + "\n"
+            headers = {"Content-Type": "application/x-ndjson"}
+            async with session.post(f"{SERVICE1_URL}/students:import", data=body, headers=headers) as response:
+                assert response.status == 200
+                results = [json.loads(line) for line in (await response.text()).splitlines()]
+            # One bad row does not abort the load; the duplicate is rejected in create mode
+            assert [r["status"] for r in results[:-1]] == ["created", "error", "error", "error"]
+            assert results[-1]["summary"] == {"created": 1, "updated": 0, "error": 3}
+            
+            upsert = json.dumps({"student_id": "s1_test008a", "first_name": "Bulk", "last_name": "Upserted", "email": "bulk.a@test.com"})
+            async with session.post(f"{SERVICE1_URL}/students:import", params={"mode": "upsert"},
+                                    data=upsert, headers=headers) as response:
+                results = [json.loads(line) for line in (await response.text()).splitlines()]
+                assert results[0] == {"line": 1, "status": "updated", "student_id": "s1_test008a"}
+            
+            async with session.get(f"{SERVICE1_URL}/students:export") as response:
+                assert response.status == 200
+                exported = {s["student_id"]: s for s in map(json.loads, (await response.text()).splitlines())}
+                assert exported["s1_test008a"]["last_name"] == "Upserted"
+                assert "s1_test008b" not in exported
+
     # SERVICE 2 TESTS
     
     @staticmethod
@@ -315,6 +410,541 @@ class TestMicroservicesIntegration:
             async with session.get(f"{SERVICE2_URL}/students/nonexistent/complete") as response:
                 assert response.status == 404
 
+    @staticmethod
+    async def test_service2_personal_cache():
+        """Test Service 2: Repeated reads are served from the personal-record cache"""
+        async with aiohttp.ClientSession() as session:
+            student_data = {
+                "student_id": "s2_test005",
+                "first_name": "Nina",
+                "last_name": "Patel",
+                "email": "nina.patel@test.com"
+            }
+            
+            async with session.post(f"{SERVICE1_URL}/students", json=student_data) as response:
+                assert response.status == 201
+            
+            async with session.get(f"{SERVICE2_URL}/cache/stats") as response:
+                assert response.status == 200
+                hits_before = (await response.json())["hits"]
+            
+            # First read fills the cache, the next two are cache hits
+            for _ in range(3):
+                async with session.get(f"{SERVICE2_URL}/students/s2_test005/complete") as response:
+                    assert response.status == 200
+                    complete_info = await response.json()
+                    assert complete_info["personal_info"]["first_name"] == "Nina"
+                    # Fresh data carries no staleness header
+                    assert "X-Stale-Age" not in response.headers
+            
+            async with session.get(f"{SERVICE2_URL}/cache/stats") as response:
+                stats = await response.json()
+                assert stats["hits"] >= hits_before + 2
+                assert stats["size"] >= 1
+                assert "stale_hits" in stats
+
+    @staticmethod
+    async def test_service2_change_feed_invalidation():
+        """Test Service 2: Personal updates in Service 1 reach the cached complete info"""
+        async with aiohttp.ClientSession() as session:
+            student_data = {
+                "student_id": "s2_test006",
+                "first_name": "Omar",
+                "last_name": "Haddad",
+                "email": "omar.haddad@test.com"
+            }
+            
+            async with session.post(f"{SERVICE1_URL}/students", json=student_data) as response:
+                assert response.status == 201
+            
+            # Cache the personal record in Service 2
+            async with session.get(f"{SERVICE2_URL}/students/s2_test006/complete") as response:
+                assert response.status == 200
+                assert (await response.json())["personal_info"]["last_name"] == "Haddad"
+            
+            # Update in Service 1; the change event should refresh Service 2's cache
+            updated_data = dict(student_data, last_name="Saleh")
+            async with session.put(f"{SERVICE1_URL}/students/s2_test006", json=updated_data) as response:
+                assert response.status == 200
+            
+            last_name = None
+            for _ in range(20):
+                async with session.get(f"{SERVICE2_URL}/students/s2_test006/complete") as response:
+                    assert response.status == 200
+                    last_name = (await response.json())["personal_info"]["last_name"]
+                if last_name == "Saleh":
+                    break
+                await asyncio.sleep(0.1)
+            assert last_name == "Saleh"
+
+    @staticmethod
+    async def test_service2_batch_complete_info():
+        """Test Service 2: Bulk complete info joins academic records with one batch lookup"""
+        async with aiohttp.ClientSession() as session:
+            for student_id, first_name in [("s2_test007", "Ivy"), ("s2_test008", "Leo")]:
+                student_data = {
+                    "student_id": student_id,
+                    "first_name": first_name,
+                    "last_name": "Tester",
+                    "email": f"{student_id}@test.com"
+                }
+                async with session.post(f"{SERVICE1_URL}/students", json=student_data) as response:
+                    assert response.status == 201
+            
+            academic_data = {
+                "student_id": "s2_test007",
+                "courses": ["Art"],
+                "grades": {"Art": 90.0},
+                "enrollment_status": "active"
+            }
+            async with session.post(f"{SERVICE2_URL}/students/s2_test007/academic", json=academic_data) as response:
+                assert response.status == 201
+            
+            batch = {"student_ids": ["s2_test007", "s2_test008", "nonexistent"]}
+            async with session.post(f"{SERVICE2_URL}/students:batchComplete", json=batch) as response:
+                assert response.status == 200
+                result = await response.json()
+                students = result["students"]
+                assert [s["personal_info"]["student_id"] for s in students] == ["s2_test007", "s2_test008"]
+                assert students[0]["academic_info"]["courses"] == ["Art"]
+                assert students[1]["academic_info"] is None
+                assert result["missing"] == ["nonexistent"]
+
+    @staticmethod
+    async def test_service2_request_coalescing():
+        """Test Service 2: Concurrent reads of one student share a single Service 1 lookup"""
+        async with aiohttp.ClientSession() as session:
+            student_data = {
+                "student_id": "s2_test009",
+                "first_name": "Zoe",
+                "last_name": "Martin",
+                "email": "zoe.martin@test.com"
+            }
+            
+            async with session.post(f"{SERVICE1_URL}/students", json=student_data) as response:
+                assert response.status == 201
+            
+            async with session.get(f"{SERVICE2_URL}/coalescing/stats") as response:
+                assert response.status == 200
+                calls_before = (await response.json())["single_flight"]["calls"]
+            
+            async def read_complete():
+                async with session.get(f"{SERVICE2_URL}/students/s2_test009/complete") as response:
+                    assert response.status == 200
+            
+            await asyncio.gather(*(read_complete() for _ in range(20)))
+            
+            async with session.get(f"{SERVICE2_URL}/coalescing/stats") as response:
+                stats = await response.json()
+                assert stats["single_flight"]["calls"] == calls_before + 1
+
+    @staticmethod
+    async def test_service2_filtered_academic_list():
+        """Test Service 2: Filter academic records by enrollment status and course"""
+        async with aiohttp.ClientSession() as session:
+            records = [
+                ("s2_test010", ["Quantum Basics", "Ethics"], "active"),
+                ("s2_test011", ["Quantum Basics"], "graduated"),
+                ("s2_test012", ["Ethics"], "active"),
+            ]
+            for student_id, courses, enrollment_status in records:
+                student_data = {
+                    "student_id": student_id,
+                    "first_name": "Filter",
+                    "last_name": "Tester",
+                    "email": f"{student_id}@test.com"
+                }
+                async with session.post(f"{SERVICE1_URL}/students", json=student_data) as response:
+                    assert response.status == 201
+                academic_data = {
+                    "student_id": student_id,
+                    "courses": courses,
+                    "grades": {course: 80.0 for course in courses},
+                    "enrollment_status": enrollment_status
+                }
+                async with session.post(f"{SERVICE2_URL}/students/{student_id}/academic", json=academic_data) as response:
+                    assert response.status == 201
+            
+            async with session.get(f"{SERVICE2_URL}/students/academic", params={"course": "Quantum Basics"}) as response:
+                assert response.status == 200
+                assert set(await response.json()) == {"s2_test010", "s2_test011"}
+            
+            params = {"course": "Quantum Basics", "enrollment_status": "active"}
+            async with session.get(f"{SERVICE2_URL}/students/academic", params=params) as response:
+                assert response.status == 200
+                assert set(await response.json()) == {"s2_test010"}
+            
+            # Updating the record moves it between index entries
+            updated_data = {
+                "student_id": "s2_test012",
+                "courses": ["Quantum Basics"],
+                "grades": {"Quantum Basics": 70.0},
+                "enrollment_status": "active"
+            }
+            async with session.put(f"{SERVICE2_URL}/students/s2_test012/academic", json=updated_data) as response:
+                assert response.status == 200
+            
+            params = {"course": "Quantum Basics", "enrollment_status": "active", "limit": 10}
+            async with session.get(f"{SERVICE2_URL}/students/academic", params=params) as response:
+                assert response.status == 200
+                page = await response.json()
+                assert [r["student_id"] for r in page["items"]] == ["s2_test010", "s2_test012"]
+            
+            async with session.get(f"{SERVICE2_URL}/students/academic", params={"course": "Ethics"}) as response:
+                assert set(await response.json()) == {"s2_test010"}
+
+    @staticmethod
+    async def test_service2_grade_stats():
+        """Test Service 2: Grade aggregates follow academic creates, updates and deletes"""
+        async with aiohttp.ClientSession() as session:
+            records = [
+                ("s2_test013", {"Astrophysics 901": 70.0, "Latin": 90.0}),
+                ("s2_test014", {"Astrophysics 901": 90.0}),
+            ]
+            for student_id, grades in records:
+                student_data = {
+                    "student_id": student_id,
+                    "first_name": "Stats",
+                    "last_name": "Tester",
+                    "email": f"{student_id}@test.com"
+                }
+                async with session.post(f"{SERVICE1_URL}/students", json=student_data) as response:
+                    assert response.status == 201
+                academic_data = {
+                    "student_id": student_id,
+                    "courses": list(grades),
+                    "grades": grades,
+                    "enrollment_status": "active"
+                }
+                async with session.post(f"{SERVICE2_URL}/students/{student_id}/academic", json=academic_data) as response:
+                    assert response.status == 201
+            
+            async with session.get(f"{SERVICE2_URL}/stats/courses/Astrophysics 901") as response:
+                assert response.status == 200
+                stats = await response.json()
+                assert stats["count"] == 2
+                assert stats["mean"] == 80.0
+                assert stats["min"] == 70.0 and stats["max"] == 90.0
+            
+            async with session.get(f"{SERVICE2_URL}/students/s2_test013/academic/stats") as response:
+                assert response.status == 200
+                assert (await response.json())["average"] == 80.0
+            
+            # Updating one grade and deleting the other record adjusts the running stats
+            updated_data = {
+                "student_id": "s2_test013",
+                "courses": ["Astrophysics 901"],
+                "grades": {"Astrophysics 901": 60.0},
+                "enrollment_status": "active"
+            }
+            async with session.put(f"{SERVICE2_URL}/students/s2_test013/academic", json=updated_data) as response:
+                assert response.status == 200
+            async with session.delete(f"{SERVICE2_URL}/students/s2_test014/academic") as response:
+                assert response.status == 204
+            
+            async with session.get(f"{SERVICE2_URL}/stats/courses/Astrophysics 901") as response:
+                stats = await response.json()
+                assert stats["count"] == 1
+                assert stats["min"] == 60.0 and stats["max"] == 60.0
+            
+            # A full rebuild gives the same answer
+            async with session.post(f"{SERVICE2_URL}/stats/rebuild") as response:
+                assert response.status == 200
+            async with session.get(f"{SERVICE2_URL}/stats/courses/Astrophysics 901") as response:
+                assert (await response.json())["mean"] == 60.0
+
+    @staticmethod
+    async def test_service2_bulk_import_export():
+        """Test Service 2: NDJSON bulk import checks students in service1 per batch"""
+        async with aiohttp.ClientSession() as session:
+            student_data = {
+                "student_id": "s2_test015",
+                "first_name": "Bulk",
+                "last_name": "Academic",
+                "email": "bulk.academic@test.com"
+            }
+            async with session.post(f"{SERVICE1_URL}/students", json=student_data) as response:
+                assert response.status == 201
+            
+            lines = [
+                json.dumps({"student_id": "s2_test015", "courses": ["Bulk Loading"],
+                            "grades": {"Bulk Loading": 88.0}, "enrollment_status": "active"}),
+                json.dumps({"student_id": "nonexistent", "courses": [], "grades": {}, "enrollment_status": "active"}),
+                json.dumps({"student_id": "s2_test015", "courses": "not a list"}),
+            ]
+            body = "\n".join(lines)
+            async with session.post(f"{SERVICE2_URL}/students/academic:import", data=body,
+                                    headers={"Content-Type": "application/x-ndjson"}) as response:
+                assert response.status == 200
+                results = [json.loads(line) for line in (await response.text()).splitlines()]
+            assert [r["status"] for r in results[:-1]] == ["created", "error", "error"]
+            assert results[1]["error"] == "Student not found in personal information service"
+            assert results[-1]["summary"] == {"created": 1, "updated": 0, "error": 2}
+            
+            # Imported records go through the same indexes and aggregates as single writes
+            async with session.get(f"{SERVICE2_URL}/stats/courses/Bulk Loading") as response:
+                assert (await response.json())["count"] == 1
+            
+            async with session.get(f"{SERVICE2_URL}/students/academic:export") as response:
+                assert response.status == 200
+                exported = [json.loads(line)["student_id"] for line in (await response.text()).splitlines()]
+                assert "s2_test015" in exported
+                assert exported == sorted(exported)
+
+    @staticmethod
+    async def test_service2_metrics():
+        """Test Service 2: /metrics reports route latency and service1 call metrics"""
+        async with aiohttp.ClientSession() as session:
+            student_data = {
+                "student_id": "s2_test016",
+                "first_name": "Metric",
+                "last_name": "Tester",
+                "email": "metric.tester@test.com"
+            }
+            async with session.post(f"{SERVICE1_URL}/students", json=student_data) as response:
+                assert response.status == 201
+            async with session.get(f"{SERVICE2_URL}/students/s2_test016/complete") as response:
+                assert response.status == 200
+            
+            async with session.get(f"{SERVICE2_URL}/metrics") as response:
+                assert response.status == 200
+                assert response.headers["Content-Type"].startswith("text/plain")
+                text = await response.text()
+            # Routes are labelled by template, not by the concrete path
+            assert 'http_request_duration_seconds_count{method="GET",route="/students/{student_id}/complete"}' in text
+            assert 'http_handler_duration_seconds_bucket{route="/students/{student_id}/complete",le="+Inf"}' in text
+            assert "service1_request_duration_seconds_count" in text
+            assert "academic_records_stored " in text
+            assert "service1_circuit_state{upstream=" in text
+            
+            async with session.get(f"{SERVICE1_URL}/metrics") as response:
+                assert response.status == 200
+                assert "students_stored " in await response.text()
+
+    @staticmethod
+    async def test_service2_tracing():
+        """Test Service 2: a caller's trace continues through Service 1 and shows in /debug/traces"""
+        async with aiohttp.ClientSession() as session:
+            student_data = {
+                "student_id": "s2_test017",
+                "first_name": "Trace",
+                "last_name": "Tester",
+                "email": "trace.tester@test.com"
+            }
+            async with session.post(f"{SERVICE1_URL}/students", json=student_data) as response:
+                assert response.status == 201
+            
+            # Not cached in Service 2 yet, so this request has to call Service 1
+            trace_id = "4bf92f3577b34da6a3ce929d0e0e4736"
+            headers = {"traceparent": f"00-{trace_id}-00f067aa0ba902b7-01"}
+            async with session.get(f"{SERVICE2_URL}/students/s2_test017/complete", headers=headers) as response:
+                assert response.status == 200
+                assert response.headers["X-Trace-Id"] == trace_id
+            
+            async with session.get(f"{SERVICE2_URL}/debug/traces/{trace_id}") as response:
+                assert response.status == 200
+                trace = await response.json()
+            assert trace["services"] == ["service1", "service2"]
+            spans = {span["span_id"]: span for span in trace["spans"]}
+            server = next(span for span in spans.values() if span["service"] == "service2" and span["kind"] == "server")
+            assert server["name"] == "GET /students/{student_id}/complete"
+            assert server["parent_id"] == "00f067aa0ba902b7"
+            # Service 1's span is a child of the client span that called it
+            remote = next(span for span in spans.values() if span["service"] == "service1")
+            assert spans[remote["parent_id"]]["kind"] == "client"
+            
+            async with session.get(f"{SERVICE2_URL}/debug/traces", params={"limit": 100}) as response:
+                assert response.status == 200
+                traces = (await response.json())["traces"]
+            durations = [t["duration_ms"] for t in traces]
+            assert durations == sorted(durations, reverse=True)
+            assert all(t["spans"] for t in traces)
+
+    @staticmethod
+    async def test_conditional_requests():
+        """Test both services: ETags, If-None-Match (304) and If-Match (412)"""
+        async with aiohttp.ClientSession() as session:
+            student_data = {
+                "student_id": "s2_test018",
+                "first_name": "Etta",
+                "last_name": "Gray",
+                "email": "etta.gray@test.com"
+            }
+            async with session.post(f"{SERVICE1_URL}/students", json=student_data) as response:
+                assert response.status == 201
+                created_etag = response.headers["ETag"]
+            
+            async with session.get(f"{SERVICE1_URL}/students/s2_test018") as response:
+                assert response.status == 200
+                assert response.headers["ETag"] == created_etag
+            async with session.get(f"{SERVICE1_URL}/students/s2_test018",
+                                   headers={"If-None-Match": created_etag}) as response:
+                assert response.status == 304
+                assert await response.read() == b""
+            
+            # A PUT against an outdated ETag is refused; the current one is accepted
+            updated = {**student_data, "first_name": "Etty"}
+            async with session.put(f"{SERVICE1_URL}/students/s2_test018", json=updated,
+                                   headers={"If-Match": '"outdated-1"'}) as response:
+                assert response.status == 412
+            async with session.put(f"{SERVICE1_URL}/students/s2_test018", json=updated,
+                                   headers={"If-Match": created_etag}) as response:
+                assert response.status == 200
+                updated_etag = response.headers["ETag"]
+            assert updated_etag != created_etag
+            async with session.get(f"{SERVICE1_URL}/students/s2_test018",
+                                   headers={"If-None-Match": created_etag}) as response:
+                assert response.status == 200
+                assert (await response.json())["first_name"] == "Etty"
+            
+            # Unchanged students are reported as not modified by the batch lookup
+            batch = {"student_ids": ["s2_test018"], "if_none_match": {"s2_test018": updated_etag}}
+            async with session.post(f"{SERVICE1_URL}/students:batchGet", json=batch) as response:
+                assert response.status == 200
+                result = await response.json()
+                assert result["students"] == []
+                assert result["not_modified"] == ["s2_test018"]
+                assert result["etags"]["s2_test018"] == updated_etag
+            
+            academic_data = {
+                "student_id": "s2_test018",
+                "courses": ["History"],
+                "grades": {"History": 81.0},
+                "enrollment_status": "active"
+            }
+            async with session.post(f"{SERVICE2_URL}/students/s2_test018/academic", json=academic_data) as response:
+                assert response.status == 201
+                academic_etag = response.headers["ETag"]
+            async with session.get(f"{SERVICE2_URL}/students/s2_test018/academic",
+                                   headers={"If-None-Match": academic_etag}) as response:
+                assert response.status == 304
+            async with session.put(f"{SERVICE2_URL}/students/s2_test018/academic", json=academic_data,
+                                   headers={"If-Match": '"outdated-1"'}) as response:
+                assert response.status == 412
+            
+            # List ETags hold until the next write
+            async with session.get(f"{SERVICE2_URL}/students/academic", params={"limit": 10}) as response:
+                assert response.status == 200
+                list_etag = response.headers["ETag"]
+            async with session.get(f"{SERVICE2_URL}/students/academic", params={"limit": 10},
+                                   headers={"If-None-Match": list_etag}) as response:
+                assert response.status == 304
+            async with session.put(f"{SERVICE2_URL}/students/s2_test018/academic", json=academic_data,
+                                   headers={"If-Match": academic_etag}) as response:
+                assert response.status == 200
+            async with session.get(f"{SERVICE2_URL}/students/academic", params={"limit": 10},
+                                   headers={"If-None-Match": list_etag}) as response:
+                assert response.status == 200
+
+    @staticmethod
+    async def test_content_negotiation():
+        """Test both services: compressed responses and MessagePack bodies"""
+        try:
+            import msgpack
+        except ImportError:
+            msgpack = None
+        async with aiohttp.ClientSession() as session:
+            student_data = {
+                "student_id": "s2_test019",
+                "first_name": "Milo",
+                "last_name": "Park",
+                "email": "milo.park@test.com",
+                "address": "Long Lane " * 200
+            }
+            async with session.post(f"{SERVICE1_URL}/students", json=student_data) as response:
+                assert response.status == 201
+            
+            async with session.get(f"{SERVICE1_URL}/students/s2_test019",
+                                   headers={"Accept-Encoding": "gzip"}) as response:
+                assert response.status == 200
+                assert response.headers.get("Content-Encoding") == "gzip"
+                assert "Accept-Encoding" in response.headers.get("Vary", "")
+                assert (await response.json())["address"] == student_data["address"]
+            
+            # Short answers are not worth compressing
+            async with session.get(f"{SERVICE1_URL}/students/nonexistent",
+                                   headers={"Accept-Encoding": "gzip"}) as response:
+                assert response.status == 404
+                assert "Content-Encoding" not in response.headers
+            
+            if msgpack is None:
+                return
+            body = msgpack.packb({"student_ids": ["s2_test019", "nonexistent"]})
+            async with session.post(f"{SERVICE1_URL}/students:batchGet", data=body,
+                                    headers={"Content-Type": "application/msgpack",
+                                             "Accept": "application/msgpack"}) as response:
+                assert response.status == 200
+                assert response.headers["Content-Type"] == "application/msgpack"
+                result = msgpack.unpackb(await response.read())
+                assert [s["first_name"] for s in result["students"]] == ["Milo"]
+                assert result["missing"] == ["nonexistent"]
+            async with session.get(f"{SERVICE2_URL}/students/s2_test019/complete",
+                                   headers={"Accept": "application/msgpack", "Accept-Encoding": "gzip"}) as response:
+                assert response.status == 200
+                assert response.headers["Content-Type"] == "application/msgpack"
+                assert response.headers.get("Content-Encoding") == "gzip"
+                info = msgpack.unpackb(await response.read())
+                assert info["personal_info"]["address"] == student_data["address"]
+
+    @staticmethod
+    async def test_service2_write_behind():
+        """Test Service 2: writes are applied directly, or acknowledged with 202 under write-behind"""
+        async with aiohttp.ClientSession() as session:
+            student_data = {
+                "student_id": "s2_test020",
+                "first_name": "Wren",
+                "last_name": "Hale",
+                "email": "wren.hale@test.com"
+            }
+            async with session.post(f"{SERVICE1_URL}/students", json=student_data) as response:
+                assert response.status == 201
+            academic_data = {
+                "student_id": "s2_test020",
+                "courses": ["Art"],
+                "grades": {"Art": 77.0},
+                "enrollment_status": "active"
+            }
+            async with session.post(f"{SERVICE2_URL}/students/s2_test020/academic", json=academic_data) as response:
+                assert response.status in (201, 202)
+                write_behind = response.status == 202
+                if write_behind:
+                    operation = await response.json()
+                    location = response.headers["Location"]
+                    assert operation["status"] == "pending"
+                else:
+                    # Write-behind is off (the default): the write was applied before the answer
+                    etag = response.headers["ETag"]
+            
+            if write_behind:
+                # Poll the operation until the background task has applied it
+                for _ in range(50):
+                    async with session.get(f"{SERVICE2_URL}{location}") as response:
+                        assert response.status == 200
+                        operation = await response.json()
+                    if operation["status"] != "pending":
+                        break
+                    await asyncio.sleep(0.05)
+                assert operation["status"] == "applied"
+                assert operation["status_code"] == 201
+                etag = operation["etag"]
+            async with session.get(f"{SERVICE2_URL}/students/s2_test020/academic") as response:
+                assert response.status == 200
+                assert response.headers["ETag"] == etag
+                assert (await response.json())["grades"] == {"Art": 77.0}
+            async with session.get(f"{SERVICE2_URL}/students/s2_test020/academic/operations/unknown") as response:
+                assert response.status == 404
+
+    @staticmethod
+    async def test_readiness():
+        """Test both services: /ready answers 200 with the startup timings once started"""
+        async with aiohttp.ClientSession() as session:
+            for url in (SERVICE1_URL, SERVICE2_URL):
+                async with session.get(f"{url}/ready") as response:
+                    assert response.status == 200
+                    readiness = await response.json()
+                    assert readiness["ready"] is True
+                    assert readiness["ready_after_seconds"] > 0
+
     @classmethod
     async def cleanup_test_data(cls):
         """Clean up all test data after tests"""
@@ -322,7 +952,11 @@ class TestMicroservicesIntegration:
             # All test student IDs used in tests
             test_ids = [
                 "s1_test001", "s1_test002", "s1_test003", "s1_test004", "s1_test005",
-                "s2_test001", "s2_test002", "s2_test003", "s2_test004"
+                "s1_test006", "s1_test007a", "s1_test007b", "s1_test007c", "s1_test008a",
+                "s2_test001", "s2_test002", "s2_test003", "s2_test004", "s2_test005",
+                "s2_test006", "s2_test007", "s2_test008", "s2_test009", "s2_test010",
+                "s2_test011", "s2_test012", "s2_test013", "s2_test014", "s2_test015", "s2_test016",
+                "s2_test017", "s2_test018", "s2_test019", "s2_test020"
             ]
             
             for student_id in test_ids:
@@ -340,6 +974,1330 @@ class TestMicroservicesIntegration:
                 except:
                     pass
 
+# Service 1 as seen by the in-process Service 2 of the component tests (StubService1 when one runs)
+STUB_SERVICE1_URL = "http://127.0.0.1:18999"
+
+def load_in_process(module):
+    """Import a service module for in-process tests: no persistence, workers or change feed."""
+    for name in ("SERVICE1_DATA_DIR", "SERVICE2_DATA_DIR", "WORKER_INDEX", "WORKER_URLS", "ACADEMIC_WRITE_BEHIND",
+                 "SERVICE1_SHARD_URLS", "SERVICE1_FEED_URLS", "FAST_JSON", "SERVICE1_ENCODING"):
+        os.environ.pop(name, None)
+    os.environ["SERVICE1_URL"] = STUB_SERVICE1_URL
+    os.environ["SERVICE1_CHANGE_FEED"] = "0"
+    return importlib.import_module(module)
+
+async def asgi_request(app, method, path, query="", body=b"", headers=None):
+    """Send one request straight to an ASGI app and return (status, headers, body)."""
+    raw_headers = [(b"host", b"localhost")]
+    raw_headers += [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]
+    if body and "content-type" not in {name.lower() for name in headers or {}}:
+        raw_headers.append((b"content-type", b"application/json"))
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": query.encode(),
+        "headers": raw_headers, "client": ("127.0.0.1", 1), "server": ("127.0.0.1", 80),
+    }
+    answer = {"status": None, "headers": {}, "body": b""}
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    finished = asyncio.Event()
+    
+    async def receive():
+        if messages:
+            return messages.pop()
+        # Streaming responses listen for a disconnect until they are done
+        await finished.wait()
+        return {"type": "http.disconnect"}
+    
+    async def send(message):
+        if message["type"] == "http.response.start":
+            answer["status"] = message["status"]
+            answer["headers"] = {name.decode().lower(): value.decode() for name, value in message["headers"]}
+        elif message["type"] == "http.response.body":
+            answer["body"] += message.get("body", b"")
+            if not message.get("more_body", False):
+                finished.set()
+    
+    await app(scope, receive, send)
+    return answer["status"], answer["headers"], answer["body"]
+
+class StubService1:
+    """A minimal Service 1 on STUB_SERVICE1_URL for the in-process Service 2, which can be made to fail."""
+    
+    def __init__(self):
+        self.students = {}
+        # While set, every lookup answers this status instead
+        self.failure_status = None
+        # Seconds every lookup takes
+        self.delay = 0.0
+        self.calls = 0
+        self.runner = None
+    
+    async def get_student(self, request):
+        from aiohttp import web
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.failure_status:
+            return web.json_response({"detail": "stub failure"}, status=self.failure_status)
+        student = self.students.get(request.match_info["student_id"])
+        if student is None:
+            return web.json_response({"detail": "Student not found"}, status=404)
+        return web.json_response(student)
+    
+    async def batch_get(self, request):
+        from aiohttp import web
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.failure_status:
+            return web.json_response({"detail": "stub failure"}, status=self.failure_status)
+        student_ids = (await request.json())["student_ids"]
+        return web.json_response({
+            "students": [self.students[i] for i in student_ids if i in self.students],
+            "missing": [i for i in student_ids if i not in self.students],
+        })
+    
+    async def start(self):
+        from aiohttp import web
+        app = web.Application()
+        app.router.add_get("/students/{student_id}", self.get_student)
+        app.router.add_post("/students:batchGet", self.batch_get)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        host, port = STUB_SERVICE1_URL.rsplit("/", 1)[1].split(":")
+        await web.TCPSite(self.runner, host, int(port)).start()
+    
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+# Internal URLs of the stub workers of the routing tests
+STUB_WORKER_URLS = [f"http://127.0.0.1:{18991 + index}" for index in range(3)]
+
+class StubWorker:
+    """One worker of a partitioned Service 1 for the routing tests, holding the students given to it."""
+    
+    def __init__(self, url):
+        self.url = url
+        self.students = {}
+        # List pages answered before every further list request fails (None: never)
+        self.pages_before_failure = None
+        self.forwarded = []
+        self.runner = None
+    
+    def remember(self, request):
+        self.forwarded.append(request.headers.get("x-worker-forwarded"))
+    
+    async def get_student(self, request):
+        from aiohttp import web
+        self.remember(request)
+        student = self.students.get(request.match_info["student_id"])
+        if student is None:
+            return web.json_response({"detail": "Student not found"}, status=404)
+        return web.json_response(student)
+    
+    async def batch_get(self, request):
+        from aiohttp import web
+        self.remember(request)
+        student_ids = (await request.json())["student_ids"]
+        return web.json_response({
+            "students": [self.students[i] for i in student_ids if i in self.students],
+            "missing": [i for i in student_ids if i not in self.students],
+        })
+    
+    async def list_students(self, request):
+        from aiohttp import web
+        from pagination import decode_cursor, encode_cursor
+        self.remember(request)
+        if self.pages_before_failure is not None:
+            if self.pages_before_failure == 0:
+                return web.json_response({"detail": "stub failure"}, status=500)
+            self.pages_before_failure -= 1
+        ordered = sorted(self.students)
+        if "limit" not in request.query:
+            return web.json_response({i: self.students[i] for i in ordered})
+        after = decode_cursor(request.query.get("cursor"))
+        limit = int(request.query["limit"])
+        remaining = [i for i in ordered if after is None or i > after]
+        items = [self.students[i] for i in remaining[:limit]]
+        next_cursor = encode_cursor(items[-1]["student_id"]) if len(remaining) > limit else None
+        return web.json_response({"items": items, "next_cursor": next_cursor})
+    
+    def add_routes(self, app):
+        app.router.add_get("/students/{student_id}", self.get_student)
+        app.router.add_post("/students:batchGet", self.batch_get)
+        app.router.add_get("/students", self.list_students)
+    
+    async def start(self):
+        from aiohttp import web
+        app = web.Application()
+        self.add_routes(app)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "127.0.0.1", int(self.url.rsplit(":", 1)[1])).start()
+    
+    async def stop(self):
+        await self.runner.cleanup()
+
+# URLs of the stub shards of the sharding tests
+STUB_SHARD_URLS = [f"http://127.0.0.1:{18994 + index}" for index in range(3)]
+
+class StubShard(StubWorker):
+    """One Service 1 shard for the sharding tests: also exports, imports, deletes and reports stats."""
+    
+    def __init__(self, url):
+        super().__init__(url)
+        self.imported = []
+        self.deleted = []
+    
+    async def export_students(self, request):
+        from aiohttp import web
+        lines = "".join(json.dumps(self.students[i]) + "\n" for i in sorted(self.students))
+        return web.Response(text=lines, content_type="application/x-ndjson")
+    
+    async def import_students(self, request):
+        from aiohttp import web
+        assert request.query["mode"] == "upsert"
+        results = []
+        for number, line in enumerate((await request.text()).splitlines(), start=1):
+            student = json.loads(line)
+            self.students[student["student_id"]] = student
+            self.imported.append(student["student_id"])
+            results.append(json.dumps({"line": number, "status": "created", "student_id": student["student_id"]}))
+        results.append(json.dumps({"summary": {"created": len(results)}}))
+        return web.Response(text="\n".join(results) + "\n", content_type="application/x-ndjson")
+    
+    async def delete_student(self, request):
+        from aiohttp import web
+        student_id = request.match_info["student_id"]
+        del self.students[student_id]
+        self.deleted.append(student_id)
+        return web.Response(status=204)
+    
+    async def stats(self, request):
+        from aiohttp import web
+        return web.json_response({"enabled": True, "records": len(self.students), "hit_ratio": 0.5})
+    
+    def add_routes(self, app):
+        super().add_routes(app)
+        app.router.add_get("/students:export", self.export_students)
+        app.router.add_post("/students:import", self.import_students)
+        app.router.add_delete("/students/{student_id}", self.delete_student)
+        app.router.add_get("/persistence/stats", self.stats)
+
+class RoutedWorkers:
+    """Worker 0 of a group of stub workers: a WorkerRouter in front of an app that marks local handling."""
+    
+    SECRET = "test-secret"
+    
+    def __init__(self, routes=None, student_count=30):
+        from routes import service1_routes
+        from workers import WorkerGroup, WorkerRouter, WorkerRouting, per_worker
+        self.group = WorkerGroup(0, STUB_WORKER_URLS, self.SECRET)
+        self.workers = [StubWorker(url) for url in STUB_WORKER_URLS]
+        self.students = {}
+        for number in range(student_count):
+            student_id = f"rw_{number:03d}"
+            self.students[student_id] = {"student_id": student_id, "first_name": f"Routed{number}"}
+            self.workers[self.group.owner(student_id)].students[student_id] = self.students[student_id]
+        self.local_requests = []
+        self.router = WorkerRouter(self.group, routes or service1_routes(1000, 500, 100, 1000, per_worker))
+        self.app = WorkerRouting(self.local_app, self.router)
+    
+    async def local_app(self, scope, receive, send):
+        self.local_requests.append(scope["path"])
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": b'{"local": true}'})
+    
+    async def __aenter__(self):
+        for worker in self.workers:
+            await worker.start()
+        await self.router.open()
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        await self.router.close()
+        for worker in self.workers:
+            await worker.stop()
+
+class TestComponents:
+    """In-process tests of the building blocks; they need no running services."""
+    
+    @staticmethod
+    async def close_service2(service2):
+        """Close an in-process Service 2's client and forget what its tests left in the cache and breakers."""
+        await service2.close_service1_session()
+        service2.personal_cache.clear()
+        service2.service1_resilience.breakers.clear()
+    
+    # PERSISTENCE TESTS
+    
+    @staticmethod
+    def recover_into(journal):
+        records = {}
+        
+        def apply(key, value):
+            if value is None:
+                records.pop(key, None)
+            else:
+                records[key] = value
+        return records, journal.recover(apply)
+    
+    @staticmethod
+    async def test_journal_torn_write_recovery():
+        """Test persistence: a torn final write is cut off and later commits survive the next restart"""
+        from persistence import Journal
+        with tempfile.TemporaryDirectory() as directory:
+            journal = Journal(directory, "always")
+            TestComponents.recover_into(journal)
+            for number in range(3):
+                journal.commit(journal.append(f"k{number}", {"n": number}))
+            journal.close()
+            # A crash in the middle of writing k3 (which was never acknowledged)
+            segment = sorted(name for name in os.listdir(directory) if name.startswith("wal-"))[-1]
+            with open(os.path.join(directory, segment), "ab") as f:
+                f.write(b'[4,"k3",{"n":')
+            
+            journal = Journal(directory, "always")
+            records, recovery = TestComponents.recover_into(journal)
+            assert sorted(records) == ["k0", "k1", "k2"]
+            assert recovery["truncated_bytes"] == len(b'[4,"k3",{"n":')
+            for number in range(4, 7):
+                journal.commit(journal.append(f"k{number}", {"n": number}))
+            journal.close()
+            
+            records, recovery = TestComponents.recover_into(Journal(directory, "always"))
+            assert sorted(records) == ["k0", "k1", "k2", "k4", "k5", "k6"]
+            assert recovery["truncated_bytes"] == 0
+    
+    @staticmethod
+    async def test_journal_corruption_fails_loudly():
+        """Test persistence: an unreadable entry before the end of the log stops recovery with an error"""
+        from persistence import CorruptJournalError, Journal
+        with tempfile.TemporaryDirectory() as directory:
+            journal = Journal(directory, "always")
+            TestComponents.recover_into(journal)
+            journal.commit(journal.append("k0", {"n": 0}))
+            journal.close()
+            segment = sorted(name for name in os.listdir(directory) if name.startswith("wal-"))[-1]
+            with open(os.path.join(directory, segment), "ab") as f:
+                f.write(b'garbage\n[2,"k1",{"n":1}]\n')
+            try:
+                TestComponents.recover_into(Journal(directory, "always"))
+            except CorruptJournalError:
+                pass
+            else:
+                raise AssertionError("recovery skipped a damaged entry")
+    
+    @staticmethod
+    async def test_journal_segment_rotation():
+        """Test persistence: a snapshot rotates the log, and recovery replays only the newer segment"""
+        from persistence import Journal
+        with tempfile.TemporaryDirectory() as directory:
+            journal = Journal(directory, "always")
+            records, _ = TestComponents.recover_into(journal)
+            for number in range(5):
+                journal.commit(journal.append(f"k{number}", {"n": number}))
+                records[f"k{number}"] = {"n": number}
+            snapshot = journal.snapshot(lambda: list(records.items()))
+            assert snapshot == {**snapshot, "snapshot_lsn": 5, "records": 5}
+            journal.commit(journal.append("k5", {"n": 5}))
+            journal.commit(journal.append("k0", None))
+            journal.close()
+            
+            files = sorted(os.listdir(directory))
+            assert files == ["snapshot-%020d.ndjson" % 5, "wal-%020d.log" % 6]
+            records, recovery = TestComponents.recover_into(Journal(directory, "always"))
+            assert sorted(records) == ["k1", "k2", "k3", "k4", "k5"]
+            assert recovery["snapshot_records"] == 5
+            assert recovery["replayed_entries"] == 2
+    
+    @staticmethod
+    async def test_journal_fsync_policies():
+        """Test persistence: every fsync policy makes committed entries durable and recoverable"""
+        from persistence import FSYNC_POLICIES, Journal
+        for policy in FSYNC_POLICIES:
+            with tempfile.TemporaryDirectory() as directory:
+                journal = Journal(directory, policy, interval=0.01)
+                TestComponents.recover_into(journal)
+                journal.start()
+                journal.commit(journal.append("sync", {"policy": policy}))
+                lsn = journal.append("async", {"policy": policy})
+                await asyncio.wait_for(journal.commit_async(lsn), timeout=5)
+                if policy in ("always", "group"):
+                    assert journal.durable_lsn >= lsn, policy
+                journal.close()
+                assert journal.durable_lsn == lsn, policy
+                
+                records, recovery = TestComponents.recover_into(Journal(directory, policy))
+                assert records == {"sync": {"policy": policy}, "async": {"policy": policy}}, policy
+                assert recovery["replayed_entries"] == 2, policy
+    
+    # FAST JSON TESTS
+    
+    @staticmethod
+    async def test_journal_shutdown_waits_for_snapshot():
+        """Test persistence: shutdown waits for a periodic snapshot already running, then snapshots and closes"""
+        import threading
+        from persistence import Journal, snapshot_periodically
+        service1 = load_in_process("service1")
+        saved = service1.journal, service1.snapshot_task, service1.snapshot_records
+        with tempfile.TemporaryDirectory() as directory:
+            journal = Journal(directory, "interval")
+            records, _ = TestComponents.recover_into(journal)
+            journal.start()
+            started, release = threading.Event(), threading.Event()
+            
+            def slow_records():
+                started.set()
+                release.wait(5)
+                return list(records.items())
+            
+            records["k0"] = {"n": 0}
+            journal.append("k0", {"n": 0})
+            task = asyncio.create_task(snapshot_periodically(journal, slow_records, 0.01, 1))
+            loop = asyncio.get_running_loop()
+            assert await loop.run_in_executor(None, started.wait, 5)
+            # Written during the periodic snapshot and not yet fsynced when shutdown begins
+            records["k1"] = {"n": 1}
+            journal.append("k1", {"n": 1})
+            service1.journal, service1.snapshot_task = journal, task
+            service1.snapshot_records = lambda: list(records.items())
+            try:
+                shutdown = asyncio.create_task(service1.close_journal())
+                await asyncio.sleep(0.1)
+                assert not shutdown.done(), "shutdown did not wait for the running snapshot"
+                release.set()
+                await asyncio.wait_for(shutdown, 5)
+            finally:
+                release.set()
+                service1.journal, service1.snapshot_task, service1.snapshot_records = saved
+            
+            assert task.cancelled() and journal.durable_lsn == journal.lsn == 2
+            assert sorted(os.listdir(directory)) == ["snapshot-%020d.ndjson" % 2, "wal-%020d.log" % 3]
+            recovered, recovery = TestComponents.recover_into(Journal(directory, "always"))
+            assert recovered == records and recovery["snapshot_records"] == 2
+    
+    @staticmethod
+    async def test_fast_json_matches_default_path():
+        """Test both services: FAST_JSON answers the same bytes and headers as the default path"""
+        service1 = load_in_process("service1")
+        service2 = load_in_process("service2")
+        for number in range(3):
+            student_id = f"fj_test{number}"
+            personal = {"student_id": student_id, "first_name": f"Fast{number}", "last_name": "Json",
+                        "email": f"{student_id}@test.com", "address": "Ünïcode Street"}
+            status, _, _ = await asgi_request(service1.app, "POST", "/students", body=json.dumps(personal).encode())
+            assert status == 201
+            service2.personal_cache.put(student_id, service2.StudentPersonal(**personal))
+            academic = {"student_id": student_id, "courses": ["Art", "Logic"],
+                        "grades": {"Art": 90.0, "Logic": 71.5}, "enrollment_status": "active"}
+            service2.write_academic_record(student_id, service2.StudentAcademic(**academic))
+        batch = json.dumps({"student_ids": ["fj_test0", "fj_test2", "missing"]}).encode()
+        # Only students whose personal data Service 2 has cached, so nothing calls Service 1
+        cached_batch = json.dumps({"student_ids": ["fj_test0", "fj_test2"]}).encode()
+        requests = [
+            (service1, "GET", "/students/fj_test1", "", b""),
+            (service1, "GET", "/students", "limit=2", b""),
+            (service1, "GET", "/students", "", b""),
+            (service1, "GET", "/students:export", "", b""),
+            (service1, "POST", "/students:batchGet", "", batch),
+            (service2, "GET", "/students/fj_test1/academic", "", b""),
+            (service2, "GET", "/students/fj_test1/complete", "", b""),
+            (service2, "GET", "/students/academic", "limit=2", b""),
+            (service2, "GET", "/students/academic:export", "", b""),
+            (service2, "POST", "/students:batchComplete", "", cached_batch),
+        ]
+        try:
+            for service, method, path, query, body in requests:
+                answers = []
+                for fast in (False, True):
+                    service.FAST_JSON = fast
+                    # Twice: the second answer comes from the encoded-record cache
+                    for _ in range(2):
+                        status, headers, content = await asgi_request(service.app, method, path, query, body)
+                        if headers["content-type"] == "application/x-ndjson":
+                            # The default NDJSON lines are json.dumps output: same records, other whitespace
+                            content = [json.loads(line) for line in content.splitlines()]
+                        answers.append((status, {name: headers.get(name) for name in
+                                                 ("content-type", "content-length", "etag")}, content))
+                assert all(answer == answers[0] for answer in answers), f"{method} {path}?{query}: {answers}"
+                assert answers[0][0] == 200
+        finally:
+            service1.FAST_JSON = service2.FAST_JSON = False
+            for number in range(3):
+                service1.write_student(f"fj_test{number}", None)
+                service2.write_academic_record(f"fj_test{number}", None)
+    
+    @staticmethod
+    async def test_fast_json_write_during_encoding():
+        """Test FAST_JSON: a record read just before a write is not served from the cache after it"""
+        from fastjson import RecordJSON
+        from pydantic import BaseModel
+        
+        class Record(BaseModel):
+            value: int
+        
+        class WrittenWhileRead(dict):
+            """A store where a write (and its invalidation) lands while get() encodes the old record."""
+            
+            def get(self, key, default=None):
+                record = super().get(key, default)
+                if record is not None and record.value == 1:
+                    self[key] = Record(value=2)
+                    encoded.invalidate(key)
+                return record
+        
+        store = WrittenWhileRead(k=Record(value=1))
+        encoded = RecordJSON(store, max_entries=1)
+        assert json.loads(encoded.get("k")) == {"value": 1}
+        assert json.loads(encoded.get("k")) == {"value": 2}
+        assert json.loads(encoded.get("k")) == {"value": 2}
+        store["other"] = Record(value=3)
+        assert json.loads(encoded.get("other")) == {"value": 3}
+        assert encoded.stats() == {"encoded": 1, "max_entries": 1, "hits": 1, "misses": 3}
+    
+    # NEGOTIATION TESTS
+    
+    @staticmethod
+    async def test_negotiated_etags_and_vary():
+        """Test negotiation: encoded answers have their own ETag, 304s have no body length, Vary is always sent"""
+        from negotiation import msgpack
+        service1 = load_in_process("service1")
+        student = {"student_id": "ng_test1", "first_name": "Vera", "last_name": "Ryan",
+                   "email": "vera@test.com", "address": "Long Road " * 200}
+        status, headers, _ = await asgi_request(service1.app, "POST", "/students", body=json.dumps(student).encode())
+        assert status == 201
+        etag = headers["etag"]
+        path = "/students/ng_test1"
+        try:
+            status, headers, _ = await asgi_request(service1.app, "GET", path)
+            assert status == 200 and headers["etag"] == etag
+            assert "Accept-Encoding" in headers["vary"]
+            assert ("Accept" in [v.strip() for v in headers["vary"].split(",")]) == (msgpack is not None)
+            
+            status, headers, _ = await asgi_request(service1.app, "GET", path, headers={"Accept-Encoding": "gzip"})
+            assert headers["content-encoding"] == "gzip"
+            gzip_etag = headers["etag"]
+            assert gzip_etag == etag[:-1] + '-gzip"'
+            
+            # Revalidating the compressed copy confirms that copy, with no Content-Length: 0
+            status, headers, body = await asgi_request(service1.app, "GET", path, headers={
+                "Accept-Encoding": "gzip", "If-None-Match": gzip_etag})
+            assert status == 304 and body == b""
+            assert headers["etag"] == gzip_etag and "content-length" not in headers
+            assert "Accept-Encoding" in headers["vary"]
+            status, headers, _ = await asgi_request(service1.app, "GET", path, headers={"If-None-Match": etag})
+            assert status == 304 and headers["etag"] == etag
+            
+            if msgpack is not None:
+                status, headers, _ = await asgi_request(service1.app, "GET", path, headers={
+                    "Accept": "application/msgpack", "Accept-Encoding": "gzip"})
+                assert headers["etag"] == etag[:-1] + '-msgpack-gzip"'
+                status, _, _ = await asgi_request(service1.app, "GET", path, headers={
+                    "Accept": "application/msgpack", "If-None-Match": headers["etag"]})
+                assert status == 304
+            
+            # The ETag of an encoded copy is good for a conditional update
+            status, headers, _ = await asgi_request(service1.app, "PUT", path, body=json.dumps(student).encode(),
+                                                    headers={"If-Match": gzip_etag})
+            assert status == 200 and headers["etag"] != etag
+            status, _, _ = await asgi_request(service1.app, "PUT", path, body=json.dumps(student).encode(),
+                                              headers={"If-Match": gzip_etag})
+            assert status == 412
+            
+            # Small answers are not compressed, but still vary on Accept-Encoding
+            status, headers, _ = await asgi_request(service1.app, "GET", "/students/ng_missing",
+                                                    headers={"Accept-Encoding": "gzip"})
+            assert status == 404 and "content-encoding" not in headers and "Accept-Encoding" in headers["vary"]
+        finally:
+            service1.write_student("ng_test1", None)
+    
+    # STALE PERSONAL DATA TESTS
+    
+    @staticmethod
+    async def test_single_flight_many():
+        """Test coalescing: do_many fetches the keys not in flight in one call and shares the rest"""
+        from coalesce import SingleFlight
+        single_flight = SingleFlight()
+        batches = []
+        
+        async def fetch_many(keys):
+            batches.append(keys)
+            await asyncio.sleep(0.05)
+            return {key: key.upper() for key in keys}
+        
+        async def fetch_one():
+            await asyncio.sleep(0.05)
+            return "A (single)"
+        
+        results = await asyncio.gather(
+            single_flight.do("a", fetch_one),
+            single_flight.do_many(["a", "b", "c", "b"], fetch_many),
+            single_flight.do_many(["c", "d"], fetch_many),
+        )
+        assert results[1] == {"a": "A (single)", "b": "B", "c": "C"}
+        assert results[2] == {"c": "C", "d": "D"}
+        assert batches == [["b", "c"], ["d"]]
+        assert single_flight.stats()["in_flight"] == 0
+        assert (single_flight.calls, single_flight.shared) == (4, 2)
+    
+    @staticmethod
+    async def test_service2_feed_events_during_lookup():
+        """Test Service 2: a feed event only keeps the answer of a lookup in flight for the same student out of the cache"""
+        from cache import MISSING
+        service2 = load_in_process("service2")
+        stub = StubService1()
+        for student_id in ("fe_test1", "fe_test2", "fe_test3"):
+            stub.students[student_id] = {"student_id": student_id, "first_name": "Feed", "last_name": "Tester",
+                                         "email": f"{student_id}@test.com", "phone": None, "address": None}
+        stub.delay = 0.2
+        await stub.start()
+        await service2.open_service1_session()
+        feed = {"connected": True, "feed_id": None, "last_seq": 0}
+        seq = iter(range(1, 100))
+        
+        def updated(student_id):
+            return {"type": "updated", "seq": next(seq), "student_id": student_id, "record": stub.students[student_id]}
+        
+        async def during_lookup(lookup, *events):
+            task = asyncio.create_task(lookup)
+            await asyncio.sleep(0.05)
+            for event in events:
+                service2.apply_change_event(feed, event)
+            return await task
+        
+        try:
+            service2.apply_change_event(feed, {"type": "hello", "feed_id": "fe-feed", "seq": 0})
+            # Events about other students, however many, do not stop the answer being cached
+            await during_lookup(service2.load_student_personal("fe_test1"), updated("fe_test2"), updated("fe_test3"))
+            assert service2.personal_cache.get("fe_test1") is not MISSING
+            # An event about the student looked up may be newer than the answer
+            await during_lookup(service2.load_student_personal("fe_test2"), updated("fe_test2"))
+            assert service2.personal_cache.get("fe_test2") is MISSING
+            # In a batch only the students with an event are left out
+            answers = await during_lookup(service2.load_students_personal(["fe_test2", "fe_test3"]),
+                                          updated("fe_test3"))
+            assert set(answers) == {"fe_test2", "fe_test3"}
+            assert service2.personal_cache.get("fe_test2") is not MISSING
+            assert service2.personal_cache.get("fe_test3") is MISSING
+            # A reset may have skipped events about anyone
+            await during_lookup(service2.load_student_personal("fe_test3"),
+                                {"type": "reset", "feed_id": "fe-feed", "seq": next(seq)})
+            assert service2.personal_cache.get("fe_test3") is MISSING
+        finally:
+            await TestComponents.close_service2(service2)
+            service2.personal_cache.clear()
+            await stub.stop()
+    
+    @staticmethod
+    async def test_service2_stale_if_error():
+        """Test Service 2: when Service 1 fails after the cache warmed, old data comes back with X-Stale-Age"""
+        from cache import TTLCache
+        service2 = load_in_process("service2")
+        stub = StubService1()
+        stub.students["st_test1"] = {"student_id": "st_test1", "first_name": "Old", "last_name": "Name",
+                                     "email": "old@test.com", "phone": None, "address": None}
+        await stub.start()
+        await service2.open_service1_session()
+        cache = service2.personal_cache
+        service2.personal_cache = TTLCache(100, ttl=0.05, negative_ttl=0.05, stale_ttl=60)
+        try:
+            status, headers, body = await asgi_request(service2.app, "GET", "/students/st_test1/complete")
+            assert status == 200 and "x-stale-age" not in headers
+            stub.students["st_test1"]["first_name"] = "New"
+            stub.failure_status = 503
+            await asyncio.sleep(0.1)
+            stale_hits = service2.personal_cache.stats()["stale_hits"]
+            status, headers, body = await asgi_request(service2.app, "GET", "/students/st_test1/complete")
+            assert status == 200, body
+            assert json.loads(body)["personal_info"]["first_name"] == "Old"
+            assert int(headers["x-stale-age"]) >= 0
+            status, headers, body = await asgi_request(service2.app, "POST", "/students:batchComplete",
+                                                       body=json.dumps({"student_ids": ["st_test1"]}).encode())
+            assert status == 200 and json.loads(body)["students"][0]["personal_info"]["first_name"] == "Old"
+            assert "x-stale-age" in headers
+            _, _, body = await asgi_request(service2.app, "GET", "/cache/stats")
+            assert json.loads(body)["stale_hits"] == stale_hits + 2
+            # Without a stale copy the failure still surfaces as a 503
+            status, _, _ = await asgi_request(service2.app, "GET", "/students/never_cached/complete")
+            assert status == 503
+        finally:
+            await TestComponents.close_service2(service2)
+            service2.personal_cache = cache
+            await stub.stop()
+    
+    @staticmethod
+    async def test_service2_stale_revalidate_single_flight():
+        """Test Service 2: revalidate serves stale data at once and concurrent requests share one refresh"""
+        from cache import TTLCache
+        service2 = load_in_process("service2")
+        stub = StubService1()
+        for number in range(2):
+            stub.students[f"st_test{number}"] = {"student_id": f"st_test{number}", "first_name": "Old",
+                                                 "last_name": "Name", "email": "old@test.com"}
+        await stub.start()
+        await service2.open_service1_session()
+        cache, mode = service2.personal_cache, service2.BATCH_COMPLETE_STALE_MODE
+        service2.personal_cache = TTLCache(100, ttl=0.05, negative_ttl=0.05, stale_ttl=60)
+        service2.BATCH_COMPLETE_STALE_MODE = service2.STALE_REVALIDATE
+        batch = json.dumps({"student_ids": ["st_test0", "st_test1"]}).encode()
+        try:
+            status, _, _ = await asgi_request(service2.app, "POST", "/students:batchComplete", body=batch)
+            assert status == 200 and stub.calls == 1
+            await asyncio.sleep(0.1)
+            for student in stub.students.values():
+                student["first_name"] = "New"
+            stub.delay = 0.2
+            started = time.perf_counter()
+            answers = await asyncio.gather(*(
+                asgi_request(service2.app, "POST", "/students:batchComplete", body=batch) for _ in range(5)
+            ))
+            assert time.perf_counter() - started < 0.15, "stale records should be served without waiting"
+            for status, headers, body in answers:
+                assert status == 200 and "x-stale-age" in headers
+                assert {s["personal_info"]["first_name"] for s in json.loads(body)["students"]} == {"Old"}
+            await asyncio.gather(*service2.stale_refresh_tasks)
+            assert stub.calls == 2, f"{stub.calls - 1} refreshes for one set of stale records"
+            status, headers, body = await asgi_request(service2.app, "POST", "/students:batchComplete", body=batch)
+            assert "x-stale-age" not in headers
+            assert {s["personal_info"]["first_name"] for s in json.loads(body)["students"]} == {"New"}
+        finally:
+            await TestComponents.close_service2(service2)
+            service2.personal_cache, service2.BATCH_COMPLETE_STALE_MODE = cache, mode
+            await stub.stop()
+    
+    # WORKER ROUTING TESTS
+    
+    @staticmethod
+    async def test_worker_partitioning():
+        """Test workers: every process places a student on the same worker, and the partitions are balanced"""
+        from workers import WorkerGroup, enable_worker_routing
+        groups = [WorkerGroup(index, STUB_WORKER_URLS, "secret") for index in range(3)]
+        student_ids = [f"student{number}" for number in range(3000)]
+        owners = [groups[0].owner(student_id) for student_id in student_ids]
+        assert all(group.owner(student_id) == owner
+                   for group in groups[1:] for student_id, owner in zip(student_ids, owners))
+        assert all(800 < owners.count(index) < 1200 for index in range(3)), [owners.count(i) for i in range(3)]
+        assert groups[2].data_dir("/data") == os.path.join("/data", "worker-2")
+        assert WorkerGroup(0, STUB_WORKER_URLS[:1]).data_dir("/data") == "/data"
+        try:
+            enable_worker_routing(None, WorkerGroup(0, STUB_WORKER_URLS), [])
+            assert False, "several workers without a secret should be refused"
+        except ValueError:
+            pass
+    
+    @staticmethod
+    async def test_worker_forwarding():
+        """Test workers: requests go to the owning worker, and only the group's secret marks them as routed"""
+        async with RoutedWorkers() as routed:
+            for student_id, student in routed.students.items():
+                status, _, body = await asgi_request(routed.app, "GET", f"/students/{student_id}")
+                assert status == 200
+                owner = routed.group.owner(student_id)
+                assert json.loads(body) == ({"local": True} if owner == 0 else student)
+            assert routed.local_requests == [f"/students/{i}" for i in routed.students if routed.group.owner(i) == 0]
+            assert {value for worker in routed.workers for value in worker.forwarded} == {RoutedWorkers.SECRET}
+            
+            remote_id = next(i for i in routed.students if routed.group.owner(i) != 0)
+            routed.local_requests.clear()
+            for value in ("1", "wrong-secret"):
+                status, _, body = await asgi_request(routed.app, "GET", f"/students/{remote_id}",
+                                                     headers={"X-Worker-Forwarded": value})
+                assert json.loads(body) == routed.students[remote_id], "a client cannot skip routing"
+            # The client's header is not passed on either
+            assert routed.workers[routed.group.owner(remote_id)].forwarded[-1] == RoutedWorkers.SECRET
+            status, _, body = await asgi_request(routed.app, "GET", f"/students/{remote_id}",
+                                                 headers={"X-Worker-Forwarded": RoutedWorkers.SECRET})
+            assert json.loads(body) == {"local": True}
+            assert routed.local_requests == [f"/students/{remote_id}"]
+    
+    @staticmethod
+    async def test_worker_merging():
+        """Test workers: batches are split by owner and lists merged in order, as one worker would answer"""
+        from workers import per_worker
+        async with RoutedWorkers() as routed:
+            ids = sorted(routed.students)
+            requested = [ids[7], "rw_missing", ids[2], ids[29], ids[7], ids[11]]
+            status, _, body = await asgi_request(routed.app, "POST", "/students:batchGet",
+                                                 body=json.dumps({"student_ids": requested}).encode())
+            answer = json.loads(body)
+            assert status == 200
+            assert [s["student_id"] for s in answer["students"]] == [ids[7], ids[2], ids[29], ids[11]]
+            assert answer["missing"] == ["rw_missing"]
+            
+            seen, cursor = [], None
+            while True:
+                status, _, body = await asgi_request(routed.app, "GET", "/students",
+                                                     f"limit=4&cursor={cursor}" if cursor else "limit=4")
+                page = json.loads(body)
+                assert status == 200 and len(page["items"]) <= 4
+                seen += [item["student_id"] for item in page["items"]]
+                cursor = page["next_cursor"]
+                if cursor is None:
+                    break
+            assert seen == ids
+            status, _, body = await asgi_request(routed.app, "GET", "/students")
+            assert list(json.loads(body)) == ids
+            status, headers, body = await asgi_request(routed.app, "GET", "/students:export")
+            assert [json.loads(line)["student_id"] for line in body.splitlines()] == ids
+        
+        merged = per_worker([
+            {"hits": 3, "hit_ratio": 0.5, "enabled": True, "single_flight": {"calls": 2, "in_flight": 0}},
+            {"hits": 5, "hit_ratio": 1.0, "enabled": True, "single_flight": {"calls": 1, "in_flight": 1}},
+        ])
+        assert merged["hits"] == 8 and merged["hit_ratio"] == 0.75 and merged["enabled"] is True
+        assert merged["single_flight"] == {"calls": 3, "in_flight": 1}
+        assert [worker["hits"] for worker in merged["workers"]] == [3, 5]
+    
+    @staticmethod
+    async def test_worker_stream_failure_aborts():
+        """Test workers: a worker failing partway through a merged export aborts the stream instead of cutting it short"""
+        from workers import Route, StreamAborted, merge_list
+        routes = [Route("GET", "/students:export", merge_list("/students", 100, 1000, ndjson=True, chunk_records=4))]
+        async with RoutedWorkers(routes) as routed:
+            status, _, body = await asgi_request(routed.app, "GET", "/students:export")
+            assert status == 200 and len(body.splitlines()) == len(routed.students)
+            routed.workers[1].pages_before_failure = 1
+            try:
+                await asgi_request(routed.app, "GET", "/students:export")
+                assert False, "a failed page should abort the stream"
+            except Exception as exc:
+                # Depending on the Starlette version it arrives inside an exception group
+                assert any(isinstance(error, StreamAborted) for error in getattr(exc, "exceptions", [exc])), exc
+            # A failure on the first page is still answered with its own status
+            routed.workers[1].pages_before_failure = 0
+            status, _, _ = await asgi_request(routed.app, "GET", "/students:export")
+            assert status == 500
+    
+    # SHARDING TESTS
+    
+    @staticmethod
+    async def test_hash_ring_placement():
+        """Test sharding: owners are stable and balanced, and adding a shard only moves keys onto it"""
+        from sharding import HashRing, ShardMap
+        keys = [f"student{number}" for number in range(6000)]
+        ring = HashRing(["a", "b", "c"])
+        owners = {key: ring.owner(key) for key in keys}
+        # The same in any process and whatever order the nodes were added in
+        assert all(HashRing(["c", "a", "b"]).owner(key) == owner for key, owner in owners.items())
+        assert all(1500 < list(owners.values()).count(node) < 2500 for node in "abc")
+        
+        ring.add("d")
+        moved = [key for key in keys if ring.owner(key) != owners[key]]
+        assert all(ring.owner(key) == "d" for key in moved), "keys may only move to the new shard"
+        assert 0.15 < len(moved) / len(keys) < 0.35, len(moved)
+        ring.remove("d")
+        assert all(ring.owner(key) == owner for key, owner in owners.items())
+        
+        shards = ShardMap(["http://s0/", "http://s1", "http://s2"])
+        assert shards.urls == ["http://s0", "http://s1", "http://s2"]
+        assert all(shards.urls[shards.owner(key)] == shards.url_for(key) for key in keys[:500])
+        assert shards.split(keys[:6]) == {url: [k for k in keys[:6] if shards.url_for(k) == url]
+                                          for url in dict.fromkeys(shards.url_for(k) for k in keys[:6])}
+        try:
+            HashRing().owner("anything")
+            assert False, "an empty ring should have no owner"
+        except LookupError:
+            pass
+    
+    @staticmethod
+    async def test_rebalance_moves_only_affected_keys():
+        """Test sharding: rebalance moves exactly the records whose owner changed, and deletes them only after"""
+        from sharding import ShardMap, rebalance
+        shards = [StubShard(url) for url in STUB_SHARD_URLS]
+        old_map, new_map = ShardMap(STUB_SHARD_URLS[:2]), ShardMap(STUB_SHARD_URLS)
+        students = {f"rb_{number:04d}": {"student_id": f"rb_{number:04d}", "first_name": "Moved"}
+                    for number in range(600)}
+        for student_id, student in students.items():
+            shards[old_map.owner(student_id)].students[student_id] = student
+        affected = sorted(i for i in students if new_map.url_for(i) != old_map.url_for(i))
+        for shard in shards:
+            await shard.start()
+        try:
+            result = await rebalance("service1", STUB_SHARD_URLS[:2], STUB_SHARD_URLS, batch_size=50)
+            assert result == {"moved": len(affected), "kept": len(students) - len(affected), "failed": 0}
+            assert 0 < len(affected) < len(students) / 2
+            for shard in shards:
+                assert sorted(shard.students) == sorted(i for i in students if new_map.url_for(i) == shard.url)
+            assert sorted(shards[2].imported) == affected and not shards[0].imported and not shards[1].imported
+            assert sorted(shards[0].deleted + shards[1].deleted) == affected
+            # Running it again finds nothing left to move
+            result = await rebalance("service1", STUB_SHARD_URLS, STUB_SHARD_URLS)
+            assert result == {"moved": 0, "kept": len(students), "failed": 0}
+        finally:
+            for shard in shards:
+                await shard.stop()
+    
+    @staticmethod
+    async def test_shard_router_routes_and_merges_stats():
+        """Test sharding: the router sends a student to its shard and merges stats into one answer"""
+        from router import make_router
+        from sharding import ShardMap
+        shards = [StubShard(url) for url in STUB_SHARD_URLS]
+        shard_map = ShardMap(STUB_SHARD_URLS)
+        for number in range(30):
+            student_id = f"sr_{number:03d}"
+            shards[shard_map.owner(student_id)].students[student_id] = {"student_id": student_id}
+        app = make_router("service1", shard_map)
+        for shard in shards:
+            await shard.start()
+        await app.router.startup()
+        try:
+            for shard in shards:
+                for student_id in shard.students:
+                    status, _, body = await asgi_request(app, "GET", f"/students/{student_id}")
+                    assert status == 200 and json.loads(body) == {"student_id": student_id}
+            status, _, body = await asgi_request(app, "GET", "/persistence/stats")
+            stats = json.loads(body)
+            assert stats["enabled"] is True and stats["records"] == 30 and stats["hit_ratio"] == 0.5
+            assert [shard["records"] for shard in stats["shards"]] == [len(shard.students) for shard in shards]
+        finally:
+            await app.router.shutdown()
+            for shard in shards:
+                await shard.stop()
+    
+    # WRITE-BEHIND TESTS
+    
+    @staticmethod
+    async def test_write_behind_batches_in_order():
+        """Test write-behind: writes queued while a batch is applied form the next batch, in submission order"""
+        from writebehind import APPLIED, FAILED, PENDING, QueueFullError, WriteBehind
+        store = {}
+        batches = []
+        release = asyncio.Event()
+        
+        async def apply_batch(operations):
+            batches.append([operation.key for operation in operations])
+            await release.wait()
+            for operation in operations:
+                store[operation.key] = operation.payload
+                operation.finish(201)
+        
+        writes = WriteBehind(apply_batch, max_queue=5, max_batch=3, keep_operations=4)
+        writes.start()
+        first = writes.submit("create", "k0", 0)
+        await asyncio.sleep(0.01)
+        # k0 is being applied; these wait for the next batches
+        operations = [writes.submit("create", f"k{number}", number) for number in range(1, 6)]
+        try:
+            writes.submit("create", "k6", 6)
+            assert False, "a full queue should refuse the write"
+        except QueueFullError:
+            pass
+        assert first.status == PENDING and writes.depth() == 5
+        release.set()
+        await writes.stop()
+        assert batches == [["k0"], ["k1", "k2", "k3"], ["k4", "k5"]]
+        assert store == {f"k{number}": number for number in range(6)}
+        assert all(operation.status == APPLIED and operation.status_code == 201 for operation in operations)
+        # Only the last keep_operations outcomes stay readable
+        assert writes.operation(first.operation_id) is None
+        assert writes.operation(operations[-1].operation_id).to_dict()["status"] == APPLIED
+        stats = writes.stats()
+        assert (stats["submitted"], stats["rejected"], stats["applied"], stats["batches"]) == (6, 1, 6, 3)
+        
+        # A batch that raises fails every operation it did not finish
+        async def broken(operations):
+            operations[0].finish(200)
+            raise RuntimeError("disk full")
+        
+        writes = WriteBehind(broken, max_queue=5, max_batch=5, keep_operations=5)
+        writes.start()
+        operations = [writes.submit("update", f"k{number}", number) for number in range(2)]
+        await writes.stop()
+        assert [operation.status for operation in operations] == [APPLIED, FAILED]
+        assert operations[1].status_code == 500 and "disk full" in operations[1].detail
+    
+    @staticmethod
+    async def test_write_behind_flushes_on_stop():
+        """Test write-behind: stop() applies every write still queued before returning"""
+        from writebehind import WriteBehind
+        store = {}
+        
+        async def apply_batch(operations):
+            await asyncio.sleep(0.01)
+            for operation in operations:
+                store[operation.key] = operation.payload
+                operation.finish(200)
+        
+        writes = WriteBehind(apply_batch, max_queue=1000, max_batch=10, keep_operations=1000)
+        writes.start()
+        for number in range(100):
+            writes.submit("update", f"k{number}", number)
+        await writes.stop()
+        assert len(store) == 100 and writes.depth() == 0
+        assert writes.stats()["applied"] == 100
+    
+    @staticmethod
+    async def test_service2_write_behind_read_after_apply():
+        """Test write-behind in Service 2: 202 with an operation, then the write is readable once applied"""
+        from writebehind import WriteBehind
+        service2 = load_in_process("service2")
+        service2.personal_cache.put("wb_test1", service2.StudentPersonal(
+            student_id="wb_test1", first_name="Wren", last_name="Hale", email="wren@test.com"))
+        previous = service2.academic_writes
+        service2.academic_writes = WriteBehind(service2.apply_academic_operations, 100, 10, 100)
+        service2.academic_writes.start()
+        try:
+            record = {"student_id": "wb_test1", "courses": ["Art"], "grades": {"Art": 77.0},
+                      "enrollment_status": "active"}
+            status, headers, body = await asgi_request(service2.app, "POST", "/students/wb_test1/academic",
+                                                       body=json.dumps(record).encode())
+            assert status == 202
+            operation = json.loads(body)
+            assert operation["status"] == "pending"
+            assert headers["location"] == f"/students/wb_test1/academic/operations/{operation['operation_id']}"
+            # An update with a stale If-Match is refused when it is applied, as it would have been synchronously
+            status, _, body = await asgi_request(service2.app, "PUT", "/students/wb_test1/academic",
+                                                 body=json.dumps({**record, "grades": {"Art": 1.0}}).encode(),
+                                                 headers={"If-Match": '"stale"'})
+            assert status == 202
+            stale_update = json.loads(body)
+            await service2.academic_writes.stop()
+            status, _, body = await asgi_request(service2.app, "GET", headers["location"])
+            operation = json.loads(body)
+            assert status == 200 and operation["status"] == "applied" and operation["status_code"] == 201
+            status, headers, body = await asgi_request(service2.app, "GET", "/students/wb_test1/academic")
+            assert status == 200 and json.loads(body)["grades"] == {"Art": 77.0}
+            assert headers["etag"] == operation["etag"]
+            status, _, body = await asgi_request(
+                service2.app, "GET", f"/students/wb_test1/academic/operations/{stale_update['operation_id']}")
+            assert json.loads(body)["status"] == "failed" and json.loads(body)["status_code"] == 412
+            status, _, body = await asgi_request(service2.app, "GET", "/writes/stats")
+            assert json.loads(body)["enabled"] is True and json.loads(body)["applied"] == 1
+        finally:
+            await service2.academic_writes.stop()
+            service2.academic_writes = previous
+            service2.personal_cache.clear()
+            service2.write_academic_record("wb_test1", None)
+    
+    # RESILIENCE TESTS
+    
+    @staticmethod
+    def resilience(**settings):
+        from resilience import Resilience
+        options = dict(attempts=3, backoff_base=0.001, backoff_max=0.001, hedge_delay=0,
+                       failure_threshold=3, reset_timeout=0.2)
+        options.update(settings)
+        return Resilience(**options)
+    
+    @staticmethod
+    async def test_circuit_breaker_opens_and_probes():
+        """Test resilience: the circuit opens after consecutive failures, fails fast, then one probe closes it"""
+        from resilience import CLOSED, HALF_OPEN, OPEN, CircuitOpenError, TransientError
+        resilience = TestComponents.resilience(attempts=1)
+        calls = []
+        
+        async def failing():
+            calls.append("call")
+            raise TransientError(503)
+        
+        async def working():
+            calls.append("call")
+            return "ok"
+        
+        for _ in range(3):
+            try:
+                await resilience.call("shard", failing)
+                assert False, "a failing call should raise"
+            except TransientError:
+                pass
+        breaker = resilience.breaker("shard")
+        assert breaker.state == OPEN and len(calls) == 3
+        # Open: fails fast without calling the upstream, and says when to come back
+        try:
+            await resilience.call("shard", working)
+            assert False, "an open circuit should reject the call"
+        except CircuitOpenError as exc:
+            assert 0 < exc.retry_after <= 0.2
+        assert len(calls) == 3
+        # After reset_timeout one probe is let through, and its success closes the circuit
+        await asyncio.sleep(0.25)
+        assert breaker.allow() and breaker.state == HALF_OPEN
+        assert not breaker.allow(), "only one probe may be in flight"
+        breaker.release()
+        assert await resilience.call("shard", working) == "ok"
+        assert breaker.state == CLOSED and breaker.failures == 0
+        # A failed probe opens the circuit again at once
+        for _ in range(3):
+            try:
+                await resilience.call("shard", failing)
+            except TransientError:
+                pass
+        await asyncio.sleep(0.25)
+        try:
+            await resilience.call("shard", failing)
+        except TransientError:
+            pass
+        assert breaker.state == OPEN
+    
+    @staticmethod
+    async def test_resilience_retries_within_deadline():
+        """Test resilience: transient failures are retried, definite ones are not, and the deadline caps the total"""
+        from resilience import TransientError
+        resilience = TestComponents.resilience(failure_threshold=100)
+        attempts = []
+        
+        async def flaky():
+            attempts.append("call")
+            if len(attempts) < 3:
+                raise TransientError(502)
+            return "ok"
+        
+        assert await resilience.call("shard", flaky) == "ok"
+        assert len(attempts) == 3
+        
+        attempts.clear()
+        
+        async def not_found():
+            attempts.append("call")
+            raise KeyError("definite answer")
+        
+        try:
+            await resilience.call("shard", not_found)
+            assert False, "a definite answer should be raised"
+        except KeyError:
+            pass
+        assert len(attempts) == 1
+        
+        # Slow attempts: all of them together give up at the deadline
+        slow = TestComponents.resilience(attempts=10, deadline=0.3, failure_threshold=100)
+        attempts.clear()
+        
+        async def hangs():
+            attempts.append("call")
+            await asyncio.sleep(0.2)
+            raise TransientError(503)
+        
+        started = time.perf_counter()
+        try:
+            await slow.call("shard", hangs)
+            assert False, "a call past its deadline should raise"
+        except (TransientError, asyncio.TimeoutError):
+            pass
+        assert time.perf_counter() - started < 0.45
+        assert len(attempts) == 2
+    
+    @staticmethod
+    async def test_resilience_hedging():
+        """Test resilience: a slow call gets a second copy, and the first answer wins"""
+        resilience = TestComponents.resilience(hedge_delay=0.05)
+        started_calls = []
+        
+        async def first_is_slow():
+            started_calls.append("call")
+            await asyncio.sleep(1 if len(started_calls) == 1 else 0.01)
+            return len(started_calls)
+        
+        started = time.perf_counter()
+        assert await resilience.call("shard", first_is_slow) == 2
+        assert time.perf_counter() - started < 0.5
+        assert len(started_calls) == 2
+        
+        started_calls.clear()
+        
+        async def fast():
+            started_calls.append("call")
+            return "ok"
+        
+        assert await resilience.call("shard", fast) == "ok"
+        assert len(started_calls) == 1, "a call answering before hedge_delay is not hedged"
+        assert 'upstream_hedged_requests_total{upstream="shard",winner="hedge"} 1' in resilience.hedges.render()
+    
+    @staticmethod
+    async def test_service1_down_answers_503():
+        """Test resilience: with Service 1 down, Service 2 answers 503 (not 404), then Retry-After and fails fast"""
+        service2 = load_in_process("service2")
+        service2.write_academic_record("rs_test1", service2.StudentAcademic(
+            student_id="rs_test1", courses=["Art"], grades={"Art": 80.0}, enrollment_status="active"))
+        # Nothing listens on STUB_SERVICE1_URL: every call is refused
+        await service2.open_service1_session()
+        try:
+            statuses = []
+            for _ in range(2):
+                status, headers, body = await asgi_request(service2.app, "GET", "/students/rs_test1/complete")
+                statuses.append(status)
+            assert statuses == [503, 503], statuses
+            # Five failures in a row have opened the circuit
+            started = time.perf_counter()
+            status, headers, body = await asgi_request(service2.app, "GET", "/students/rs_test1/complete")
+            assert status == 503 and int(headers["retry-after"]) >= 1
+            assert "circuit open" in json.loads(body)["detail"]
+            assert time.perf_counter() - started < 0.1, "an open circuit should fail fast"
+            status, _, _ = await asgi_request(service2.app, "POST", "/students:batchComplete",
+                                              body=json.dumps({"student_ids": ["rs_test1"]}).encode())
+            assert status == 503
+        finally:
+            await TestComponents.close_service2(service2)
+            service2.write_academic_record("rs_test1", None)
+    
+    # STORAGE TESTS
+    
+    @staticmethod
+    def compact_stores():
+        """A compact Service 1 store and a compact Service 2 store, with their codecs."""
+        from storage import AcademicCodec, PersonalCodec, make_store
+        service1 = load_in_process("service1")
+        service2 = load_in_process("service2")
+        personal = make_store("compact", PersonalCodec(service1.StudentPersonal))
+        academic = make_store("compact", AcademicCodec(service2.StudentAcademic))
+        return service1, service2, personal, academic
+    
+    @staticmethod
+    async def test_compact_store_round_trip():
+        """Test compact storage: records read back equal to what was written, in field and course order"""
+        service1, service2, personal, academic = TestComponents.compact_stores()
+        student = service1.StudentPersonal(student_id="cs1", first_name="Ada", last_name="Lovelace",
+                                           email="ada@test.com", phone=None, address="12 St James's Square")
+        record = service2.StudentAcademic(student_id="cs1", courses=["Zoology", "Algebra"],
+                                          grades={"Zoology": 88.5, "Algebra": 91.0}, enrollment_status="active")
+        personal["cs1"] = student
+        academic["cs1"] = record
+        assert personal["cs1"] == student and personal.get("cs1") == student
+        assert academic["cs1"] == record and academic.get("cs1") == record
+        assert list(academic["cs1"].courses) == ["Zoology", "Algebra"]
+        assert list(academic["cs1"].grades) == ["Zoology", "Algebra"]
+        assert "cs1" in academic and len(academic) == 1 and list(academic) == ["cs1"]
+        assert academic.get("missing") is None and "missing" not in personal
+    
+    @staticmethod
+    async def test_compact_store_update_and_delete():
+        """Test compact storage: updates replace rows, deletes remove them, shared course tuples do not leak"""
+        _, service2, _, academic = TestComponents.compact_stores()
+        codec = academic.codec
+        
+        def record(student_id, courses):
+            return service2.StudentAcademic(student_id=student_id, courses=courses,
+                                            grades={course: 70.0 for course in courses}, enrollment_status="active")
+        
+        academic["cs1"] = record("cs1", ["Art", "Logic"])
+        academic["cs2"] = record("cs2", ["Art", "Logic"])
+        assert codec.shared_tuples() == 1
+        # Many rewrites with ever-changing course lists keep only the tuples still in use
+        for number in range(100):
+            academic["cs1"] = record("cs1", ["Art", f"Course {number}"])
+        assert academic["cs1"] == record("cs1", ["Art", "Course 99"])
+        assert academic["cs2"] == record("cs2", ["Art", "Logic"])
+        assert codec.shared_tuples() == 2
+        academic["cs2"] = record("cs2", ["Art", "Course 99"])
+        assert codec.shared_tuples() == 1
+        del academic["cs1"]
+        assert "cs1" not in academic and academic.get("cs1") is None
+        assert academic["cs2"] == record("cs2", ["Art", "Course 99"])
+        assert codec.shared_tuples() == 1
+        del academic["cs2"]
+        assert len(academic) == 0 and codec.shared_tuples() == 0
+        try:
+            del academic["cs2"]
+            assert False, "deleting a missing key should raise KeyError"
+        except KeyError:
+            pass
+    
+    # AGGREGATES TESTS
+    
+    @staticmethod
+    async def test_grade_aggregates_concurrent_reads():
+        """Test grade aggregates: readers on other threads never see a course emptied halfway"""
+        import threading
+        from aggregates import GradeAggregates
+        service2 = load_in_process("service2")
+        aggregates = GradeAggregates()
+        record = service2.StudentAcademic(student_id="ga1", courses=["Art"], grades={"Art": 75.0},
+                                          enrollment_status="active")
+        errors = []
+        done = threading.Event()
+        
+        def read():
+            try:
+                while not done.is_set():
+                    for stats in aggregates.all_course_stats():
+                        assert stats["count"] == 1 and stats["mean"] == 75.0
+                    aggregates.course_stats("Art")
+                    aggregates.student_stats("ga1")
+            except Exception as exc:
+                errors.append(exc)
+        
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        for reader in readers:
+            reader.start()
+        try:
+            # Every remove takes the only grade of the course, dropping its count to 0 before it is deleted
+            for _ in range(20000):
+                aggregates.add("ga1", record)
+                aggregates.remove("ga1", record)
+        finally:
+            done.set()
+            for reader in readers:
+                reader.join()
+        assert not errors, errors
+        assert aggregates.all_course_stats() == [] and aggregates.student_stats("ga1") is None
+    
+    @staticmethod
+    async def test_grade_aggregates_rebuild_keeps_concurrent_writes():
+        """Test grade aggregates: writes made while a rebuild runs are not lost, and POST /stats/rebuild matches"""
+        from aggregates import GradeAggregates
+        service2 = load_in_process("service2")
+        
+        def record(student_id, grades):
+            return service2.StudentAcademic(student_id=student_id, courses=list(grades), grades=grades,
+                                            enrollment_status="active")
+        
+        records = {"ga1": record("ga1", {"Art": 60.0, "Logic": 80.0}), "ga2": record("ga2", {"Art": 90.0})}
+        aggregates = GradeAggregates()
+        for student_id, academic in records.items():
+            aggregates.add(student_id, academic)
+        snapshot = aggregates.snapshot(records.items())
+        # Written after the snapshot, before the rebuild finishes
+        aggregates.remove("ga1", records.pop("ga1"))
+        records["ga3"] = record("ga3", {"Logic": 70.0})
+        aggregates.add("ga3", records["ga3"])
+        result = aggregates.rebuild(snapshot)
+        assert result["students"] == 2 and result["courses"] == 2
+        expected = GradeAggregates()
+        expected.rebuild(records.items())
+        assert aggregates.all_course_stats() == expected.all_course_stats()
+        assert aggregates.student_stats("ga1") is None and aggregates.student_stats("ga3")["average"] == 70.0
+        
+        # The endpoint rebuilds on a thread and gives the same stats as the running aggregates
+        try:
+            for student_id, academic in records.items():
+                service2.write_academic_record(student_id, academic)
+            before = json.loads((await asgi_request(service2.app, "GET", "/stats/courses"))[2])
+            status, _, body = await asgi_request(service2.app, "POST", "/stats/rebuild")
+            assert status == 200 and json.loads(body)["students"] == 2
+            after = json.loads((await asgi_request(service2.app, "GET", "/stats/courses"))[2])
+            assert after == before == expected.all_course_stats()
+        finally:
+            for student_id in records:
+                service2.write_academic_record(student_id, None)
+    
+    # PAGINATION TESTS
+    
+    @staticmethod
+    async def test_paginate_exactly_full_last_page():
+        """Test pagination: an exactly full last page has no next cursor, and pages cover every key once"""
+        from pagination import SortedKeys, decode_cursor, paginate
+        ids = [f"p{number:02d}" for number in range(6)]
+        # Small chunks, so pages also start and end across chunk boundaries
+        keys = SortedKeys(ids, chunk_size=2)
+        records = {key: {"student_id": key} for key in ids}
+        
+        items, next_cursor = paginate(keys, records.get, None, 6)
+        assert [item["student_id"] for item in items] == ids and next_cursor is None
+        for limit in (1, 2, 3, 4, 5, 7):
+            seen, cursor, pages = [], None, 0
+            while True:
+                items, cursor = paginate(keys, records.get, cursor, limit)
+                seen.extend(item["student_id"] for item in items)
+                pages += 1
+                if cursor is None:
+                    break
+                assert decode_cursor(cursor) == seen[-1]
+            assert seen == ids
+            assert pages == -(-len(ids) // limit)
+
+
 async def run_tests():
     """Run all tests for both services"""
     print("Starting comprehensive integration tests for both services...")
@@ -349,8 +2307,9 @@ async def run_tests():
     print("=" * 60)
     
     test_instance = TestMicroservicesIntegration()
+    components = TestComponents()
     passed_tests = 0
-    total_tests = 10
+    total_tests = 57
     
     tests = [
         # Service 1 Tests
@@ -359,6 +2318,9 @@ async def run_tests():
         ("Service 1: Delete Student", test_instance.test_service1_delete_student),
         ("Service 1: List Students", test_instance.test_service1_list_students),
         ("Service 1: Error Handling", test_instance.test_service1_error_handling),
+        ("Service 1: Paginated List", test_instance.test_service1_paginated_list),
+        ("Service 1: Batch Get Students", test_instance.test_service1_batch_get_students),
+        ("Service 1: Bulk Import and Export", test_instance.test_service1_bulk_import_export),
         
         # Service 2 Tests
         ("Service 2: Create Academic Record", test_instance.test_service2_create_academic_record),
@@ -366,6 +2328,52 @@ async def run_tests():
         ("Service 2: Update Academic Record", test_instance.test_service2_update_academic_record),
         ("Service 2: Get Complete Info", test_instance.test_service2_get_complete_student_info),
         ("Service 2: Error Handling", test_instance.test_service2_error_handling),
+        ("Service 2: Personal Cache", test_instance.test_service2_personal_cache),
+        ("Service 2: Change Feed Invalidation", test_instance.test_service2_change_feed_invalidation),
+        ("Service 2: Batch Complete Info", test_instance.test_service2_batch_complete_info),
+        ("Service 2: Request Coalescing", test_instance.test_service2_request_coalescing),
+        ("Service 2: Filtered Academic List", test_instance.test_service2_filtered_academic_list),
+        ("Service 2: Grade Stats", test_instance.test_service2_grade_stats),
+        ("Service 2: Bulk Import and Export", test_instance.test_service2_bulk_import_export),
+        ("Service 2: Metrics", test_instance.test_service2_metrics),
+        ("Service 2: Tracing", test_instance.test_service2_tracing),
+        ("Both Services: Conditional Requests", test_instance.test_conditional_requests),
+        ("Both Services: Content Negotiation", test_instance.test_content_negotiation),
+        ("Service 2: Write-Behind", test_instance.test_service2_write_behind),
+        ("Both Services: Readiness", test_instance.test_readiness),
+        
+        # Component Tests (in-process)
+        ("Persistence: Torn Write Recovery", components.test_journal_torn_write_recovery),
+        ("Persistence: Corruption Fails Loudly", components.test_journal_corruption_fails_loudly),
+        ("Persistence: Segment Rotation", components.test_journal_segment_rotation),
+        ("Persistence: Fsync Policies", components.test_journal_fsync_policies),
+        ("Persistence: Shutdown Waits for Snapshot", components.test_journal_shutdown_waits_for_snapshot),
+        ("Fast JSON: Matches Default Path", components.test_fast_json_matches_default_path),
+        ("Fast JSON: Write During Encoding", components.test_fast_json_write_during_encoding),
+        ("Negotiation: ETags and Vary", components.test_negotiated_etags_and_vary),
+        ("Coalescing: Single Flight for Many Keys", components.test_single_flight_many),
+        ("Change Feed: Events During a Lookup", components.test_service2_feed_events_during_lookup),
+        ("Stale Data: Served If Error", components.test_service2_stale_if_error),
+        ("Stale Data: Revalidate With One Refresh", components.test_service2_stale_revalidate_single_flight),
+        ("Workers: Partitioning", components.test_worker_partitioning),
+        ("Workers: Forwarding", components.test_worker_forwarding),
+        ("Workers: Merging", components.test_worker_merging),
+        ("Workers: Stream Failure Aborts", components.test_worker_stream_failure_aborts),
+        ("Sharding: Hash Ring Placement", components.test_hash_ring_placement),
+        ("Sharding: Rebalance Moves Affected Keys", components.test_rebalance_moves_only_affected_keys),
+        ("Sharding: Router Routes and Merges Stats", components.test_shard_router_routes_and_merges_stats),
+        ("Write-Behind: Batches in Order", components.test_write_behind_batches_in_order),
+        ("Write-Behind: Flush on Stop", components.test_write_behind_flushes_on_stop),
+        ("Write-Behind: Service 2 Read After Apply", components.test_service2_write_behind_read_after_apply),
+        ("Resilience: Circuit Breaker", components.test_circuit_breaker_opens_and_probes),
+        ("Resilience: Retries and Deadline", components.test_resilience_retries_within_deadline),
+        ("Resilience: Hedging", components.test_resilience_hedging),
+        ("Resilience: Service 1 Down", components.test_service1_down_answers_503),
+        ("Storage: Compact Round Trip", components.test_compact_store_round_trip),
+        ("Storage: Compact Update and Delete", components.test_compact_store_update_and_delete),
+        ("Aggregates: Concurrent Reads", components.test_grade_aggregates_concurrent_reads),
+        ("Aggregates: Rebuild Keeps Concurrent Writes", components.test_grade_aggregates_rebuild_keeps_concurrent_writes),
+        ("Pagination: Exactly Full Last Page", components.test_paginate_exactly_full_last_page),
     ]
     
     try:
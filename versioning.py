@@ -0,0 +1,74 @@
+from typing import Dict, Iterable, Optional
+import hashlib
+import threading
+import uuid
+
+from fastapi import HTTPException
+from starlette.responses import Response
+
+class RecordVersions:
+    """Version of every stored record, for ETags and conditional requests.
+
+    Each create or update takes the next number of one counter shared by
+    all records, so a version is never reused, not even by a record that
+    is deleted and created again. Deletes advance the counter as well, so
+    it also versions the collection as a whole (for the list endpoints).
+    The epoch is new on every start and is part of every ETag, so an ETag
+    handed out before a restart never matches afterwards.
+    """
+
+    def __init__(self):
+        self.epoch = uuid.uuid4().hex[:12]
+        self.last_version = 0
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def bump(self, key: str) -> int:
+        """Give key a new version after a create or update and return it."""
+        with self._lock:
+            self.last_version += 1
+            self._versions[key] = self.last_version
+            return self.last_version
+
+    def drop(self, key: str) -> None:
+        """Forget key after a delete."""
+        with self._lock:
+            self.last_version += 1
+            self._versions.pop(key, None)
+
+    def etag(self, key: str) -> Optional[str]:
+        """The ETag of key's current version, or None if key is not stored."""
+        version = self._versions.get(key)
+        return None if version is None else f'"{self.epoch}-{version}"'
+
+    def collection_etag(self) -> str:
+        """An ETag that changes whenever any record is written."""
+        return f'"{self.epoch}-c{self.last_version}"'
+
+def _tags(header: str) -> Iterable[str]:
+    return (tag.strip() for tag in header.split(","))
+
+def none_match(header: Optional[str], etag: Optional[str]) -> bool:
+    """Whether an If-None-Match header matches etag (weak comparison), i.e. a 304 is due."""
+    if header is None or etag is None:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag in {tag[2:] if tag.startswith("W/") else tag for tag in _tags(header)}
+
+def check_if_match(header: Optional[str], etag: Optional[str]) -> None:
+    """Raise 412 unless an If-Match header (if sent) matches etag (strong comparison)."""
+    if header is None:
+        return
+    if etag is not None and (header.strip() == "*" or etag in set(_tags(header))):
+        return
+    raise HTTPException(status_code=412, detail="Record has been modified (If-Match does not match its ETag)")
+
+def not_modified(etag: str) -> Response:
+    """An empty 304 answer carrying the current ETag."""
+    return Response(status_code=304, headers={"ETag": etag})
+
+def combined_etag(etags: Iterable[str]) -> str:
+    """One ETag standing for several, e.g. for a list merged from several workers or shards."""
+    digest = hashlib.sha1("\n".join(etags).encode("utf-8")).hexdigest()[:20]
+    return f'"m-{digest}"'
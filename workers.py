@@ -0,0 +1,491 @@
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qsl, urlencode
+import asyncio
+import heapq
+import hmac
+import json
+import os
+import re
+import zlib
+
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+
+from bulk import ndjson_batches
+from pagination import encode_cursor
+from startup import lazy_module
+from versioning import combined_etag, none_match, not_modified
+
+# Only needed to forward requests, so a single worker never imports it
+aiohttp = lazy_module("aiohttp")
+
+# Set by the launcher in main.py for each worker of a multi-worker service:
+# this worker's position and the internal URLs of all workers, in order
+WORKER_INDEX = int(os.getenv("WORKER_INDEX", "0"))
+WORKER_URLS = [url for url in os.getenv("WORKER_URLS", "").split(",") if url]
+# Shared by the workers of one service (main.py makes one per launch); only
+# requests carrying it in FORWARDED_HEADER are trusted as already routed
+WORKER_SECRET = os.getenv("WORKER_SECRET", "")
+
+# Timeout for one request forwarded to another worker
+WORKER_FORWARD_TIMEOUT = float(os.getenv("WORKER_FORWARD_TIMEOUT", "10"))
+
+# Marks a request that has already been routed, so the receiving worker
+# always handles it itself; its value is the group's secret
+FORWARDED_HEADER = "x-worker-forwarded"
+
+# Headers that describe one connection, one encoding of the body or one
+# routing hop, and so are not copied between the client and worker hops
+HOP_HEADERS = {"host", "connection", "keep-alive", "content-length", "transfer-encoding", "content-encoding",
+               FORWARDED_HEADER}
+# Members answer forwarded requests in plain JSON; the process facing the
+# client negotiates MessagePack and compression (negotiation.py)
+PLAIN_BODIES = {"accept": "application/json", "accept-encoding": "identity"}
+
+class WorkerGroup:
+    """The workers serving one service, each owning a hash partition of student ids."""
+
+    def __init__(self, index: int, urls: List[str], secret: str = ""):
+        self.index = index
+        self.urls = urls
+        self.secret = secret
+
+    @classmethod
+    def from_env(cls) -> "WorkerGroup":
+        return cls(WORKER_INDEX, WORKER_URLS, WORKER_SECRET)
+
+    @property
+    def count(self) -> int:
+        return max(len(self.urls), 1)
+
+    @property
+    def home(self) -> int:
+        """The member that handles requests the router cannot place (this worker)."""
+        return self.index
+
+    def owner(self, student_id: str) -> int:
+        """Index of the worker that owns student_id (stable across processes)."""
+        return zlib.crc32(student_id.encode("utf-8")) % self.count
+
+    def data_dir(self, directory: Optional[str]) -> Optional[str]:
+        """Per-worker subdirectory for persistence, since each worker logs its own partition."""
+        if directory is None or self.count == 1:
+            return directory
+        return os.path.join(directory, f"worker-{self.index}")
+
+class Route:
+    """Routes requests matching method(s) and a path template to a handler.
+
+    Templates use the same {name} and {name:path} placeholders as FastAPI.
+    """
+
+    def __init__(self, methods: str, path: str, handler: Callable[..., Awaitable[Response]]):
+        self.methods = set(methods.split())
+        pattern = re.sub(r"\{(\w+):path\}", r"(?P<\1>.+)", path)
+        pattern = re.sub(r"\{(\w+)\}", r"(?P<\1>[^/]+)", pattern)
+        self.pattern = re.compile(f"^{pattern}$")
+        self.handler = handler
+
+class WorkerRouter:
+    """Sends each request to the worker(s) that own the students it touches.
+
+    Requests for one student go to the owning worker. Batch and import
+    requests are split by owner and the answers put back together, and list
+    and stats requests are fanned out to every worker and merged. Requests
+    that match no route, or that the router cannot interpret (invalid
+    bodies, out-of-range parameters), are handled by the receiving worker,
+    which then produces the same answer or error a single worker would.
+    """
+
+    def __init__(self, group: WorkerGroup, routes: List[Route]):
+        self.group = group
+        self.routes = routes
+        self.session: Optional[aiohttp.ClientSession] = None
+        # Only requests between workers of one service are marked; a shard
+        # router (no local member) leaves each shard free to route internally
+        self.mark = {FORWARDED_HEADER: group.secret} if group.index is not None else {}
+
+    async def open(self) -> None:
+        self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=WORKER_FORWARD_TIMEOUT))
+
+    async def close(self) -> None:
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def forwarded(self, scope) -> bool:
+        """Whether another worker of this group already routed the request (clients cannot fake it)."""
+        if not self.mark:
+            return False
+        key = FORWARDED_HEADER.encode("latin-1")
+        secret = self.mark[FORWARDED_HEADER].encode("latin-1")
+        return any(name == key and hmac.compare_digest(value, secret) for name, value in scope["headers"])
+
+    def match(self, scope) -> Optional[Tuple[Route, Dict[str, str]]]:
+        for route in self.routes:
+            if scope["method"] in route.methods:
+                found = route.pattern.match(scope["path"])
+                if found:
+                    return route, found.groupdict()
+        return None
+
+    async def forward(self, index: int, method: str, path: str, query: List[Tuple[str, str]],
+                      headers: Dict[str, str], body: bytes = b"") -> Tuple[int, Dict[str, str], bytes]:
+        """Send one request to a worker's internal port and return (status, headers, body)."""
+        url = self.group.urls[index] + path
+        if query:
+            url += "?" + urlencode(query)
+        try:
+            async with self.session.request(method, url, data=body or None,
+                                            headers={**_copy_headers(headers), **self.mark, **PLAIN_BODIES}) as response:
+                content = await response.read()
+                return response.status, _copy_headers(response.headers), content
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            detail = json.dumps({"detail": f"Worker {index} is unavailable"}).encode()
+            return 503, {"content-type": "application/json"}, detail
+
+    async def fan_out(self, method: str, path: str, query: List[Tuple[str, str]], headers: Dict[str, str],
+                      bodies: Optional[Dict[int, bytes]] = None) -> Dict[int, Tuple[int, Dict[str, str], bytes]]:
+        """Send a request to several workers at once (every worker unless bodies picks some)."""
+        targets = bodies if bodies is not None else {index: b"" for index in range(self.group.count)}
+        answers = await asyncio.gather(*(
+            self.forward(index, method, path, query, headers, body) for index, body in targets.items()
+        ))
+        return dict(zip(targets, answers))
+
+class RoutedRequest:
+    """One inbound request as seen by a route handler."""
+
+    def __init__(self, router: WorkerRouter, scope, receive, params: Dict[str, str]):
+        self.router = router
+        self.scope = scope
+        self.params = params
+        self.request = Request(scope, receive)
+        self.query = parse_qsl(scope["query_string"].decode("latin-1"), keep_blank_values=True)
+        self.headers = _copy_headers(self.request.headers)
+        self._body: Optional[bytes] = None
+
+    async def body(self) -> bytes:
+        if self._body is None:
+            self._body = await self.request.body()
+        return self._body
+
+    async def json_body(self) -> Any:
+        """The body parsed as JSON, or None if it is not valid JSON."""
+        try:
+            return json.loads(await self.body())
+        except ValueError:
+            return None
+
+    def local(self) -> None:
+        """Signal that the receiving worker should handle the request itself."""
+        raise HandleLocally()
+
+    async def to_owner(self, student_id: str) -> Response:
+        owner = self.router.group.owner(student_id)
+        if owner == self.router.group.index:
+            self.local()
+        status, headers, content = await self.router.forward(
+            owner, self.scope["method"], self.scope["path"], self.query, self.headers, await self.body()
+        )
+        return Response(content, status_code=status, headers=headers)
+
+class HandleLocally(Exception):
+    pass
+
+class StreamAborted(Exception):
+    """Raised inside a merged stream when a worker fails after the response has started.
+
+    The status line is already sent, so the connection is dropped before
+    the stream's final chunk and the client sees an incomplete response
+    instead of a silently shortened one.
+    """
+
+class WorkerRouting:
+    """ASGI middleware that applies a WorkerRouter in front of the app."""
+
+    def __init__(self, app, router: WorkerRouter):
+        self.app = app
+        self.router = router
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.router.forwarded(scope):
+            await self.app(scope, receive, send)
+            return
+        matched = self.router.match(scope)
+        if matched is None:
+            await self.app(scope, receive, send)
+            return
+        route, params = matched
+        request = RoutedRequest(self.router, scope, receive, params)
+        try:
+            response = await route.handler(request)
+        except HandleLocally:
+            await self.app(scope, _replay(request, receive), send)
+            return
+        await response(scope, receive, send)
+
+def enable_worker_routing(app, group: WorkerGroup, routes: List[Route]) -> Optional[WorkerRouter]:
+    """Install partition routing on app when the service runs as several workers."""
+    if group.count == 1:
+        return None
+    if not group.secret:
+        raise ValueError("WORKER_SECRET must be set when a service runs as several workers (main.py sets it)")
+    router = WorkerRouter(group, routes)
+    app.add_middleware(WorkerRouting, router=router)
+    app.add_event_handler("startup", router.open)
+    app.add_event_handler("shutdown", router.close)
+    return router
+
+# Route handlers
+
+def by_path(param: str = "student_id"):
+    """Send the request to the owner of the student id in the path."""
+    async def handler(request: RoutedRequest) -> Response:
+        return await request.to_owner(request.params[param])
+    return handler
+
+def by_body(field: str = "student_id"):
+    """Send the request to the owner of the student id in a JSON body field."""
+    async def handler(request: RoutedRequest) -> Response:
+        document = await request.json_body()
+        if not isinstance(document, dict) or not isinstance(document.get(field), str):
+            request.local()
+        return await request.to_owner(document[field])
+    return handler
+
+def split_batch(field: str, item_key: Callable[[Dict[str, Any]], str], max_ids: int,
+                max_headers: Sequence[str] = ()):
+    """Split a {field: [ids]} batch by owner and merge the {"students", "missing"} answers.
+
+    The merged answer lists students and missing ids in request order, as a
+    single worker would; any other list or object fields of the answers
+    (such as not_modified and etags) are concatenated or merged. Each of
+    max_headers that a worker sent is kept with the largest numeric value
+    among the answers.
+    """
+    async def handler(request: RoutedRequest) -> Response:
+        document = await request.json_body()
+        ids = document.get(field) if isinstance(document, dict) else None
+        if not isinstance(ids, list) or len(ids) > max_ids or not all(isinstance(i, str) for i in ids):
+            request.local()
+        parts: Dict[int, List[str]] = {}
+        for student_id in dict.fromkeys(ids):
+            parts.setdefault(request.router.group.owner(student_id), []).append(student_id)
+        bodies = {owner: json.dumps({**document, field: part}).encode() for owner, part in parts.items()}
+        answers = await request.router.fan_out("POST", request.scope["path"], request.query,
+                                               _json_headers(request.headers), bodies)
+        found: Dict[str, Any] = {}
+        extra: Dict[str, Any] = {}
+        kept: Dict[str, float] = {}
+        for status, headers, content in answers.values():
+            if status != 200:
+                return Response(content, status_code=status, headers=headers)
+            answer = json.loads(content)
+            for item in answer["students"]:
+                found[item_key(item)] = item
+            for name, value in answer.items():
+                if isinstance(value, list) and name not in ("students", "missing"):
+                    extra.setdefault(name, []).extend(value)
+                elif isinstance(value, dict):
+                    extra.setdefault(name, {}).update(value)
+            lowered = {name.lower(): value for name, value in headers.items()}
+            for name in max_headers:
+                if name.lower() in lowered:
+                    kept[name] = max(kept.get(name, 0), float(lowered[name.lower()]))
+        students = [found[i] for i in dict.fromkeys(ids) if i in found]
+        missing = [i for i in dict.fromkeys(ids) if i not in found]
+        return JSONResponse({"students": students, "missing": missing, **extra},
+                            headers={name: str(int(value)) for name, value in kept.items()})
+    return handler
+
+def merge_list(page_path: str, default_limit: int, max_limit: int, ndjson: bool = False,
+               chunk_records: int = 500):
+    """Fan a list request out to every worker and merge the sorted answers.
+
+    Each worker returns its own page sorted by student_id; the pages are
+    merged and cut to the requested size. Cursors are just the last id
+    returned, so the same cursor is valid on every worker. ndjson=True
+    always streams (for export endpoints); a worker failing after the
+    first page aborts the stream (StreamAborted). JSON answers carry an
+    ETag combined from the workers' ETags, and If-None-Match is checked
+    against it.
+    """
+    async def page(request: RoutedRequest, filters, cursor: Optional[str], limit: int):
+        query = filters + [("limit", str(limit))] + ([("cursor", cursor)] if cursor else [])
+        answers = await request.router.fan_out("GET", page_path, query, request.headers)
+        pages = []
+        for status, headers, content in answers.values():
+            if status != 200:
+                return Response(content, status_code=status, headers=headers), None, None
+            pages.append(json.loads(content))
+        items = list(heapq.merge(*(p["items"] for p in pages), key=lambda item: item["student_id"]))
+        more = len(items) > limit or any(p["next_cursor"] for p in pages)
+        items = items[:limit]
+        next_cursor = encode_cursor(items[-1]["student_id"]) if more and items else None
+        return items, next_cursor, _merged_etag(answers.values())
+
+    def conditional(request: RoutedRequest, document: Any, etag: Optional[str]) -> Response:
+        if etag is None:
+            return JSONResponse(document)
+        if none_match(request.headers.get("if-none-match"), etag):
+            return not_modified(etag)
+        return JSONResponse(document, headers={"ETag": etag})
+
+    async def handler(request: RoutedRequest) -> Response:
+        params = dict(request.query)
+        filters = [(k, v) for k, v in request.query if k not in ("limit", "cursor", "format")]
+        limit = params.get("limit")
+        if limit is not None:
+            if not limit.isdigit() or not 1 <= int(limit) <= max_limit:
+                request.local()
+            limit = int(limit)
+        cursor = params.get("cursor")
+        streaming = ndjson or params.get("format") == "ndjson"
+        if not streaming and params.get("format", "json") != "json":
+            request.local()
+
+        if not streaming and limit is None and cursor is None:
+            # Legacy unpaged form: one object keyed by student_id from every worker
+            answers = await request.router.fan_out("GET", page_path, filters, request.headers)
+            merged: Dict[str, Any] = {}
+            for status, headers, content in answers.values():
+                if status != 200:
+                    return Response(content, status_code=status, headers=headers)
+                merged.update(json.loads(content))
+            return conditional(request, dict(sorted(merged.items())), _merged_etag(answers.values()))
+
+        if not streaming:
+            items, next_cursor, etag = await page(request, filters, cursor, limit or default_limit)
+            if isinstance(items, Response):
+                return items
+            return conditional(request, {"items": items, "next_cursor": next_cursor}, etag)
+
+        first = await page(request, filters, cursor, min(chunk_records, limit or chunk_records))
+        if isinstance(first[0], Response):
+            return first[0]
+
+        async def stream():
+            items, next_cursor, _ = first
+            remaining = limit
+            while True:
+                if items:
+                    yield "".join(json.dumps(item) + "\n" for item in items)
+                if remaining is not None:
+                    remaining -= len(items)
+                if next_cursor is None or (remaining is not None and remaining <= 0):
+                    return
+                items, next_cursor, _ = await page(request, filters, next_cursor,
+                                                min(chunk_records, remaining or chunk_records))
+                if isinstance(items, Response):
+                    raise StreamAborted(f"A worker answered {items.status_code} while streaming {page_path}")
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+    return handler
+
+def split_ndjson(field: str, batch_size: int):
+    """Split an NDJSON import by the owner of each line's student id.
+
+    Every batch of lines is sent to the owners concurrently; their per-line
+    results are mapped back to the original line numbers and the summaries
+    added up. Lines without a readable id stay with the receiving worker,
+    which reports them as errors.
+    """
+    async def handler(request: RoutedRequest) -> Response:
+        group = request.router.group
+        results: List[Tuple[int, str]] = []
+        counts: Dict[str, int] = {}
+        async for batch in ndjson_batches(request.request.stream(), batch_size):
+            parts: Dict[int, List[Tuple[int, bytes]]] = {}
+            for line_number, raw in batch:
+                owner = group.home
+                try:
+                    document = json.loads(raw)
+                    if isinstance(document, dict) and isinstance(document.get(field), str):
+                        owner = group.owner(document[field])
+                except ValueError:
+                    pass
+                parts.setdefault(owner, []).append((line_number, raw))
+            bodies = {owner: b"\n".join(raw for _, raw in lines) for owner, lines in parts.items()}
+            answers = await request.router.fan_out("POST", request.scope["path"], request.query,
+                                                   request.headers, bodies)
+            for owner, (status, headers, content) in answers.items():
+                if status != 200:
+                    return Response(content, status_code=status, headers=headers)
+                line_numbers = [line_number for line_number, _ in parts[owner]]
+                for line in content.decode("utf-8").splitlines():
+                    result = json.loads(line)
+                    if "summary" in result:
+                        for name, count in result["summary"].items():
+                            counts[name] = counts.get(name, 0) + count
+                    else:
+                        result["line"] = line_numbers[result["line"] - 1]
+                        results.append((result["line"], json.dumps(result) + "\n"))
+        results.sort(key=lambda result: result[0])
+        lines = [line for _, line in results] + [json.dumps({"summary": counts}) + "\n"]
+        return StreamingResponse(iter(lines), media_type="application/x-ndjson")
+    return handler
+
+def fan_out(merge: Callable[[List[Any]], Any]):
+    """Send the request to every worker and merge the successful JSON answers.
+
+    If no worker succeeds, the first failure is returned as is.
+    """
+    async def handler(request: RoutedRequest) -> Response:
+        answers = await request.router.fan_out(request.scope["method"], request.scope["path"],
+                                               request.query, request.headers)
+        succeeded = [json.loads(content) for status, _, content in answers.values() if status == 200]
+        if not succeeded:
+            status, headers, content = next(iter(answers.values()))
+            return Response(content, status_code=status, headers=headers)
+        return JSONResponse(merge(succeeded))
+    return handler
+
+def merge_stats(results: List[Any], members: str) -> Dict[str, Any]:
+    """Merge per-process stats into one answer shaped like a single process's.
+
+    Integers (counters, sizes) are added up, floats (ratios, averages) are
+    averaged, objects are merged key by key the same way, and any other
+    value is taken from the first answer. The answers themselves are kept
+    as a list under members.
+    """
+    return {**_merge_values(results), members: results}
+
+def per_worker(results: List[Any]) -> Dict[str, Any]:
+    """Merge for endpoints whose answers only make sense per worker (stats)."""
+    return merge_stats(results, "workers")
+
+def _merge_values(values: List[Any]) -> Any:
+    if all(isinstance(value, dict) for value in values):
+        keys = dict.fromkeys(key for value in values for key in value)
+        return {key: _merge_values([value[key] for value in values if key in value]) for key in keys}
+    if all(isinstance(value, int) and not isinstance(value, bool) for value in values):
+        return sum(values)
+    if all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in values):
+        return sum(values) / len(values)
+    return values[0]
+
+def _merged_etag(answers) -> Optional[str]:
+    """The combined ETag of the workers' answers, or None unless every one had an ETag."""
+    etags = [{name.lower(): value for name, value in headers.items()}.get("etag") for _, headers, _ in answers]
+    return combined_etag(etags) if etags and all(etags) else None
+
+def _copy_headers(headers) -> Dict[str, str]:
+    return {name: value for name, value in headers.items() if name.lower() not in HOP_HEADERS}
+
+def _json_headers(headers: Dict[str, str]) -> Dict[str, str]:
+    return {**{k: v for k, v in headers.items() if k.lower() != "content-type"}, "content-type": "application/json"}
+
+def _replay(request: RoutedRequest, receive):
+    """receive() for the app that replays a body the router has already read."""
+    if request._body is None:
+        return receive
+    sent = False
+
+    async def replay():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": request._body or b"", "more_body": False}
+        return await receive()
+    return replay
@@ -0,0 +1,148 @@
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import asyncio
+import itertools
+import time
+import uuid
+
+PENDING, APPLIED, FAILED = "pending", "applied", "failed"
+
+class QueueFullError(Exception):
+    """Raised by WriteBehind.submit when max_queue operations are already waiting."""
+
+class Operation:
+    """One accepted write, waiting on the queue or already applied."""
+
+    __slots__ = ("operation_id", "kind", "key", "payload", "condition", "status", "status_code",
+                 "detail", "etag", "submitted_at", "applied_at")
+
+    def __init__(self, operation_id: str, kind: str, key: str, payload: Any, condition: Optional[str]):
+        self.operation_id = operation_id
+        self.kind = kind
+        self.key = key
+        self.payload = payload
+        # If-Match sent with the write, checked when it is applied
+        self.condition = condition
+        self.status = PENDING
+        self.status_code: Optional[int] = None
+        self.detail: Optional[str] = None
+        self.etag: Optional[str] = None
+        self.submitted_at = time.time()
+        self.applied_at: Optional[float] = None
+
+    def finish(self, status_code: int, detail: Optional[str] = None, etag: Optional[str] = None) -> None:
+        """Record the answer the write would have had if it had been applied synchronously."""
+        self.status = APPLIED if status_code < 400 else FAILED
+        self.status_code = status_code
+        self.detail = detail
+        self.etag = etag
+        self.applied_at = time.time()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "operation_id": self.operation_id,
+            "kind": self.kind,
+            "student_id": self.key,
+            "status": self.status,
+            "status_code": self.status_code,
+            "detail": self.detail,
+            "etag": self.etag,
+            "submitted_at": self.submitted_at,
+            "applied_at": self.applied_at,
+        }
+
+class WriteBehind:
+    """Accept writes at once and apply them later, in batches, on one background task.
+
+    submit() puts an operation on a bounded queue and returns it; when
+    max_queue operations are already waiting it raises QueueFullError so
+    the caller can push back. The background task takes every operation
+    waiting (up to max_batch) and hands them to apply_batch in submission
+    order, which must call finish() on each. Nothing waits for a batch to
+    fill: an idle queue applies a single write at once, and batches grow
+    by themselves while the previous one is being applied. The last
+    keep_operations operations stay available to operation().
+    """
+
+    def __init__(self, apply_batch: Callable[[List[Operation]], Awaitable[None]],
+                 max_queue: int, max_batch: int, keep_operations: int):
+        self.apply_batch = apply_batch
+        self.max_queue = max_queue
+        self.max_batch = max_batch
+        self.keep_operations = keep_operations
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._operations: "OrderedDict[str, Operation]" = OrderedDict()
+        # Unique per process, so operation ids of different workers never clash
+        self._prefix = uuid.uuid4().hex[:8]
+        self._numbers = itertools.count(1)
+        self.submitted = 0
+        self.rejected = 0
+        self.applied = 0
+        self.failed = 0
+        self.batches = 0
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue(self.max_queue)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Apply every write still waiting, then stop the background task."""
+        if self._task is None:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def submit(self, kind: str, key: str, payload: Any, condition: Optional[str] = None) -> Operation:
+        operation = Operation(f"{self._prefix}-{next(self._numbers)}", kind, key, payload, condition)
+        try:
+            self._queue.put_nowait(operation)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFullError(f"{self.max_queue} writes are already waiting") from None
+        self.submitted += 1
+        self._operations[operation.operation_id] = operation
+        while len(self._operations) > self.keep_operations:
+            self._operations.popitem(last=False)
+        return operation
+
+    def operation(self, operation_id: str) -> Optional[Operation]:
+        return self._operations.get(operation_id)
+
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            self.batches += 1
+            try:
+                await self.apply_batch(batch)
+            except Exception as exc:
+                for operation in batch:
+                    if operation.status == PENDING:
+                        operation.finish(500, f"Write failed: {exc}")
+            finally:
+                for operation in batch:
+                    if operation.status == APPLIED:
+                        self.applied += 1
+                    else:
+                        self.failed += 1
+                    self._queue.task_done()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self.depth(),
+            "max_queue": self.max_queue,
+            "max_batch": self.max_batch,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "applied": self.applied,
+            "failed": self.failed,
+            "batches": self.batches,
+            "average_batch_size": (self.applied + self.failed) / self.batches if self.batches else 0.0,
+        }